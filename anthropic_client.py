@@ -0,0 +1,407 @@
+"""
+Anthropic Messages API client for CADAgent PRO
+Streams completions over Server-Sent Events so callers can act on partial output, over a
+pooled keep-alive session with rate limiting, retries with backoff and a circuit breaker
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Point at a local stand-in (see fake_anthropic_server.py) to run the pipeline offline
+ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL', 'https://api.anthropic.com').rstrip('/')
+ANTHROPIC_MESSAGES_URL = f'{ANTHROPIC_BASE_URL}/v1/messages'
+ANTHROPIC_VERSION = '2023-06-01'
+
+# Connect/read timeout for a single API request; serving timeouts are sized against it
+ANTHROPIC_TIMEOUT_SECONDS = float(os.environ.get('ANTHROPIC_TIMEOUT_SECONDS', 30))
+
+# Rate limited (429), overloaded (529) and transient server errors are worth retrying
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 529}
+
+# Token counts reported in each response's usage block; the cache fields show whether the
+# cache_control prefixes were written (first sighting) or read (later requests)
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+
+class AnthropicStreamError(Exception):
+    """Raised when the API rejects a streaming request or reports an error mid-stream"""
+
+
+class AnthropicUnavailableError(AnthropicStreamError):
+    """Raised when retries are exhausted or the circuit breaker is open"""
+
+
+def anthropic_headers(api_key: str) -> Dict[str, str]:
+    """Request headers for the Messages API"""
+    return {
+        'Content-Type': 'application/json',
+        'x-api-key': api_key,
+        'anthropic-version': ANTHROPIC_VERSION
+    }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a retry-after header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def record_usage(call: Dict[str, Any], usage: Optional[Dict[str, Any]]) -> None:
+    """Copy token counts from a usage block onto a call; streamed counts are cumulative"""
+    for field in USAGE_FIELDS:
+        if isinstance((usage or {}).get(field), int):
+            call[field] = usage[field]
+
+
+class TokenBucket:
+    """Token bucket limiting how fast requests may start"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failed calls and rejects calls until the cooldown passes, then
+    lets a single probe through (half-open); the probe's outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown_seconds:
+            return 'open'
+        return 'half_open'
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now (claims the probe slot when half-open)"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+            self._probing = False
+
+
+class AnthropicClient:
+    """
+    Messages API client shared by all requests. Calls go over one keep-alive connection pool,
+    start no faster than a token bucket allows, are capped in flight, retry retryable failures
+    with jittered exponential backoff honouring retry-after, and trip a circuit breaker when
+    the API keeps failing so callers can fall back immediately.
+    """
+
+    def __init__(self, messages_url: str, max_in_flight: int, requests_per_minute: float,
+                 max_retries: int, backoff_base: float, backoff_max: float,
+                 breaker_threshold: int, breaker_cooldown: float):
+        self.messages_url = messages_url
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._bucket = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0 * 5))
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._calls: deque = deque(maxlen=256)
+        self._stats = {
+            'calls': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'rejected_open_circuit': 0,
+            'throttle_wait_seconds': 0.0,
+        }
+        self._usage = {field: 0 for field in USAGE_FIELDS}
+        self._statuses: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> 'AnthropicClient':
+        """Build the client from ANTHROPIC_* environment variables"""
+        return cls(
+            messages_url=ANTHROPIC_MESSAGES_URL,
+            max_in_flight=int(os.environ.get('ANTHROPIC_MAX_IN_FLIGHT', 8)),
+            requests_per_minute=float(os.environ.get('ANTHROPIC_REQUESTS_PER_MINUTE', 50)),
+            max_retries=int(os.environ.get('ANTHROPIC_MAX_RETRIES', 3)),
+            backoff_base=float(os.environ.get('ANTHROPIC_BACKOFF_BASE_SECONDS', 0.5)),
+            backoff_max=float(os.environ.get('ANTHROPIC_BACKOFF_MAX_SECONDS', 20)),
+            breaker_threshold=int(os.environ.get('ANTHROPIC_BREAKER_THRESHOLD', 5)),
+            breaker_cooldown=float(os.environ.get('ANTHROPIC_BREAKER_COOLDOWN_SECONDS', 30)),
+        )
+
+    def available(self) -> bool:
+        """False while the circuit breaker is open"""
+        return self.breaker.state != 'open'
+
+    def stream_messages(self, api_key: str, payload: Dict[str, Any], timeout: float = ANTHROPIC_TIMEOUT_SECONDS,
+                        usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """
+        Call the Messages API with stream=true and yield text deltas as they arrive. A stream
+        that drops or closes before message_stop raises AnthropicStreamError and counts against
+        the circuit breaker. usage, when given, receives the call's token counts once the stream ends.
+        """
+        call = self._begin(timeout)
+        try:
+            response = self._send(call, api_key, dict(payload, stream=True), timeout, stream=True)
+            with response:
+                response.encoding = 'utf-8'
+                try:
+                    # chunk_size=None hands lines over as soon as the socket delivers them
+                    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                        if not line or not line.startswith('data:'):
+                            continue
+
+                        try:
+                            event = json.loads(line[len('data:'):].strip())
+                        except json.JSONDecodeError:
+                            continue
+
+                        event_type = event.get('type')
+                        if event_type == 'message_start':
+                            record_usage(call, event.get('message', {}).get('usage'))
+                        elif event_type == 'message_delta':
+                            record_usage(call, event.get('usage'))
+                        elif event_type == 'content_block_delta':
+                            delta = event.get('delta', {})
+                            if delta.get('type') == 'text_delta' and delta.get('text'):
+                                if call['first_token_ms'] is None:
+                                    call['first_token_ms'] = round((time.monotonic() - call['started']) * 1000)
+                                yield delta['text']
+                        elif event_type == 'error':
+                            error = event.get('error', {})
+                            call['status'] = error.get('type') or 'stream_error'
+                            self.breaker.record_failure()
+                            raise AnthropicStreamError(f"Anthropic stream error: {error.get('type')} - {error.get('message')}")
+                        elif event_type == 'message_stop':
+                            return
+                except requests.RequestException as e:
+                    # The connection dropped or stalled mid-stream: the call failed like an unreachable API
+                    call['status'] = type(e).__name__
+                    self.breaker.record_failure()
+                    raise AnthropicStreamError(f"Anthropic stream interrupted: {e}") from e
+                # A stream that closes without message_stop carries a truncated reply
+                call['status'] = 'incomplete_stream'
+                self.breaker.record_failure()
+                raise AnthropicStreamError("Anthropic stream ended before message_stop")
+        finally:
+            # Still 200 once message_stop arrived or the caller stopped reading early
+            if call['status'] == 200:
+                self.breaker.record_success()
+            self._end(call, usage)
+
+    def create_message(self, api_key: str, payload: Dict[str, Any], timeout: float = ANTHROPIC_TIMEOUT_SECONDS,
+                       usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Call the Messages API without streaming and return the decoded message"""
+        call = self._begin(timeout)
+        try:
+            with self._send(call, api_key, payload, timeout, stream=False) as response:
+                message = response.json()
+            record_usage(call, message.get('usage'))
+            return message
+        finally:
+            self._end(call, usage)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counters, latency percentiles, breaker state and recent calls"""
+        with self._lock:
+            calls = list(self._calls)
+            stats = dict(self._stats, statuses=dict(self._statuses), in_flight=self._active,
+                         usage=dict(self._usage))
+        latencies = sorted(call['latency_ms'] for call in calls)
+        first_tokens = sorted(call['first_token_ms'] for call in calls if call['first_token_ms'] is not None)
+        # Split time to first token by whether the prompt prefix was read from the cache
+        cached_first_tokens = sorted(call['first_token_ms'] for call in calls
+                                     if call['first_token_ms'] is not None and call['cache_read_input_tokens'])
+        uncached_first_tokens = sorted(call['first_token_ms'] for call in calls
+                                       if call['first_token_ms'] is not None and not call['cache_read_input_tokens'])
+
+        def percentile(values, fraction):
+            return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+        return dict(
+            stats,
+            latency_ms_p50=percentile(latencies, 0.5),
+            latency_ms_p95=percentile(latencies, 0.95),
+            first_token_ms_p50=percentile(first_tokens, 0.5),
+            first_token_ms_p50_cache_hit=percentile(cached_first_tokens, 0.5),
+            first_token_ms_p50_cache_miss=percentile(uncached_first_tokens, 0.5),
+            circuit=self.breaker.state,
+            circuit_opened=self.breaker.opened,
+            max_in_flight=self.max_in_flight,
+            recent_calls=calls[-10:],
+        )
+
+    def _begin(self, timeout: float) -> Dict[str, Any]:
+        if not self.available():
+            self._reject()
+        if not self._in_flight.acquire(timeout=timeout):
+            raise AnthropicUnavailableError(f"No Anthropic request slot freed up within {timeout}s")
+        # Checked again with the slot held so a half-open probe is always followed through
+        if not self.breaker.allow():
+            self._in_flight.release()
+            self._reject()
+        with self._lock:
+            self._active += 1
+        call = {'started': time.monotonic(), 'status': None, 'attempts': 0, 'first_token_ms': None}
+        call.update((field, 0) for field in USAGE_FIELDS)
+        return call
+
+    def _reject(self) -> None:
+        with self._lock:
+            self._stats['rejected_open_circuit'] += 1
+        raise AnthropicUnavailableError("Anthropic API circuit breaker is open")
+
+    def _end(self, call: Dict[str, Any], usage: Optional[Dict[str, int]] = None) -> None:
+        self._in_flight.release()
+        if usage is not None:
+            usage.update((field, call[field]) for field in USAGE_FIELDS)
+        record = {
+            'status': str(call['status']),
+            'attempts': call['attempts'],
+            'latency_ms': round((time.monotonic() - call['started']) * 1000),
+            'first_token_ms': call['first_token_ms'],
+        }
+        record.update((field, call[field]) for field in USAGE_FIELDS)
+        with self._lock:
+            self._active -= 1
+            self._stats['calls'] += 1
+            self._stats['succeeded' if call['status'] == 200 else 'failed'] += 1
+            self._statuses[record['status']] = self._statuses.get(record['status'], 0) + 1
+            self._calls.append(record)
+            for field in USAGE_FIELDS:
+                self._usage[field] += record[field]
+        logger.info("Anthropic call", extra=record)
+
+    def _send(self, call: Dict[str, Any], api_key: str, payload: Dict[str, Any],
+              timeout: float, stream: bool) -> requests.Response:
+        """POST with throttling and retries; returns a 200 response the caller must close"""
+        for attempt in range(self.max_retries + 1):
+            waited = self._bucket.acquire()
+            call['attempts'] = attempt + 1
+            retry_after = None
+            try:
+                response = self._session.post(
+                    self.messages_url,
+                    headers=anthropic_headers(api_key),
+                    json=payload,
+                    stream=stream,
+                    timeout=timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                call['status'] = type(e).__name__
+                error = f"Anthropic API unreachable: {e}"
+            else:
+                call['status'] = response.status_code
+                if response.status_code == 200:
+                    # A stream can still fail after its headers; stream_messages records its outcome
+                    if not stream:
+                        self.breaker.record_success()
+                    with self._lock:
+                        self._stats['throttle_wait_seconds'] += waited
+                    return response
+                error = f"Anthropic API error: {response.status_code} - {response.text[:500]}"
+                retry_after = parse_retry_after(response.headers.get('retry-after'))
+                response.close()
+                if response.status_code not in RETRYABLE_STATUSES:
+                    # The API is up but rejected the request itself; retrying would not help
+                    self.breaker.record_success()
+                    raise AnthropicStreamError(error)
+                if response.status_code in (429, 529):
+                    with self._lock:
+                        self._stats['rate_limited'] += 1
+
+            if attempt == self.max_retries:
+                break
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if retry_after is not None:
+                if retry_after > self.backoff_max:
+                    break
+                delay = retry_after + random.uniform(0, self.backoff_base)
+            with self._lock:
+                self._stats['retries'] += 1
+            logger.warning("Anthropic request failed, retrying", extra={
+                'error': error, 'delay_seconds': round(delay, 2),
+                'attempt': attempt + 1, 'max_attempts': self.max_retries + 1,
+            })
+            time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise AnthropicUnavailableError(error)
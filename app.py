@@ -3,15 +3,40 @@ Flask application for CADAgent PRO
 Serves static files and provides CAD generation API
 """
 
-from flask import Flask, request, jsonify, send_file, Response
+from flask import Flask, g, request, jsonify, send_file, Response, stream_with_context
 import json
+import logging
 import os
 import sys
-import tempfile
-import traceback
+import queue
 import re
+import threading
+import time
 import requests
-from typing import Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Iterator, List, Tuple
+
+from cache import ModelCache, PipelineCache, PlanSessionStore
+from worker_pool import CadQueryWorkerPool, JobLimitExceededError, JobLimits, job_limits_var
+from jobs import JobManager, JobQueueFullError
+from anthropic_client import AnthropicClient, AnthropicStreamError, AnthropicUnavailableError
+from code_repair import REPAIR_SYSTEM_PROMPT, PreflightError, RepairError, apply_edits, module_available, preflight_check, repair_request, trim_error
+from stream_parser import StreamingPipelineParser
+from gltf_utils import iter_embedded_gltf
+from json_stream import StreamedString, iter_json_object
+from tessellation import DEFAULT_QUALITY, resolve_quality
+from prompt_index import PromptIndex
+from plan_builder import PlanError, diff_plans, plan_graph, validate_plan
+from primitive_mesher import is_primitive_plan, mesh_plan
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from logs import configure_logging, debug_payload, in_request_context, new_request_id, request_id_var
+from startup import StartupTimer
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Startup phases, timed from the process launch; see warm_up_cadquery() and /ready
+startup_timer = StartupTimer()
 
 app = Flask(__name__)
 
@@ -20,6 +45,313 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False  # Disable pretty printing for efficiency
 app.config['JSON_AS_ASCII'] = False  # Allow non-ASCII characters in JSON responses
 
+# Model used for every pipeline generation request
+ANTHROPIC_MODEL = 'claude-3-5-sonnet-20241022'
+
+# Static system prompt; sent as a cacheable prefix so repeat requests skip re-processing it
+FRAMEWORK_SYSTEM_PROMPT = """
+You are a CAD expert that generates structured JSON plans and Python/CadQuery code following the CAD Memory JSON specification.
+
+CRITICAL WORKFLOW:
+1. ALWAYS generate a JSON plan FIRST following the exact CAD Memory JSON specification
+2. THEN generate Python/CadQuery code that implements the JSON plan
+3. The JSON plan is the single source of truth for geometry
+
+NATURAL LANGUAGE INTERPRETATION:
+- Convert user descriptions into structured engineering specifications
+- Infer reasonable dimensions (default 50mm for primary features)
+- Use manufacturing-friendly proportions and constraints
+- Handle geometric terms: twist, taper, fillet, chamfer, boss, groove, etc.
+
+CAD MEMORY JSON SPECIFICATION:
+You must generate JSON following this exact structure:
+
+{
+  "objects": [
+    {
+      "name": "unique_descriptive_name",
+      "type": "Box|Cylinder|Sphere|Cone|Pyramid|Loft|Extrude",
+      "params": {"width": 50, "height": 50, "depth": 50},
+      "transform": [[1,0,0,0],[0,1,0,0],[0,0,1,0],[0,0,0,1]]
+    }
+  ],
+  "operations": [
+    {
+      "action": "fillet_edges|translate|rotate|union|subtract",
+      "target": "object_name",
+      "edges": "all|vertical|horizontal|top|bottom",
+      "radius": 5,
+      "vector": [0, 0, 25],
+      "angle": 90,
+      "axis": [0, 0, 1]
+    }
+  ]
+}
+
+OBJECT TYPES AND PARAMETERS:
+- Box: width, height, depth
+- Cylinder: radius, height  
+- Sphere: radius
+- Cone: bottomRadius, topRadius, height
+- Pyramid: width, depth, height (use extrude with taper)
+- Loft: profiles (array of cross-sections with positions)
+
+PYTHON CODE GENERATION RULES:
+- Import cadquery as cq and math if needed
+- Create objects using CadQuery operations: box(), cylinder(), sphere(), extrude()
+- For pyramids: use rect().extrude(height, taper=-89)
+- For complex shapes: use loft() between wire profiles
+- Apply transformations: translate(), rotate(), mirror()
+- Boolean operations: union(), cut(), intersect()
+- AVOID .fillet() operations - they cause compatibility issues
+- NEVER include show_object() calls
+- Always end with: assembly = cq.Assembly(); assembly.add(result, name="part"); assembly.save("output.gltf")
+
+SAFE CADQUERY PATTERNS:
+```python
+# Simple box
+result = cq.Workplane("XY").box(50, 50, 50)
+
+# Pyramid (safe - no fillet)
+result = cq.Workplane("XY").rect(50, 50).extrude(75, taper=-89)
+
+# Cylinder
+result = cq.Workplane("XY").cylinder(height=50, radius=25)
+
+# Loft between profiles
+bottom = cq.Workplane("XY").rect(50, 50)
+top = cq.Workplane("XY").workplane(offset=50).rect(25, 25)
+result = cq.Workplane("XY").loft([bottom.val(), top.val()])
+```
+
+GEOMETRIC INTERPRETATIONS:
+- "Pyramid" = Tapered extrusion (rect + extrude with taper)
+- "Twisted prism" = Loft between rotated polygons  
+- "Cylinder" = Basic cylinder operation
+- "Box/Cube" = Basic box operation
+- "Bracket" = L-shaped combination of boxes
+- "Gear" = Cylinder with teeth (use polarArray if needed)
+
+MANDATORY RESPONSE FORMAT:
+JSON_PLAN:
+{
+  "objects": [...],
+  "operations": [...]
+}
+
+PYTHON_CODE:
+```python
+import cadquery as cq
+
+# Implementation code here
+result = ...
+
+assembly = cq.Assembly()
+assembly.add(result, name="part")
+assembly.save("output.gltf")
+```
+
+CRITICAL REMINDERS:
+- JSON plan MUST come first
+- Use unique, descriptive object names
+- Include complete 4×4 transformation matrices
+- Avoid fillet operations (compatibility issues)
+- Test basic shapes before adding complexity
+- All dimensions in millimeters
+"""
+
+# Fixed tail of every CAD request; kept apart from the per-prompt text so it stays cacheable
+CAD_REQUEST_REQUIREMENTS = """
+MODELING REQUIREMENTS:
+- Create a manufacturable 3D model
+- Use appropriate dimensions and proportions
+- Include necessary engineering features
+- Ensure structural integrity
+- Apply standard manufacturing constraints
+
+TECHNICAL SPECIFICATIONS:
+- Default dimensions: 50mm primary features
+- Minimum wall thickness: 2mm
+- Standard fillet radius: 2-5mm
+- Material: General engineering plastic/metal
+- Tolerance: ±0.1mm standard
+"""
+
+# Marks a content block as the end of a prefix the API may cache between requests
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+# Shared Messages API client: pooled connections, rate limiting, retries and a circuit breaker
+anthropic_client = AnthropicClient.from_env()
+
+# Content-addressed store of GLB models, shared by every execution path and served by /api/models
+model_cache = ModelCache.from_env()
+
+# Model hashes are hex SHA-256 digests
+MODEL_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Prompt-level cache of complete pipeline results
+pipeline_cache = PipelineCache.from_env()
+
+# Past successful prompts by wording, so prompts differing only in their numbers skip the LLM
+prompt_index = PromptIndex.from_env()
+
+# Per-session shape memos that let plan edits rebuild only what changed
+plan_sessions = PlanSessionStore.from_env()
+
+# Pre-warmed worker processes that run all CadQuery scripts outside the web process. The web
+# process itself never imports cadquery/OCP, so it can bind and serve while the pool warms up.
+cadquery_pool = CadQueryWorkerPool.from_env()
+
+# Wall-clock, CPU and memory limits for the CadQuery jobs each endpoint submits. CADQUERY_JOB_*
+# set the defaults; CADQUERY_<NAME>_* override them, e.g. CADQUERY_EXECUTE_TIMEOUT_SECONDS=10
+ENDPOINT_JOB_LIMITS = {
+    'generate_demo': JobLimits.from_env('generate'),
+    'generate_batch': JobLimits.from_env('batch'),
+    'create_job': JobLimits.from_env('jobs'),
+    'execute_cad': JobLimits.from_env('execute'),
+    'rebuild_plan': JobLimits.from_env('rebuild'),
+}
+
+# Bounded background executor for asynchronous generation jobs
+job_manager = JobManager.from_env()
+
+# Bounded pool for the LLM stage of batch generation; geometry runs on cadquery_pool
+BATCH_MAX_PROMPTS = int(os.environ.get('BATCH_MAX_PROMPTS', 100))
+batch_llm_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BATCH_LLM_CONCURRENCY', 4)),
+    thread_name_prefix='batch-llm'
+)
+
+# Generated code that fails pre-flight or execution is patched by the model (a small completion
+# carrying only the script and its error) up to this many times per request before giving up
+REPAIR_MAX_ROUNDS = int(os.environ.get('PIPELINE_REPAIR_ROUNDS', 2))
+REPAIR_MAX_TOKENS = int(os.environ.get('PIPELINE_REPAIR_MAX_TOKENS', 800))
+
+# Repairs of failed executions run here rather than on the worker pool's result thread
+repair_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PIPELINE_REPAIR_CONCURRENCY', 4)),
+    thread_name_prefix='repair'
+)
+
+# Receives (stage, data) progress notifications from the pipeline
+StageCallback = Callable[[str, Optional[Dict[str, Any]]], None]
+
+# Prometheus metrics for /metrics. Stage spans tell an LLM-bound request from an OCC-bound one:
+# prompt_construction, anthropic_call, response_parse, validation, exec, gltf_embed, serialization
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('cadagent_stage_duration_seconds', 'Time spent in each pipeline stage', ['stage'])
+request_seconds = metrics.histogram('cadagent_http_request_duration_seconds', 'Time to handle each HTTP request', ['endpoint'])
+requests_in_flight = metrics.gauge('cadagent_http_requests_in_flight', 'HTTP requests being handled', ['endpoint'])
+fallbacks_total = metrics.counter('cadagent_fallbacks_total', 'Work answered by a fallback path', ['reason'])
+pipeline_retries_total = metrics.counter('cadagent_pipeline_retries_total', 'LLM requests re-asked after an unusable response')
+# Per LLM path: 'generate' asks for a whole plan and script, 'repair' for a patch to a failing script
+pipeline_attempts_total = metrics.counter('cadagent_pipeline_attempts_total', 'Pipeline LLM attempts by path and outcome', ['path', 'outcome'])
+pipeline_attempt_seconds = metrics.histogram('cadagent_pipeline_attempt_duration_seconds', 'LLM time of each pipeline attempt', ['path'])
+pipeline_tokens_total = metrics.counter('cadagent_pipeline_tokens_total', 'Tokens used by pipeline LLM attempts', ['path', 'direction'])
+pipeline_executions_total = metrics.counter('cadagent_pipeline_executions_total', 'Executions of generated code by the path that wrote it and outcome', ['path', 'outcome'])
+
+def record_attempt(path: str, outcome: str, seconds: float, usage: Dict[str, int]) -> None:
+    """Count one LLM attempt of a path with its latency and tokens (cached prompt tokens count as input)"""
+    pipeline_attempts_total.inc(path=path, outcome=outcome)
+    pipeline_attempt_seconds.observe(seconds, path=path)
+    input_tokens = sum(usage.get(field, 0) for field in ('input_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens'))
+    pipeline_tokens_total.inc(input_tokens, path=path, direction='input')
+    pipeline_tokens_total.inc(usage.get('output_tokens', 0), path=path, direction='output')
+
+def collect_stats(stats: Callable[[], Dict[str, Any]], fields: Dict[Tuple[str, ...], str]) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    """Scrape-time collector reading the given fields from one stats() snapshot"""
+    def collect():
+        values = stats()
+        return {labels: values[field] for labels, field in fields.items()}
+    return collect
+
+def collect_cache_lookups() -> Dict[Tuple[str, ...], float]:
+    """Lookups of the model, pipeline and shape caches and the prompt index by outcome"""
+    models = model_cache.stats()
+    pipeline = pipeline_cache.stats()
+    similar = prompt_index.stats()
+    shapes = cadquery_pool.shape_cache_stats()
+    return {
+        ('model', 'memory_hit'): models['memory_hits'],
+        ('model', 'disk_hit'): models['disk_hits'],
+        ('model', 'miss'): models['misses'],
+        ('pipeline', 'hit'): pipeline['hits'],
+        ('pipeline', 'miss'): pipeline['misses'],
+        ('pipeline', 'bypass'): pipeline['bypasses'],
+        ('prompt_index', 'reuse'): similar['reuses'],
+        ('prompt_index', 'hint'): similar['hints'],
+        ('prompt_index', 'miss'): similar['misses'],
+        ('shapes', 'memory_hit'): shapes['memory_hits'],
+        ('shapes', 'disk_hit'): shapes['disk_hits'],
+        ('shapes', 'miss'): shapes['misses'],
+    }
+
+metrics.collected('cadagent_cache_lookups_total', 'Cache lookups by cache and outcome', 'counter',
+                  ['cache', 'outcome'], collect_cache_lookups)
+metrics.collected('cadagent_shape_cache_bytes_saved_total', 'Serialized size of plan objects served from the shape cache instead of rebuilt',
+                  'counter', [], collect_stats(cadquery_pool.shape_cache_stats, {(): 'bytes_saved'}))
+metrics.collected('cadagent_anthropic_calls_total', 'Anthropic API calls by final status', 'counter', ['status'],
+                  lambda: {(status,): count for status, count in anthropic_client.stats()['statuses'].items()})
+metrics.collected('cadagent_anthropic_retries_total', 'Anthropic requests retried after a transient failure',
+                  'counter', [], collect_stats(anthropic_client.stats, {(): 'retries'}))
+metrics.collected('cadagent_anthropic_tokens_total', 'Tokens reported by the Anthropic API by type', 'counter', ['type'],
+                  lambda: {(field,): count for field, count in anthropic_client.stats()['usage'].items()})
+metrics.collected('cadagent_anthropic_requests_in_flight', 'Anthropic API calls in progress', 'gauge', [],
+                  collect_stats(anthropic_client.stats, {(): 'in_flight'}))
+metrics.collected('cadagent_cadquery_jobs_total', 'CadQuery worker pool jobs by outcome', 'counter', ['outcome'],
+                  collect_stats(cadquery_pool.stats, {('completed',): 'completed', ('failed',): 'failed', ('crashed',): 'crashed'}))
+metrics.collected('cadagent_cadquery_job_limits_total', 'CadQuery jobs stopped at a resource limit', 'counter',
+                  ['limits', 'limit'], cadquery_pool.limit_counts)
+metrics.collected('cadagent_cadquery_jobs_in_flight', 'CadQuery worker pool jobs running or queued', 'gauge', ['state'],
+                  collect_stats(cadquery_pool.stats, {('running',): 'busy', ('queued',): 'pending'}))
+metrics.collected('cadagent_startup_phase_seconds', 'Seconds from process launch to each startup phase', 'gauge', ['phase'],
+                  lambda: {(phase,): seconds for phase, seconds in startup_timer.phases().items()})
+metrics.collected('cadagent_background_jobs_in_flight', 'Background generation jobs not yet finished', 'gauge', [],
+                  collect_stats(job_manager.stats, {(): 'unfinished'}))
+
+@app.before_request
+def assign_request_id():
+    # Honour an id from the proxy or client so their logs and ours line up
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or new_request_id()
+    g.request_id_token = request_id_var.set(g.request_id)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def clear_request_id(error=None):
+    if 'request_id_token' in g:
+        request_id_var.reset(g.request_id_token)
+
+@app.before_request
+def assign_job_limits():
+    # Threads and jobs working for the request inherit these along with its request id
+    limits = ENDPOINT_JOB_LIMITS.get(request.endpoint)
+    if limits is not None:
+        g.job_limits_token = job_limits_var.set(limits)
+
+@app.teardown_request
+def clear_job_limits(error=None):
+    if 'job_limits_token' in g:
+        job_limits_var.reset(g.job_limits_token)
+
+@app.before_request
+def start_request_metrics():
+    if not startup_timer.reached('first_request'):
+        startup_timer.mark('first_request')
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    g.metrics_started = time.perf_counter()
+    requests_in_flight.inc(endpoint=g.metrics_endpoint)
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Runs once the response (including a streamed one) is done
+    if 'metrics_started' in g:
+        requests_in_flight.dec(endpoint=g.metrics_endpoint)
+        request_seconds.observe(time.perf_counter() - g.metrics_started, endpoint=g.metrics_endpoint)
+
 # Serve static files
 @app.route('/')
 def index():
@@ -60,62 +392,36 @@ def generate_demo():
         if not prompt:
             raise ValueError("No prompt provided")
         
-        # Generate complete CAD pipeline
-        pipeline_result = generate_cad_pipeline(prompt)
-        
-        # Enhanced debug logging for complete pipeline
-        print(f"=== PIPELINE RESULT DEBUG ===")
-        print(f"Pipeline success: {pipeline_result.get('success', 'Unknown')}")
-        print(f"Pipeline keys: {list(pipeline_result.keys())}")
-        
-        if 'error' in pipeline_result:
-            print(f"Pipeline error: {pipeline_result['error']}")
-        
-        if 'jsonPlan' in pipeline_result:
-            json_plan = pipeline_result['jsonPlan']
-            print(f"JSON Plan type: {type(json_plan)}")
-            print(f"JSON Plan: {json_plan}")
+        quality = resolve_quality(data.get('quality'))
         
-        if 'pythonCode' in pipeline_result:
-            python_code = pipeline_result['pythonCode']
-            print(f"Python code length: {len(python_code) if python_code else 'None'}")
-            if python_code:
-                print(f"Python code preview:")
-                print(python_code[:200] + "..." if len(python_code) > 200 else python_code)
+        # Generate complete CAD pipeline ("cache": false skips the cache, "refreshCache": true replaces the entry)
+        pipeline_result = generate_cad_pipeline(
+            prompt,
+            use_cache=data.get('cache', True) is not False,
+            refresh_cache=bool(data.get('refreshCache', False)),
+            quality=quality
+        )
         
-        if 'gltf' in pipeline_result:
-            gltf_content = pipeline_result['gltf']
-            print(f"GLTF content type: {type(gltf_content)}")
-            print(f"GLTF content length: {len(gltf_content) if gltf_content else 'None'}")
-            if gltf_content:
-                print(f"GLTF starts with: {gltf_content[:50]}")
-                print(f"GLTF ends with: {gltf_content[-50:]}")
-        else:
-            print("NO GLTF CONTENT IN PIPELINE RESULT!")
+        # The model is delivered from /api/models; legacy clients can still ask for it inline
+        if data.get('inlineGltf') and pipeline_result.get('modelHash'):
+            pipeline_result['gltf'] = embedded_gltf_field(pipeline_result['modelHash'])
         
-        print(f"=== END PIPELINE DEBUG ===")
+        logger.info("Pipeline finished", extra={
+            'success': pipeline_result.get('success'),
+            'model_hash': pipeline_result.get('modelHash'),
+            'model_bytes': pipeline_result.get('modelBytes'),
+            'cached': pipeline_result.get('cached', False),
+            'pipeline_error': pipeline_result.get('error'),
+        })
+        debug_payload(logger, "Pipeline result",
+                      json_plan=lambda: pipeline_result.get('jsonPlan'),
+                      python_code=lambda: pipeline_result.get('pythonCode'))
         
-        # Create custom response to avoid potential jsonify truncation
-        json_str = json.dumps(pipeline_result, separators=(',', ':'), ensure_ascii=False)  # Compact JSON
-        response = Response(
-            json_str,
-            content_type='application/json; charset=utf-8',
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Content-Length': str(len(json_str.encode('utf-8')))
-            }
-        )
-        
-        print(f"Response JSON length: {len(json_str)}")
-        print(f"Response bytes length: {len(json_str.encode('utf-8'))}")
-        if 'gltf' in pipeline_result:
-            print(f"GLTF content length in response: {len(pipeline_result['gltf'])}")
-        return response
+        return streamed_json_response(pipeline_result)
         
     except Exception as e:
         error_msg = str(e)
-        print(f"Error generating demo: {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error generating demo")
         
         response = jsonify({
             'success': False,
@@ -125,6 +431,133 @@ def generate_demo():
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
+# Batch generation: one NDJSON line per prompt as each finishes
+@app.route('/api/generate/batch', methods=['POST', 'OPTIONS'])
+def generate_batch():
+    if request.method == 'OPTIONS':
+        # Handle CORS preflight
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response
+    
+    data = request.get_json(silent=True) or {}
+    prompts = data.get('prompts')
+    try:
+        if not isinstance(prompts, list) or not prompts:
+            raise ValueError("No prompts provided")
+        if len(prompts) > BATCH_MAX_PROMPTS:
+            raise ValueError(f"At most {BATCH_MAX_PROMPTS} prompts per batch")
+        if not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+            raise ValueError("Every prompt must be a non-empty string")
+        quality = resolve_quality(data.get('quality'))
+    except ValueError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+    
+    items = run_batch(
+        prompts,
+        use_cache=data.get('cache', True) is not False,
+        refresh_cache=bool(data.get('refreshCache', False)),
+        quality=quality
+    )
+    return Response(
+        stream_with_context(json.dumps(item, separators=(',', ':'), ensure_ascii=False) + '\n' for item in items),
+        content_type='application/x-ndjson; charset=utf-8',
+        headers={
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# Asynchronous generation: returns a job id immediately
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def create_job():
+    if request.method == 'OPTIONS':
+        # Handle CORS preflight
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response
+    
+    data = request.get_json(silent=True) or {}
+    prompt = data.get('prompt')
+    if not prompt:
+        response = jsonify({'success': False, 'error': 'No prompt provided'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+    
+    use_cache = data.get('cache', True) is not False
+    refresh_cache = bool(data.get('refreshCache', False))
+    
+    try:
+        quality = resolve_quality(data.get('quality'))
+    except ValueError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+    
+    try:
+        job = job_manager.submit('generate', {'prompt': prompt, 'quality': quality}, lambda on_stage: generate_cad_pipeline(
+            prompt, use_cache=use_cache, refresh_cache=refresh_cache, on_stage=on_stage, quality=quality
+        ))
+    except JobQueueFullError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Retry-After', '5')
+        return response, 503
+    
+    response = jsonify({
+        'success': True,
+        'jobId': job.id,
+        'status': job.status,
+        'statusUrl': f'/api/jobs/{job.id}',
+        'eventsUrl': f'/api/jobs/{job.id}/events'
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Location', f'/api/jobs/{job.id}')
+    return response, 202
+
+# Job status and, once finished, its result
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        response = jsonify({'success': False, 'error': 'Job not found'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 404
+    
+    response = jsonify(job.to_dict())
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+# Server-Sent Events stream of job stage transitions
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        response = jsonify({'success': False, 'error': 'Job not found'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 404
+    
+    # EventSource reconnects resume after the last event id the client saw
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    start_index = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+    
+    return Response(
+        stream_with_context(job_manager.stream_events(job, start_index)),
+        content_type='text/event-stream; charset=utf-8',
+        headers={
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 # Legacy API endpoint for backward compatibility
 @app.route('/api/execute', methods=['POST', 'OPTIONS'])
 def execute_cad():
@@ -144,20 +577,29 @@ def execute_cad():
             raise ValueError("No Python code provided")
         
         # Execute CadQuery code
-        gltf_content = execute_cadquery(python_code)
+        model_hash = execute_cadquery(python_code, resolve_quality(data.get('quality')))
         
-        response = jsonify({
-            'success': True,
-            'gltf': gltf_content,
-            'message': 'Model generated successfully'
-        })
+        return streamed_json_response(dict(
+            model_fields(model_hash),
+            success=True,
+            gltf=embedded_gltf_field(model_hash),
+            message='Model generated successfully'
+        ))
+        
+    except JobLimitExceededError as e:
+        logger.warning("CadQuery job stopped at its limit", extra={'limit': e.limit})
+        response = jsonify({'success': False, 'error': str(e), 'limit': e.limit})
         response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
+        return response, 422
+        
+    except PreflightError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 422
         
     except Exception as e:
         error_msg = str(e)
-        print(f"Error executing CadQuery: {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error executing CadQuery")
         
         response = jsonify({
             'success': False,
@@ -167,199 +609,351 @@ def execute_cad():
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
-# Health check endpoint
-@app.route('/health')
-def health_check():
-    response = jsonify({
-        'status': 'healthy',
-        'message': 'CADAgent PRO Server (Fly.io)',
-        'python_version': sys.version,
-        'available_modules': check_modules()
-    })
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    return response
+# Incremental rebuild of an edited jsonPlan, reusing unchanged shapes from the session
+@app.route('/api/rebuild', methods=['POST', 'OPTIONS'])
+def rebuild_plan():
+    if request.method == 'OPTIONS':
+        # Handle CORS preflight
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        quality = resolve_quality(data.get('quality'))
+        validate_plan(data.get('jsonPlan'))
+    except ValueError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+    
+    try:
+        response = jsonify(rebuild_model(data.get('sessionId'), data['jsonPlan'], quality))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+        
+    except JobLimitExceededError as e:
+        logger.warning("CadQuery job stopped at its limit", extra={'limit': e.limit})
+        response = jsonify({'success': False, 'error': str(e), 'limit': e.limit})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 422
+        
+    except Exception as e:
+        logger.exception("Error rebuilding plan")
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 500
+
+# Liveness: answers as soon as the port is bound and never waits on or imports CadQuery
+@app.route('/health')
+def health_check():
+    response = jsonify({
+        'status': 'healthy',
+        'message': 'CADAgent PRO Server (Fly.io)',
+        'python_version': sys.version,
+        'available_modules': check_modules(),
+        'cadquery_ready': cadquery_pool.is_ready()
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+# Readiness: 503 until a CadQuery worker has imported cadquery, with the startup phase timings
+@app.route('/ready')
+def readiness_check():
+    ready = cadquery_pool.is_ready()
+    response = jsonify({
+        'ready': ready,
+        'error': cadquery_pool.startup_error(),
+        'startup': startup_timer.phases()
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response, 200 if ready else 503
+
+# Binary GLB delivery, served straight from the model cache directory
+@app.route('/api/models/<model_hash>.glb')
+def get_model(model_hash):
+    if not MODEL_HASH_PATTERN.match(model_hash) or not model_cache.contains(model_hash):
+        response = jsonify({'success': False, 'error': 'Model not found'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 404
+    
+    # Conditional send_file handles Range requests and If-None-Match against the strong ETag
+    response = send_file(
+        model_cache.path(model_hash),
+        mimetype='model/gltf-binary',
+        conditional=True,
+        etag=model_hash,
+        max_age=31536000
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag, Content-Length, Content-Range'
+    return response
+
+# Cache statistics endpoint
+@app.route('/api/cache/stats')
+def cache_stats():
+    response = jsonify({
+        'models': model_cache.stats(),
+        'pipeline': pipeline_cache.stats(),
+        'similarPrompts': prompt_index.stats(),
+        'shapes': cadquery_pool.shape_cache_stats(),
+        'workers': cadquery_pool.stats(),
+        'jobs': job_manager.stats(),
+        'sessions': plan_sessions.stats(),
+        'anthropic': anthropic_client.stats()
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+# Prometheus scrape endpoint
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+def execute_cadquery(python_code, quality: str = DEFAULT_QUALITY):
+    """Execute CadQuery code, serving repeated scripts from the model cache; returns the model hash"""
+    return start_cadquery(python_code, quality).result()
+
+def start_cadquery(python_code, quality: str = DEFAULT_QUALITY) -> Future:
+    """
+    Begin executing CadQuery code on the warm worker pool without blocking.
+    The server tessellates the exported model for the given quality tier.
+    The returned future resolves to the model hash, from the cache when possible.
+    """
+    result = Future()
+    cache_key = model_cache.make_key(python_code, quality)
+    if model_cache.lookup(cache_key):
+        logger.info("Model cache hit", extra={'model_hash': cache_key[:12]})
+        result.set_result(cache_key)
+        return result
+    
+    # A script certain to fail is turned away here instead of taking a worker
+    try:
+        with stage_seconds.time(stage='validation'):
+            preflight_check(python_code)
+    except PreflightError as e:
+        logger.info("Script failed pre-flight check", extra={'error': str(e)})
+        result.set_exception(e)
+        return result
+    
+    submitted = time.perf_counter()
+    
+    def complete(job: Future) -> None:
+        stage_seconds.observe(time.perf_counter() - submitted, stage='exec')
+        try:
+            job.result()
+            model_cache.adopt(cache_key)
+        except ImportError as e:
+            fallbacks_total.inc(reason='cadquery_unavailable')
+            logger.error("CadQuery import failed, falling back to simple GLTF generation", extra={'error': str(e)})
+            # CadQuery not available, store the placeholder under its own content hash so it is never
+            # returned for this script once CadQuery works again
+            fallback_glb = generate_fallback_glb(python_code)
+            fallback_key = model_cache.content_key(fallback_glb)
+            model_cache.put(fallback_key, fallback_glb)
+            result.set_result(fallback_key)
+            return
+        except Exception as e:
+            result.set_exception(e)
+            return
+        result.set_result(cache_key)
+    
+    # The worker writes the GLB straight into the cache directory, so no mesh bytes cross the pipe
+    cadquery_pool.submit(python_code, model_cache.path(cache_key), quality).add_done_callback(complete)
+    return result
+
+def execute_model(json_plan, python_code, quality: str = DEFAULT_QUALITY):
+    """Build a model from its jsonPlan or generated code and wait for the model hash"""
+    execution = start_model(json_plan, python_code, quality)
+    if execution is None:
+        raise ValueError("Neither the jsonPlan nor the generated code can be executed")
+    return execution.result()
+
+def start_model(json_plan, python_code, quality: str = DEFAULT_QUALITY) -> Optional[Future]:
+    """
+    Begin building a model without blocking. A plan the compiler supports is built directly,
+    with the generated code as the fallback if the build fails; any other plan runs the code.
+    Returns None when neither the plan nor the code is usable.
+    """
+    with stage_seconds.time(stage='validation'):
+        code_usable = bool(json_plan) and validate_pipeline_consistency(json_plan, python_code)
+        try:
+            validate_plan(json_plan)
+            plan_error = None
+        except PlanError as e:
+            plan_error = e
+    if plan_error:
+        logger.info("Plan not compilable, executing generated code", extra={'reason': str(plan_error)})
+        return start_cadquery(python_code, quality) if code_usable else None
+    
+    result = Future()
+    cache_key = model_cache.make_plan_key(json_plan, quality)
+    if model_cache.lookup(cache_key):
+        logger.info("Model cache hit", extra={'model_hash': cache_key[:12]})
+        result.set_result(cache_key)
+        return result
+    if mesh_primitive_plan(json_plan, cache_key, quality):
+        result.set_result(cache_key)
+        return result
+    
+    submitted = time.perf_counter()
+    
+    def complete(job: Future) -> None:
+        stage_seconds.observe(time.perf_counter() - submitted, stage='exec')
+        try:
+            job.result()
+            model_cache.adopt(cache_key)
+        except Exception as e:
+            # A build stopped at its limits is not retried: the code would likely take as long
+            if not code_usable or isinstance(e, JobLimitExceededError):
+                result.set_exception(e)
+                return
+            fallbacks_total.inc(reason='plan_build_failed')
+            logger.warning("Plan build failed, executing generated code", extra={'error': str(e)})
+            fallback = start_cadquery(python_code, quality)
+            fallback.add_done_callback(lambda done: result.set_exception(done.exception()) if done.exception()
+                                       else result.set_result(done.result()))
+            return
+        result.set_result(cache_key)
+    
+    # The fallback is submitted from the pool's thread, under this request's id and job limits
+    cadquery_pool.submit_plan(json_plan, model_cache.path(cache_key), quality).add_done_callback(in_request_context(complete))
+    return result
+
+def mesh_primitive_plan(json_plan: Dict[str, Any], cache_key: str, quality: str) -> bool:
+    """
+    Tessellate a plan made only of placed primitives in process with NumPy, skipping CadQuery
+    and the worker pool, and store the GLB under cache_key. Returns False for any other plan.
+    """
+    if not is_primitive_plan(json_plan):
+        return False
+    try:
+        with stage_seconds.time(stage='exec'):
+            glb, info = mesh_plan(json_plan, quality)
+    except PlanError as e:
+        logger.info("Primitive mesher declined plan, building with CadQuery", extra={'reason': str(e)})
+        return False
+    model_cache.put(cache_key, glb)
+    logger.info("Meshed primitive plan", extra={'model_hash': cache_key[:12], 'triangles': info['triangles'],
+                                                'objects': info['objects'], 'meshes': info['meshes']})
+    return True
+
+def rebuild_model(session_id: Optional[str], json_plan: Dict[str, Any],
+                  quality: str = DEFAULT_QUALITY) -> Dict[str, Any]:
+    """
+    Rebuild an edited plan without the LLM. Graph nodes whose definition and inputs are
+    unchanged come from the session's shape memo, so only the edit and its dependents are built.
+    """
+    session_id, previous_plan = plan_sessions.open(session_id)
+    diff = diff_plans(previous_plan, json_plan)
+    
+    cache_key = model_cache.make_plan_key(json_plan, quality)
+    if model_cache.lookup(cache_key):
+        nodes = {'built': 0, 'reused': 0}
+        plan_sessions.record(session_id, json_plan, {})
+    elif mesh_primitive_plan(json_plan, cache_key, quality):
+        # Remeshing every primitive is cheaper than any memo lookup
+        nodes = {'built': len(plan_graph(json_plan)[0]), 'reused': 0}
+        plan_sessions.record(session_id, json_plan, {}, nodes)
+    else:
+        graph, _ = plan_graph(json_plan)
+        memo = plan_sessions.memo(session_id, graph)
+        info = cadquery_pool.submit_plan(json_plan, model_cache.path(cache_key), quality, memo=memo).result()
+        model_cache.adopt(cache_key)
+        nodes = info['nodes']
+        plan_sessions.record(session_id, json_plan, info.get('memo', {}), nodes)
+    
+    logger.info("Rebuilt plan", extra={'session': session_id[:8], 'nodes_built': nodes['built'],
+                                       'nodes_reused': nodes['reused']})
+    return dict(
+        model_fields(cache_key),
+        success=True,
+        sessionId=session_id,
+        jsonPlan=json_plan,
+        diff=diff,
+        nodes=nodes,
+        message='Model rebuilt successfully'
+    )
+
+def model_url(model_hash: str) -> str:
+    """Download URL of a cached GLB model"""
+    return f'/api/models/{model_hash}.glb'
+
+def model_fields(model_hash: str) -> Dict[str, Any]:
+    """Response fields describing a cached model"""
+    return {
+        'modelHash': model_hash,
+        'modelUrl': model_url(model_hash),
+        'modelBytes': model_cache.size(model_hash)
+    }
+
+def embedded_gltf_field(model_hash: str) -> Optional[StreamedString]:
+    """
+    Self-contained GLTF JSON string for clients that cannot fetch the GLB, streamed from
+    the cached model as the response is written
+    """
+    glb = model_cache.open_stream(model_hash)
+    if glb is None:
+        return None
+    
+    def pieces() -> Iterator[str]:
+        with glb:
+            yield from timed_pieces(iter_embedded_gltf(glb), 'gltf_embed')
+    
+    return StreamedString(pieces())
+
+def timed_pieces(pieces: Iterator[Any], stage: str) -> Iterator[Any]:
+    """Pass pieces through, observing the time spent producing them (not consuming them) as a stage"""
+    spent = 0.0
+    while True:
+        started = time.perf_counter()
+        piece = next(pieces, None)
+        spent += time.perf_counter() - started
+        if piece is None:
+            break
+        yield piece
+    stage_seconds.observe(spent, stage=stage)
 
-def execute_cadquery(python_code):
-    """Execute CadQuery code in isolated environment with comprehensive logging"""
-    print(f"=== CADQUERY EXECUTION START ===")
-    print(f"Python code to execute:")
-    print(python_code)
-    print(f"=== CODE END ===")
+def streamed_json_response(fields: Dict[str, Any]) -> Response:
+    """
+    JSON response written with chunked transfer encoding as it is encoded, so memory per
+    request stays bounded however large the embedded GLTF is. Serialization time includes
+    producing the embedded GLTF.
+    """
+    def body() -> Iterator[bytes]:
+        sent = 0
+        try:
+            for chunk in timed_pieces(iter_json_object(fields), 'serialization'):
+                sent += len(chunk)
+                yield chunk
+        except Exception:
+            # The status line is already sent, so the client sees a truncated body
+            logger.exception("Response stream failed", extra={'response_bytes': sent})
+            raise
+        logger.info("Response serialized", extra={'response_bytes': sent})
     
-    try:
-        # Import CadQuery (this will fail if not available, triggering fallback)
-        import cadquery as cq
-        print(f"✓ CadQuery imported successfully")
-        
-        # Create temporary directory for execution
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"✓ Created temp directory: {temp_dir}")
-            
-            # Change to temp directory
-            original_cwd = os.getcwd()
-            os.chdir(temp_dir)
-            print(f"✓ Changed to temp directory")
-            
-            try:
-                # Prepare safe execution environment
-                exec_globals = {
-                    'cq': cq,
-                    '__name__': '__main__',
-                    '__file__': 'model.py',
-                    'os': os,  # Limited os access
-                    'tempfile': tempfile,
-                    'show_object': lambda x: None,  # Dummy function for CQ-editor compatibility
-                    'math': __import__('math')  # Include math module
-                }
-                print(f"✓ Prepared execution environment with globals: {list(exec_globals.keys())}")
-                
-                # Execute the Python code
-                print(f"⚡ Executing Python code...")
-                exec(python_code, exec_globals)
-                print(f"✓ Python code executed successfully")
-                
-                # List all files in directory
-                all_files = os.listdir('.')
-                print(f"Files in temp directory after execution: {all_files}")
-                
-                # Look for generated GLTF file
-                gltf_files = [f for f in all_files if f.endswith('.gltf')]
-                print(f"GLTF files found: {gltf_files}")
-                
-                if not gltf_files:
-                    print(f"❌ No GLTF files generated!")
-                    raise FileNotFoundError("No GLTF file was generated. Make sure your code includes assembly.save('output.gltf')")
-                
-                # Read the first GLTF file found
-                gltf_path = gltf_files[0]
-                print(f"✓ Reading GLTF file: {gltf_path}")
-                
-                # Get file stats
-                file_stats = os.stat(gltf_path)
-                print(f"GLTF file size: {file_stats.st_size} bytes")
-                
-                try:
-                    # Try reading as text first (JSON GLTF)
-                    with open(gltf_path, 'r', encoding='utf-8') as f:
-                        gltf_content = f.read()
-                    print(f"✓ Read as JSON GLTF, length: {len(gltf_content)}")
-                    print(f"GLTF content preview: {gltf_content[:100]}...")
-                    
-                    # Validate and clean the GLTF JSON, embedding external buffers
-                    try:
-                        # Parse to validate and re-serialize to ensure clean formatting
-                        gltf_json = json.loads(gltf_content)
-                        print(f"✓ Successfully validated GLTF JSON")
-                        
-                        # Check for external buffer references and embed them
-                        if 'buffers' in gltf_json:
-                            for buffer in gltf_json['buffers']:
-                                if 'uri' in buffer and not buffer['uri'].startswith('data:'):
-                                    # External file reference - try to embed it
-                                    buffer_file = buffer['uri']
-                                    buffer_path = os.path.join('.', buffer_file)
-                                    
-                                    if os.path.exists(buffer_path):
-                                        print(f"✓ Found external buffer file: {buffer_file}")
-                                        try:
-                                            with open(buffer_path, 'rb') as f:
-                                                buffer_data = f.read()
-                                            
-                                            # Convert to base64 data URI
-                                            import base64
-                                            buffer_base64 = base64.b64encode(buffer_data).decode('utf-8')
-                                            buffer['uri'] = f"data:application/octet-stream;base64,{buffer_base64}"
-                                            
-                                            print(f"✓ Embedded buffer file {buffer_file} as data URI ({len(buffer_data)} bytes)")
-                                        except Exception as e:
-                                            print(f"⚠ Failed to embed buffer file {buffer_file}: {e}")
-                                    else:
-                                        print(f"⚠ Buffer file {buffer_file} not found, leaving as external reference")
-                        
-                        # Re-serialize with consistent formatting
-                        clean_gltf = json.dumps(gltf_json, separators=(',', ':'), ensure_ascii=False)
-                        print(f"✓ Re-serialized GLTF, length: {len(clean_gltf)}")
-                        
-                        return clean_gltf
-                    except json.JSONDecodeError as e:
-                        print(f"⚠ Failed to parse GLTF JSON: {e}")
-                        print(f"Raw content length: {len(gltf_content)}")
-                        print(f"Raw content preview: {repr(gltf_content[:200])}")
-                        return gltf_content
-                except UnicodeDecodeError:
-                    print(f"⚠ Binary GLTF detected, converting to base64")
-                    # Binary GLTF - read as base64
-                    import base64
-                    with open(gltf_path, 'rb') as f:
-                        binary_content = f.read()
-                    # Return as data URL for Three.js GLTFLoader
-                    base64_result = f"data:model/gltf-binary;base64,{base64.b64encode(binary_content).decode('utf-8')}"
-                    print(f"✓ Converted to base64, length: {len(base64_result)}")
-                    return base64_result
-                
-            finally:
-                # Restore original directory
-                os.chdir(original_cwd)
-                print(f"✓ Restored original directory")
-                
-    except ImportError as e:
-        print(f"❌ CadQuery import failed: {e}")
-        print(f"Falling back to simple GLTF generation")
-        # CadQuery not available, use fallback
-        return generate_fallback_gltf(python_code)
-    except Exception as e:
-        print(f"❌ CadQuery execution failed with error: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        print(f"Full traceback:")
-        print(traceback.format_exc())
-        raise Exception(f"CadQuery execution failed: {str(e)}")
-    finally:
-        print(f"=== CADQUERY EXECUTION END ===")
+    return Response(
+        stream_with_context(body()),
+        content_type='application/json; charset=utf-8',
+        headers={'Access-Control-Allow-Origin': '*'}
+    )
 
-def generate_fallback_gltf(python_code):
-    """Generate a simple GLTF as fallback when CadQuery is not available"""
-    print("CadQuery not available, generating fallback GLTF")
+def generate_fallback_glb(python_code):
+    """Generate a simple box GLB as fallback when CadQuery is not available"""
+    logger.warning("CadQuery not available, generating fallback GLB")
     
-    # Parse basic shapes from the Python code
+    # Parse basic shapes from the Python code; .box() takes its sizes along X, Y and Z
     dimensions = extract_dimensions_from_code(python_code)
-    
-    # Generate basic GLTF for a cube
-    gltf = {
-        "asset": {"version": "2.0"},
-        "scene": 0,
-        "scenes": [{"nodes": [0]}],
-        "nodes": [{"mesh": 0}],
-        "meshes": [{
-            "primitives": [{
-                "attributes": {"POSITION": 0},
-                "indices": 1
-            }]
-        }],
-        "accessors": [
-            {
-                "bufferView": 0,
-                "componentType": 5126,
-                "count": 8,
-                "type": "VEC3",
-                "max": [dimensions['width']/2, dimensions['height']/2, dimensions['depth']/2],
-                "min": [-dimensions['width']/2, -dimensions['height']/2, -dimensions['depth']/2]
-            },
-            {
-                "bufferView": 1,
-                "componentType": 5123,
-                "count": 36,
-                "type": "SCALAR"
-            }
-        ],
-        "bufferViews": [
-            {"buffer": 0, "byteOffset": 0, "byteLength": 96},
-            {"buffer": 0, "byteOffset": 96, "byteLength": 72}
-        ],
-        "buffers": [{"byteLength": 168, "uri": "data:application/octet-stream;base64,AAAA..."}]
-    }
-    
-    return json.dumps(gltf)
+    fallback_plan = {'objects': [{
+        'name': 'Fallback_Object',
+        'type': 'Box',
+        'params': {'width': dimensions['width'], 'depth': dimensions['height'], 'height': dimensions['depth']},
+    }]}
+    glb, _ = mesh_plan(fallback_plan, DEFAULT_QUALITY)
+    return glb
 
 def extract_dimensions_from_code(code):
     """Extract dimensions from Python code for fallback"""
@@ -375,213 +969,401 @@ def extract_dimensions_from_code(code):
     
     return dimensions
 
-def generate_cad_pipeline(prompt: str) -> Dict[str, Any]:
-    """Generate complete CAD pipeline: JSON plan + Python code + GLTF execution"""
+def generate_cad_pipeline(prompt: str, use_cache: bool = True, refresh_cache: bool = False,
+                          on_stage: Optional[StageCallback] = None,
+                          quality: str = DEFAULT_QUALITY) -> Dict[str, Any]:
+    """
+    Generate complete CAD pipeline: JSON plan + Python code + GLTF execution.
+    on_stage, when given, is called as each stage completes (plan_ready, code_ready,
+    executing, gltf_ready) so callers can report progress before the mesh exists.
+    The model itself is returned as a modelUrl pointing at /api/models.
+    """
+    return start_cad_pipeline(prompt, use_cache, refresh_cache, on_stage, quality).result()
+
+def completed_future(value: Any) -> Future:
+    """A future that is already resolved to value"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+def start_cad_pipeline(prompt: str, use_cache: bool = True, refresh_cache: bool = False,
+                       on_stage: Optional[StageCallback] = None,
+                       quality: str = DEFAULT_QUALITY) -> Future:
+    """
+    Run the network-bound half of the pipeline (cache lookup and LLM call) in the calling
+    thread and return a future for the pipeline result, which resolves once the geometry
+    has been built on the worker pool. The caller is free as soon as execution is submitted.
+    """
+    notify = on_stage or (lambda stage, data=None: None)
     
     # Get Anthropic API key from environment
     anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
     if not anthropic_api_key:
-        return generate_fallback_pipeline(prompt)
+        fallbacks_total.inc(reason='no_api_key')
+        return completed_future(generate_fallback_pipeline(prompt, on_stage=on_stage, quality=quality))
     
-    framework_system_prompt = """
-You are a CAD expert that generates structured JSON plans and Python/CadQuery code following the CAD Memory JSON specification.
-
-CRITICAL WORKFLOW:
-1. ALWAYS generate a JSON plan FIRST following the exact CAD Memory JSON specification
-2. THEN generate Python/CadQuery code that implements the JSON plan
-3. The JSON plan is the single source of truth for geometry
-
-NATURAL LANGUAGE INTERPRETATION:
-- Convert user descriptions into structured engineering specifications
-- Infer reasonable dimensions (default 50mm for primary features)
-- Use manufacturing-friendly proportions and constraints
-- Handle geometric terms: twist, taper, fillet, chamfer, boss, groove, etc.
-
-CAD MEMORY JSON SPECIFICATION:
-You must generate JSON following this exact structure:
-
-{
-  "objects": [
-    {
-      "name": "unique_descriptive_name",
-      "type": "Box|Cylinder|Sphere|Cone|Pyramid|Loft|Extrude",
-      "params": {"width": 50, "height": 50, "depth": 50},
-      "transform": [[1,0,0,0],[0,1,0,0],[0,0,1,0],[0,0,0,1]]
-    }
-  ],
-  "operations": [
-    {
-      "action": "fillet_edges|translate|rotate|union|subtract",
-      "target": "object_name",
-      "edges": "all|vertical|horizontal|top|bottom",
-      "radius": 5,
-      "vector": [0, 0, 25],
-      "angle": 90,
-      "axis": [0, 0, 1]
-    }
-  ]
-}
-
-OBJECT TYPES AND PARAMETERS:
-- Box: width, height, depth
-- Cylinder: radius, height  
-- Sphere: radius
-- Cone: bottomRadius, topRadius, height
-- Pyramid: width, depth, height (use extrude with taper)
-- Loft: profiles (array of cross-sections with positions)
-
-PYTHON CODE GENERATION RULES:
-- Import cadquery as cq and math if needed
-- Create objects using CadQuery operations: box(), cylinder(), sphere(), extrude()
-- For pyramids: use rect().extrude(height, taper=-89)
-- For complex shapes: use loft() between wire profiles
-- Apply transformations: translate(), rotate(), mirror()
-- Boolean operations: union(), cut(), intersect()
-- AVOID .fillet() operations - they cause compatibility issues
-- NEVER include show_object() calls
-- Always end with: assembly = cq.Assembly(); assembly.add(result, name="part"); assembly.save("output.gltf")
-
-SAFE CADQUERY PATTERNS:
-```python
-# Simple box
-result = cq.Workplane("XY").box(50, 50, 50)
-
-# Pyramid (safe - no fillet)
-result = cq.Workplane("XY").rect(50, 50).extrude(75, taper=-89)
-
-# Cylinder
-result = cq.Workplane("XY").cylinder(height=50, radius=25)
-
-# Loft between profiles
-bottom = cq.Workplane("XY").rect(50, 50)
-top = cq.Workplane("XY").workplane(offset=50).rect(25, 25)
-result = cq.Workplane("XY").loft([bottom.val(), top.val()])
-```
-
-GEOMETRIC INTERPRETATIONS:
-- "Pyramid" = Tapered extrusion (rect + extrude with taper)
-- "Twisted prism" = Loft between rotated polygons  
-- "Cylinder" = Basic cylinder operation
-- "Box/Cube" = Basic box operation
-- "Bracket" = L-shaped combination of boxes
-- "Gear" = Cylinder with teeth (use polarArray if needed)
-
-MANDATORY RESPONSE FORMAT:
-JSON_PLAN:
-{
-  "objects": [...],
-  "operations": [...]
-}
-
-PYTHON_CODE:
-```python
-import cadquery as cq
-
-# Implementation code here
-result = ...
-
-assembly = cq.Assembly()
-assembly.add(result, name="part")
-assembly.save("output.gltf")
-```
-
-CRITICAL REMINDERS:
-- JSON plan MUST come first
-- Use unique, descriptive object names
-- Include complete 4×4 transformation matrices
-- Avoid fillet operations (compatibility issues)
-- Test basic shapes before adding complexity
-- All dimensions in millimeters
-"""
+    # Serve repeated prompts without another LLM round trip
+    cache_key = pipeline_cache.make_key(prompt, ANTHROPIC_MODEL, FRAMEWORK_SYSTEM_PROMPT + CAD_REQUEST_REQUIREMENTS)
+    if not use_cache:
+        pipeline_cache.record_bypass()
+    elif refresh_cache:
+        pipeline_cache.invalidate(cache_key)
+    else:
+        cached_result = load_cached_pipeline(prompt, cache_key, notify, quality)
+        if cached_result:
+            return completed_future(cached_result)
+    
+    # A prompt worded like an earlier one reuses its plan with the new dimensions; a merely
+    # similar one is passed to the LLM as an example
+    similar = prompt_index.lookup(prompt) if use_cache and not refresh_cache else None
+    if similar and similar['reuse']:
+        similar_result = load_similar_pipeline(prompt, similar, cache_key, notify, quality)
+        if similar_result:
+            return completed_future(similar_result)
+        similar = None
+    
+    # While the API is degraded, answer from the fallback generator instead of waiting on it
+    if not anthropic_client.available():
+        logger.warning("Anthropic circuit breaker is open, using fallback pipeline")
+        fallbacks_total.inc(reason='circuit_open')
+        return completed_future(generate_fallback_pipeline(prompt, on_stage=on_stage, quality=quality))
     
     try:
-        # Call Anthropic API with retry logic
+        # Transport retries and backoff happen in the client; another attempt only re-asks
+        # after a response that could not be used
         max_attempts = 2
         for attempt in range(max_attempts):
-            print(f"Attempt {attempt + 1} of {max_attempts}")
+            logger.info("Pipeline attempt", extra={'attempt': attempt + 1, 'max_attempts': max_attempts})
+            if attempt:
+                pipeline_retries_total.inc()
             
-            # Enhanced user message construction
-            user_message = construct_cad_request(prompt)
+            with stage_seconds.time(stage='prompt_construction'):
+                content = build_cad_request_content(prompt, similar)
             
-            # Generate JSON plan and Python code
-            ai_response = call_anthropic_api(anthropic_api_key, {
-                'model': 'claude-3-5-sonnet-20241022',
+            # Generate JSON plan and Python code; execution starts as soon as the code block closes
+            notify('generating', {'attempt': attempt + 1})
+            usage = {}
+            started = time.perf_counter()
+            parsed, execution = stream_pipeline_response(anthropic_api_key, {
+                'model': ANTHROPIC_MODEL,
                 'max_tokens': 3000,
                 'temperature': 0.3,
-                'system': framework_system_prompt,
+                'system': [{
+                    'type': 'text',
+                    'text': FRAMEWORK_SYSTEM_PROMPT,
+                    'cache_control': CACHE_CONTROL
+                }],
                 'messages': [{
                     'role': 'user',
-                    'content': user_message
+                    'content': content
                 }]
-            })
-            
-            if not ai_response:
-                continue
+            }, notify, quality, usage)
+            record_attempt('generate', 'usable' if execution is not None else 'unusable', time.perf_counter() - started, usage)
             
-            # Parse the response
-            parsed = parse_pipeline_response(ai_response)
+            # No execution means the response was missing or failed validation. A plan with a script
+            # that was turned away is patched; only a response without them is asked for again
+            repairs, path = REPAIR_MAX_ROUNDS, 'generate'
+            if (execution is None and repairs and parsed.get('pythonCode')
+                    and isinstance(parsed.get('jsonPlan'), dict) and parsed['jsonPlan'].get('objects')):
+                repairs -= 1
+                problem = pipeline_problem(parsed['jsonPlan'], parsed['pythonCode']) or 'Script was rejected'
+                patched = request_repair(anthropic_api_key, parsed['jsonPlan'], parsed['pythonCode'], problem)
+                if patched is not None:
+                    parsed, path = dict(parsed, pythonCode=patched), 'repair'
+                    notify('code_ready', {'pythonCode': patched, 'repaired': True})
+                    execution = start_cadquery(patched, quality)
+                    notify('executing')
             
-            if not parsed.get('jsonPlan') or not parsed.get('pythonCode'):
-                continue
-            
-            # Validate JSON plan against Python code
-            if validate_pipeline_consistency(parsed['jsonPlan'], parsed['pythonCode']):
-                # Execute the Python code to generate GLTF
-                try:
-                    gltf_content = execute_cadquery(parsed['pythonCode'])
-                    
-                    return {
-                        'success': True,
-                        'prompt': prompt,
-                        'jsonPlan': parsed['jsonPlan'],
-                        'pythonCode': parsed['pythonCode'],
-                        'gltf': gltf_content,
-                        'message': 'Model generated successfully'
-                    }
-                except Exception as e:
-                    print(f"CadQuery execution failed: {e}")
-                    # Return without GLTF if execution fails
-                    return {
-                        'success': True,
-                        'prompt': prompt,
-                        'jsonPlan': parsed['jsonPlan'],
-                        'pythonCode': parsed['pythonCode'],
-                        'error': f'Code generation succeeded but execution failed: {str(e)}',
-                        'fallback_available': True
-                    }
+            if execution is not None:
+                return finish_cad_pipeline(prompt, parsed, execution, notify, cache_key if use_cache else None,
+                                           api_key=anthropic_api_key, quality=quality, repairs=repairs, path=path)
         
         # If all attempts failed
-        return {'success': False, 'error': 'Our backend is busy right now, try again in a couple of minutes'}
+        return completed_future({'success': False, 'error': 'Our backend is busy right now, try again in a couple of minutes'})
         
-    except Exception as e:
-        print(f"Error in generate_cad_pipeline: {e}")
-        return generate_fallback_pipeline(prompt)
+    except Exception:
+        logger.exception("Error in generate_cad_pipeline, using fallback pipeline")
+        fallbacks_total.inc(reason='pipeline_error')
+        return completed_future(generate_fallback_pipeline(prompt, on_stage=on_stage, quality=quality))
 
-def call_anthropic_api(api_key: str, payload: Dict[str, Any]) -> Optional[str]:
-    """Call Anthropic API with the given payload"""
-    try:
-        response = requests.post(
-            'https://api.anthropic.com/v1/messages',
-            headers={
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            },
-            json=payload,
-            timeout=30
-        )
+def run_batch(prompts: List[str], use_cache: bool = True, refresh_cache: bool = False,
+              quality: str = DEFAULT_QUALITY) -> Iterator[Dict[str, Any]]:
+    """
+    Two-stage batch pipeline. LLM calls run on the bounded batch_llm_pool and hand their
+    code to the CadQuery worker pool, so one prompt's network wait overlaps another's geometry.
+    Yields each item's result (or error) as it finishes, then a summary.
+    """
+    started = time.monotonic()
+    finished = queue.Queue()
+    
+    def llm_stage(index: int, prompt: str) -> None:
+        item_started = time.monotonic()
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('content') and data['content'][0].get('text'):
-                return data['content'][0]['text']
+        def report(done: Future) -> None:
+            try:
+                result = done.result()
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            finished.put(dict(result, index=index, prompt=prompt,
+                              elapsedMs=round((time.monotonic() - item_started) * 1000)))
         
-        print(f"Anthropic API error: {response.status_code} - {response.text}")
+        try:
+            pipeline = start_cad_pipeline(prompt, use_cache=use_cache, refresh_cache=refresh_cache, quality=quality)
+        except Exception as e:
+            pipeline = Future()
+            pipeline.set_exception(e)
+        pipeline.add_done_callback(report)
+    
+    submitted = [batch_llm_pool.submit(in_request_context(llm_stage), index, prompt)
+                 for index, prompt in enumerate(prompts)]
+    succeeded = 0
+    try:
+        for _ in prompts:
+            item = finished.get()
+            succeeded += 1 if item.get('success') and not item.get('error') else 0
+            yield item
+    finally:
+        # A client that disconnects early should not keep queued LLM calls running
+        for future in submitted:
+            future.cancel()
+    
+    yield {
+        'done': True,
+        'total': len(prompts),
+        'succeeded': succeeded,
+        'failed': len(prompts) - succeeded,
+        'elapsedMs': round((time.monotonic() - started) * 1000)
+    }
+
+def finish_cad_pipeline(prompt: str, parsed: Dict[str, Any], execution: Future, notify: StageCallback,
+                        cache_key: Optional[str], api_key: Optional[str] = None,
+                        quality: str = DEFAULT_QUALITY, repairs: int = 0, path: str = 'generate') -> Future:
+    """
+    Turn a running execution into the pipeline result once its model is ready. When the
+    execution fails and repairs remain, the script is patched and run again instead.
+    path names the LLM path that wrote the script, for the execution metrics.
+    """
+    result = Future()
+    
+    def complete(done: Future) -> None:
+        try:
+            model = model_fields(done.result())
+            pipeline_executions_total.inc(path=path, outcome='success')
+            notify('gltf_ready', model)
+            
+            if cache_key:
+                pipeline_cache.put(cache_key, {
+                    'jsonPlan': parsed['jsonPlan'],
+                    'pythonCode': parsed['pythonCode']
+                })
+                prompt_index.add(prompt, parsed['jsonPlan'], parsed['pythonCode'])
+            
+            result.set_result(dict(
+                model,
+                success=True,
+                prompt=prompt,
+                jsonPlan=parsed['jsonPlan'],
+                pythonCode=parsed['pythonCode'],
+                message='Model generated successfully'
+            ))
+        except Exception as e:
+            pipeline_executions_total.inc(path=path, outcome='failed')
+            logger.warning("CadQuery execution failed", extra={'error': str(e)})
+            # A job stopped at its limits would most likely be stopped again after a patch
+            if repairs and api_key and parsed['pythonCode'] and not isinstance(e, JobLimitExceededError):
+                repair_pool.submit(repair, str(e))
+                return
+            fail(str(e))
+    
+    def fail(error: str) -> None:
+        # Return without GLTF if execution fails
+        result.set_result({
+            'success': True,
+            'prompt': prompt,
+            'jsonPlan': parsed['jsonPlan'],
+            'pythonCode': parsed['pythonCode'],
+            'error': f'Code generation succeeded but execution failed: {error}',
+            'fallback_available': True
+        })
+    
+    @in_request_context
+    def repair(error: str) -> None:
+        try:
+            # A script the plan build fell back from is described by its own problem, if it has one
+            patched = request_repair(api_key, parsed['jsonPlan'], parsed['pythonCode'],
+                                     pipeline_problem(parsed['jsonPlan'], parsed['pythonCode']) or error)
+            if patched is None:
+                fail(error)
+                return
+            notify('code_ready', {'pythonCode': patched, 'repaired': True})
+            retried = finish_cad_pipeline(prompt, dict(parsed, pythonCode=patched), start_cadquery(patched, quality),
+                                          notify, cache_key, api_key, quality, repairs - 1, 'repair')
+            retried.add_done_callback(lambda done: result.set_result(done.result()))
+        except Exception:
+            logger.exception("Repair round failed")
+            fail(error)
+    
+    execution.add_done_callback(complete)
+    return result
+
+def request_repair(api_key: str, json_plan: Dict[str, Any], python_code: str, error: str) -> Optional[str]:
+    """
+    One repair round: send only the failing script and its trimmed error, with a small
+    max_tokens, and apply the SEARCH/REPLACE patch that comes back. Returns the patched
+    script if it passes validation, otherwise None.
+    """
+    usage = {}
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        data = anthropic_client.create_message(api_key, {
+            'model': ANTHROPIC_MODEL,
+            'max_tokens': REPAIR_MAX_TOKENS,
+            'temperature': 0,
+            'system': REPAIR_SYSTEM_PROMPT,
+            'messages': [{'role': 'user', 'content': repair_request(python_code, error)}]
+        }, usage=usage)
+        reply = ''.join(block.get('text', '') for block in data.get('content') or [] if block.get('type') == 'text')
+        patched = apply_edits(python_code, reply)
+        problem = pipeline_problem(json_plan, patched)
+        if problem:
+            raise RepairError(f"Patched script still fails: {problem}")
+        outcome = 'usable'
+        logger.info("Repaired script", extra={'error': trim_error(error), 'output_tokens': usage.get('output_tokens')})
+        return patched
+    except RepairError as e:
+        outcome = 'unusable'
+        logger.warning("Repair reply unusable", extra={'error': str(e)})
         return None
-        
+    except (AnthropicStreamError, requests.RequestException, ValueError) as e:
+        logger.warning("Repair request failed", extra={'error': str(e)})
+        return None
+    finally:
+        record_attempt('repair', outcome, time.perf_counter() - started, usage)
+
+def load_cached_pipeline(prompt: str, cache_key: str, notify: StageCallback,
+                         quality: str = DEFAULT_QUALITY) -> Optional[Dict[str, Any]]:
+    """Rebuild a pipeline result from the prompt cache, or None on a miss"""
+    cached = pipeline_cache.get(cache_key)
+    if not cached:
+        return None
+    
+    try:
+        # The model itself comes from the content-addressed model cache
+        notify('plan_ready', {'jsonPlan': cached['jsonPlan'], 'cached': True})
+        notify('code_ready', {'pythonCode': cached['pythonCode'], 'cached': True})
+        notify('executing', {'cached': True})
+        model = model_fields(execute_model(cached['jsonPlan'], cached['pythonCode'], quality))
+        notify('gltf_ready', dict(model, cached=True))
+    except Exception as e:
+        logger.warning("Cached pipeline could not be executed, regenerating", extra={'error': str(e)})
+        pipeline_cache.invalidate(cache_key)
+        return None
+    
+    logger.info("Pipeline cache hit", extra={'cache_key': cache_key[:12]})
+    return dict(
+        model,
+        success=True,
+        prompt=prompt,
+        jsonPlan=cached['jsonPlan'],
+        pythonCode=cached['pythonCode'],
+        cached=True,
+        message='Model generated successfully'
+    )
+
+def load_similar_pipeline(prompt: str, similar: Dict[str, Any], cache_key: str, notify: StageCallback,
+                          quality: str = DEFAULT_QUALITY) -> Optional[Dict[str, Any]]:
+    """Build the plan of a near-duplicate earlier prompt, already carrying this prompt's dimensions"""
+    try:
+        notify('plan_ready', {'jsonPlan': similar['jsonPlan'], 'similarTo': similar['prompt']})
+        notify('code_ready', {'pythonCode': similar['pythonCode'], 'similarTo': similar['prompt']})
+        notify('executing', {'similarTo': similar['prompt']})
+        model = model_fields(execute_model(similar['jsonPlan'], similar['pythonCode'], quality))
+        notify('gltf_ready', dict(model, similarTo=similar['prompt']))
     except Exception as e:
-        print(f"Error calling Anthropic API: {e}")
+        logger.warning("Similar prompt's plan could not be reused, generating", extra={'error': str(e)})
         return None
+    
+    logger.info("Reused similar prompt", extra={'similarity': similar['similarity'], 'similar_to': similar['prompt'][:80]})
+    pipeline_cache.put(cache_key, {'jsonPlan': similar['jsonPlan'], 'pythonCode': similar['pythonCode']})
+    prompt_index.add(prompt, similar['jsonPlan'], similar['pythonCode'])
+    return dict(
+        model,
+        success=True,
+        prompt=prompt,
+        jsonPlan=similar['jsonPlan'],
+        pythonCode=similar['pythonCode'],
+        similarTo=similar['prompt'],
+        message='Model generated from a similar earlier request'
+    )
+
+def stream_pipeline_response(api_key: str, payload: Dict[str, Any], notify: StageCallback,
+                             quality: str = DEFAULT_QUALITY,
+                             usage: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, Any], Optional[Future]]:
+    """
+    Stream a pipeline completion, parsing it incrementally.
+    The plan is reported the moment its braces balance and CadQuery execution starts the
+    moment the code fence closes, overlapping geometry work with the rest of the completion.
+    Returns the parsed sections and the execution future (None if the response was unusable).
+    usage, when given, receives the completion's token counts.
+    """
+    parser = StreamingPipelineParser()
+    execution = None
+    
+    # Time spent waiting on the stream and time spent parsing it are reported as separate stages
+    llm_seconds = parse_seconds = 0.0
+    waiting_since = time.perf_counter()
+    try:
+        for text in anthropic_client.stream_messages(api_key, payload, usage=usage):
+            received = time.perf_counter()
+            llm_seconds += received - waiting_since
+            waiting_since = None
+            sections = parser.feed(text)
+            parse_seconds += time.perf_counter() - received
+            for section, value in sections:
+                if section == 'plan':
+                    notify('plan_ready', {'jsonPlan': value})
+                elif section == 'code':
+                    notify('code_ready', {'pythonCode': value})
+                    if parser.json_plan:
+                        execution = start_model(parser.json_plan, value, quality)
+                        if execution is not None:
+                            notify('executing')
+            waiting_since = time.perf_counter()
+    except AnthropicUnavailableError as e:
+        logger.warning("Anthropic API unavailable", extra={'error': str(e)})
+        # Give up on the LLM rather than retrying a degraded API; the caller falls back
+        if execution is None:
+            raise
+    except (AnthropicStreamError, requests.RequestException) as e:
+        logger.warning("Error streaming Anthropic API", extra={'error': str(e)})
+        if execution is None:
+            return {'jsonPlan': None, 'pythonCode': None}, None
+    finally:
+        if waiting_since is not None:
+            llm_seconds += time.perf_counter() - waiting_since
+        stage_seconds.observe(llm_seconds, stage='anthropic_call')
+    
+    if execution is not None:
+        stage_seconds.observe(parse_seconds, stage='response_parse')
+        return {'jsonPlan': parser.json_plan, 'pythonCode': parser.python_code}, execution
+    
+    # The sections were not recognised while streaming, fall back to parsing the full text
+    parse_started = time.perf_counter()
+    parsed = parse_pipeline_response(parser.text)
+    stage_seconds.observe(parse_seconds + time.perf_counter() - parse_started, stage='response_parse')
+    if not parsed.get('jsonPlan'):
+        return parsed, None
+    execution = start_model(parsed['jsonPlan'], parsed['pythonCode'], quality)
+    if execution is None:
+        return parsed, None
+    
+    if parser.json_plan is None:
+        notify('plan_ready', {'jsonPlan': parsed['jsonPlan']})
+    if parser.python_code is None and parsed['pythonCode']:
+        notify('code_ready', {'pythonCode': parsed['pythonCode']})
+    notify('executing')
+    return parsed, execution
 
 def parse_pipeline_response(response: str) -> Dict[str, Any]:
     """Parse AI response to extract JSON plan and Python code"""
@@ -594,7 +1376,7 @@ def parse_pipeline_response(response: str) -> Dict[str, Any]:
             try:
                 result['jsonPlan'] = json.loads(json_match.group(1))
             except json.JSONDecodeError as e:
-                print(f'Failed to parse JSON plan: {e}')
+                logger.warning("Failed to parse JSON plan", extra={'error': str(e)})
         
         # Extract Python code
         python_match = re.search(r'PYTHON_CODE:\s*\n?\s*```python\s*\n([\s\S]*?)```', response, re.IGNORECASE)
@@ -620,44 +1402,52 @@ def parse_pipeline_response(response: str) -> Dict[str, Any]:
             if any_python_match:
                 result['pythonCode'] = any_python_match.group(1).strip()
         
-    except Exception as e:
-        print(f'Error parsing pipeline response: {e}')
+    except Exception:
+        logger.exception("Error parsing pipeline response")
     
     return result
 
+def pipeline_problem(json_plan: Dict[str, Any], python_code: str) -> Optional[str]:
+    """Why a plan and its Python code cannot be executed, or None when they can"""
+    if not json_plan.get('objects'):
+        return "Plan has no objects"
+    
+    if not python_code or len(python_code.strip()) < 10:
+        return "Script is empty"
+    
+    # Check if Python code contains CadQuery imports
+    if 'import cadquery' not in python_code and 'cadquery' not in python_code:
+        return "Script does not import cadquery"
+    
+    # Syntax, imports, undefined names and a model being handed over (save, export or result)
+    try:
+        preflight_check(python_code)
+    except PreflightError as e:
+        return str(e)
+    
+    # The code should contain basic CAD operations
+    python_lower = python_code.lower()
+    if not any(op in python_lower for op in ['box', 'cylinder', 'sphere', 'workplane']):
+        return "Script builds no CadQuery geometry"
+    
+    return None
+
 def validate_pipeline_consistency(json_plan: Dict[str, Any], python_code: str) -> bool:
     """Validate that JSON plan and Python code are consistent"""
     try:
-        # Basic validation checks
-        if not json_plan.get('objects'):
-            return False
-        
-        if not python_code or len(python_code.strip()) < 10:
-            return False
-        
-        # Check if Python code contains CadQuery imports
-        if 'import cadquery' not in python_code and 'cadquery' not in python_code:
-            return False
-        
-        # Check if Python code contains export statement
-        if 'export' not in python_code.lower():
-            return False
-        
-        # Check if main objects from JSON are referenced in Python code
-        object_names = [obj.get('name', '') for obj in json_plan['objects']]
-        python_lower = python_code.lower()
-        
-        # At least one object should be referenced or the code should contain basic CAD operations
-        has_cad_operations = any(op in python_lower for op in ['box', 'cylinder', 'sphere', 'workplane'])
-        
-        return has_cad_operations
-        
+        problem = pipeline_problem(json_plan, python_code)
     except Exception as e:
-        print(f'Error validating pipeline consistency: {e}')
+        logger.warning("Error validating pipeline consistency", extra={'error': str(e)})
         return False
+    if problem:
+        logger.info("Pipeline response rejected", extra={'reason': problem})
+    return problem is None
 
-def generate_fallback_pipeline(prompt: str) -> Dict[str, Any]:
+def generate_fallback_pipeline(prompt: str, on_stage: Optional[StageCallback] = None,
+                               quality: str = DEFAULT_QUALITY) -> Dict[str, Any]:
     """Generate a fallback pipeline when AI is unavailable"""
+    notify = on_stage or (lambda stage, data=None: None)
+    
     # Simple prompt analysis for fallback
     geometry = analyze_prompt_for_geometry(prompt)
     
@@ -672,17 +1462,21 @@ def generate_fallback_pipeline(prompt: str) -> Dict[str, Any]:
     }
     
     fallback_python = generate_fallback_cadquery_code(geometry)
+    notify('plan_ready', {'jsonPlan': fallback_json, 'fallback': True})
+    notify('code_ready', {'pythonCode': fallback_python, 'fallback': True})
     
     try:
-        gltf_content = execute_cadquery(fallback_python)
-        return {
-            'success': True,
-            'prompt': prompt,
-            'jsonPlan': fallback_json,
-            'pythonCode': fallback_python,
-            'gltf': gltf_content,
-            'message': 'Fallback model generated (AI unavailable)'
-        }
+        notify('executing', {'fallback': True})
+        model = model_fields(execute_model(fallback_json, fallback_python, quality))
+        notify('gltf_ready', dict(model, fallback=True))
+        return dict(
+            model,
+            success=True,
+            prompt=prompt,
+            jsonPlan=fallback_json,
+            pythonCode=fallback_python,
+            message='Fallback model generated (AI unavailable)'
+        )
     except Exception as e:
         return {
             'success': False,
@@ -760,6 +1554,35 @@ assembly.add(result, name="box")
 assembly.save("output.gltf")
 '''
 
+def build_cad_request_content(user_prompt: str, similar: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    User message content for a pipeline request. The fixed requirements come first and
+    close a cache breakpoint, so only the per-prompt interpretation is processed fresh.
+    A similar earlier prompt (from the prompt index) is included as a worked example.
+    """
+    content = [{'type': 'text', 'text': CAD_REQUEST_REQUIREMENTS, 'cache_control': CACHE_CONTROL}]
+    if similar:
+        content.append({'type': 'text', 'text': construct_example(similar)})
+    content.append({'type': 'text', 'text': construct_cad_request(user_prompt)})
+    return content
+
+def construct_example(similar: Dict[str, Any]) -> str:
+    """Few-shot example from a similar earlier prompt, in the response format"""
+    return f"""
+EXAMPLE - a similar earlier request and the response that built it. Adapt it to the new request
+rather than starting over, changing whatever differs:
+
+REQUEST: {similar['prompt']}
+
+JSON_PLAN:
+{json.dumps(similar['jsonPlan'], indent=2)}
+
+PYTHON_CODE:
+```python
+{similar['pythonCode'].rstrip()}
+```
+"""
+
 def construct_cad_request(user_prompt: str) -> str:
     """
     Enhanced interpretation of user input to construct a complete CAD request.
@@ -828,42 +1651,39 @@ OBJECT DESCRIPTION: {prompt}
 ENGINEERING INTERPRETATION:
 {chr(10).join(analysis) if analysis else "- Standard engineering practices apply"}
 
-MODELING REQUIREMENTS:
-- Create a manufacturable 3D model
-- Use appropriate dimensions and proportions
-- Include necessary engineering features
-- Ensure structural integrity
-- Apply standard manufacturing constraints
-
-TECHNICAL SPECIFICATIONS:
-- Default dimensions: 50mm primary features
-- Minimum wall thickness: 2mm
-- Standard fillet radius: 2-5mm
-- Material: General engineering plastic/metal
-- Tolerance: ±0.1mm standard
-
 Please generate both the JSON plan and Python/CadQuery code for this engineering model.
 """
     
     return enhanced_request
 
 def check_modules():
-    """Check which modules are available"""
-    modules = []
-    try:
-        import cadquery
-        modules.append('cadquery')
-    except ImportError:
-        pass
-    
-    try:
-        import json
-        modules.append('json')
-    except ImportError:
-        pass
-        
-    return modules
+    """Check which modules are available, without importing them"""
+    return [module for module in ('cadquery', 'json') if module_available(module)]
+
+def warm_up_cadquery():
+    """
+    Start the CadQuery pool on a background thread, so the server keeps answering while the
+    workers import cadquery/OCP, and record the 'cadquery_ready' phase once one of them has
+    """
+    def warm_up():
+        try:
+            cadquery_pool.start()
+        except Exception:
+            # Logged and reported by /ready through cadquery_pool.startup_error()
+            return
+        if cadquery_pool.wait_ready():
+            startup_timer.mark('cadquery_ready')
+
+    threading.Thread(target=warm_up, name='cadquery-warm-up', daemon=True).start()
+
+startup_timer.mark('imports')
 
 if __name__ == '__main__':
+    from werkzeug.serving import make_server
+
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    server = make_server('0.0.0.0', port, app, threaded=True)
+    startup_timer.mark('listening')
+    # Import cadquery/OCP in the workers once the port is bound, before the first CAD request
+    warm_up_cadquery()
+    server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Offline pipeline benchmark for CADAgent PRO
+Replays recorded LLM responses for a prompt corpus through the local Anthropic stand-in and
+times each pipeline stage on its own: the LLM call, response parsing, validation, CadQuery
+execution, GLTF embedding and response serialization. Prints per-stage p50/p95 and peak RSS
+as JSON, and exits non-zero when a stage is slower than the baseline by more than the threshold.
+
+Usage:
+    python benchmark.py --iterations 5 --output bench.json
+    python benchmark.py --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmark.py --write-baseline benchmarks/baseline.json
+    python benchmark.py --corpus requests.jsonl --first-token-delay 0.5 --chunk-delay 0.02
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from fake_anthropic_server import FakeAnthropicHandler, load_corpus
+from gltf_utils import iter_embedded_gltf
+from json_stream import StreamedString, iter_json_object
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'corpus.jsonl')
+
+# serialization streams the whole response body, embedded GLTF included, as the server does
+STAGES = ('anthropic_call', 'parse', 'validate', 'execute_cadquery', 'gltf_embed', 'serialization')
+
+# Stages faster than this are not judged against the threshold; at that scale the
+# difference between runs is noise, not a regression
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def drain(pieces) -> int:
+    """Consume a streamed body the way the server writes it; returns its length"""
+    return sum(len(piece) for piece in pieces)
+
+
+def descendant_peak_rss_kb() -> int:
+    """Largest peak RSS (VmHWM) among this process's live descendants, such as pool workers"""
+    parents = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                # The command name may contain spaces; the fields after it are fixed
+                parents[int(pid)] = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    descendants, frontier = set(), {os.getpid()}
+    while frontier:
+        frontier = {pid for pid, parent in parents.items() if parent in frontier} - descendants
+        descendants |= frontier
+
+    peak = 0
+    for pid in descendants:
+        try:
+            with open(f'/proc/{pid}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]))
+        except (OSError, ValueError):
+            continue
+    return peak
+
+
+def start_stub(corpus: List[Dict[str, Any]], first_token_delay: float, chunk_delay: float) -> ThreadingHTTPServer:
+    """Serve the corpus's recorded responses on a free local port"""
+    FakeAnthropicHandler.recorded_responses = {entry['prompt']: entry['response'] for entry in corpus if entry['response']}
+    FakeAnthropicHandler.first_token_delay = first_token_delay
+    FakeAnthropicHandler.chunk_delay = chunk_delay
+    FakeAnthropicHandler.log_message = lambda self, format, *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAnthropicHandler)
+    # The client dropping its keep-alive connections at exit is not an error
+    server.handle_error = lambda request, client_address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_benchmark(corpus: List[Dict[str, Any]], iterations: int, warmup: int, quality: Optional[str]) -> Dict[str, Any]:
+    """Time every stage for each corpus entry, iterations times after the warmup passes"""
+    # Imported here so the environment pointing the app at the stub is in place first
+    import app as cadagent
+
+    quality = quality or cadagent.DEFAULT_QUALITY
+    api_key = os.environ['ANTHROPIC_API_KEY']
+    samples: Dict[str, List[float]] = defaultdict(list)
+    failures = []
+
+    def timed(stage, recording, fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        if recording:
+            samples[stage].append(time.perf_counter() - started)
+        return value
+
+    cadagent.cadquery_pool.start()
+    started = time.perf_counter()
+    try:
+        for run in range(warmup + iterations):
+            recording = run >= warmup
+            for entry in corpus:
+                # The same request the pipeline sends, against the recorded response
+                payload = {
+                    'model': cadagent.ANTHROPIC_MODEL,
+                    'max_tokens': 3000,
+                    'temperature': 0.3,
+                    'system': [{'type': 'text', 'text': cadagent.FRAMEWORK_SYSTEM_PROMPT,
+                                'cache_control': cadagent.CACHE_CONTROL}],
+                    'messages': [{'role': 'user', 'content': cadagent.build_cad_request_content(entry['prompt'])}],
+                }
+                response = timed('anthropic_call', recording,
+                                 lambda: ''.join(cadagent.anthropic_client.stream_messages(api_key, payload)))
+                parsed = timed('parse', recording, cadagent.parse_pipeline_response, response)
+                if not parsed['jsonPlan'] or not parsed['pythonCode']:
+                    failures.append({'id': entry['id'], 'run': run, 'error': 'Response has no plan or code'})
+                    continue
+                timed('validate', recording, cadagent.validate_pipeline_consistency, parsed['jsonPlan'], parsed['pythonCode'])
+
+                # A distinct statement per entry and run gives the script a new cache key, so every
+                # run really executes instead of being served from the model cache
+                code = f"{parsed['pythonCode']}\n_benchmark_run = {(entry['id'], run)!r}\n"
+                try:
+                    model_hash = timed('execute_cadquery', recording, cadagent.execute_cadquery, code, quality)
+                except Exception as e:
+                    failures.append({'id': entry['id'], 'run': run, 'error': str(e)})
+                    continue
+
+                with cadagent.model_cache.open_stream(model_hash) as glb:
+                    timed('gltf_embed', recording, lambda: drain(iter_embedded_gltf(glb)))
+                with cadagent.model_cache.open_stream(model_hash) as glb:
+                    result = dict(cadagent.model_fields(model_hash), success=True, prompt=entry['prompt'],
+                                  jsonPlan=parsed['jsonPlan'], pythonCode=parsed['pythonCode'],
+                                  gltf=StreamedString(iter_embedded_gltf(glb)),
+                                  message='Model generated successfully')
+                    timed('serialization', recording, lambda: drain(iter_json_object(result)))
+        elapsed = time.perf_counter() - started
+        worker_peak_kb = descendant_peak_rss_kb()
+    finally:
+        cadagent.cadquery_pool.shutdown()
+
+    # ru_maxrss is in kilobytes on Linux
+    server_peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'corpus_size': len(corpus),
+        'iterations': iterations,
+        'quality': quality,
+        'elapsed_seconds': round(elapsed, 3),
+        'stages': {
+            stage: {
+                'count': len(samples[stage]),
+                'p50_ms': round(percentile(samples[stage], 0.5) * 1000, 3) if samples[stage] else None,
+                'p95_ms': round(percentile(samples[stage], 0.95) * 1000, 3) if samples[stage] else None,
+            }
+            for stage in STAGES
+        },
+        'peak_rss_mb': {
+            'server': round(server_peak_kb / 1024, 1),
+            'workers': round(worker_peak_kb / 1024, 1),
+        },
+        'failures': failures,
+    }
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Stage percentiles more than threshold (a fraction) slower than the baseline"""
+    regressions = []
+    for stage, expected in baseline.get('stages', {}).items():
+        measured = report['stages'].get(stage) or {}
+        for field in ('p50_ms', 'p95_ms'):
+            if expected.get(field) is None or measured.get(field) is None:
+                continue
+            limit = max(expected[field] * (1 + threshold), expected[field] + MIN_REGRESSION_SECONDS * 1000)
+            if measured[field] > limit:
+                regressions.append({'stage': stage, 'percentile': field, 'baseline_ms': expected[field],
+                                    'measured_ms': measured[field], 'limit_ms': round(limit, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the CADAgent PRO pipeline stages')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                        help='JSONL prompts with recorded responses (requests.jsonl format accepted)')
+    parser.add_argument('--iterations', type=int, default=3, help='Timed passes over the corpus')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed passes before the timed ones')
+    parser.add_argument('--quality', help='Tessellation quality tier (default: the server default)')
+    parser.add_argument('--first-token-delay', type=float, default=0.05, help='Stub seconds before the first byte')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Stub seconds between streamed deltas')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--baseline', help='Report to compare against; exit 1 on regression')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown over the baseline as a fraction (0.25 = 25%%)')
+    parser.add_argument('--write-baseline', help='Write this run as the new baseline file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    stub = start_stub(corpus, args.first_token_delay, args.chunk_delay)
+
+    # Fresh model cache so nothing is served from an earlier run, quiet logs, and the stub as the
+    # API with the client's rate limit lifted (it would otherwise pace the calls, not time them)
+    os.environ['ANTHROPIC_BASE_URL'] = f'http://127.0.0.1:{stub.server_address[1]}'
+    os.environ['ANTHROPIC_API_KEY'] = 'benchmark'
+    os.environ['ANTHROPIC_REQUESTS_PER_MINUTE'] = '1000000'
+    os.environ['MODEL_CACHE_DIR'] = tempfile.mkdtemp(prefix='cadagent-benchmark-')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    try:
+        report = run_benchmark(corpus, args.iterations, args.warmup, args.quality)
+    finally:
+        stub.shutdown()
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = find_regressions(report, json.load(f), args.threshold)
+        report['threshold'] = args.threshold
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in filter(None, (args.output, args.write_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    if report['failures'] or report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
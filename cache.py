@@ -0,0 +1,589 @@
+"""
+Result caches for CADAgent PRO
+Content-addressed GLB model cache placed in front of CadQuery execution, a
+prompt-level cache placed in front of the whole generation pipeline and
+per-session shape memos for incremental plan edits
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import tokenize
+import uuid
+from collections import OrderedDict
+from importlib import metadata
+from typing import BinaryIO, Dict, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Temp files in the model directory older than this belong to no live write and are removed
+STALE_TEMP_SECONDS = 600
+
+# The model directory is re-measured after this fraction of its limit has been written by a process
+TRIM_FRACTION = 8
+
+
+def normalize_code(python_code: str) -> str:
+    """Normalize CadQuery source so cosmetic edits map to the same cache key"""
+    source = python_code.replace('\r\n', '\n').replace('\r', '\n')
+    lines = source.split('\n')
+
+    # Strip comments using the tokenizer so '#' inside strings is left alone
+    try:
+        comments = [
+            token.start for token in tokenize.generate_tokens(io.StringIO(source).readline)
+            if token.type == tokenize.COMMENT
+        ]
+        for row, col in comments:
+            lines[row - 1] = lines[row - 1][:col]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+
+    # Trailing whitespace and blank lines never change the generated geometry
+    return '\n'.join(line.rstrip() for line in lines if line.strip())
+
+
+def engine_version() -> str:
+    """Return the installed CadQuery/OCP versions without importing either package"""
+    versions = []
+    for distribution in ('cadquery', 'cadquery-ocp'):
+        try:
+            versions.append(f"{distribution}={metadata.version(distribution)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{distribution}=none")
+    return ';'.join(versions)
+
+
+class ModelCache:
+    """
+    Two-tier, content-addressed store of GLB models keyed by a hash of the normalized code (or jsonPlan),
+    engine version and tessellation quality. The disk tier is a size-capped directory that survives restarts,
+    is evicted least-recently-used first and is what /api/models serves from; the memory
+    tier is a byte-bounded LRU of recently used model bytes. The directory may be shared with
+    other processes (server workers, recycled workers), so a model missing from the in-process
+    index is looked up on disk and the directory is re-measured as models are written.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: str, disk_bytes: int):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.version = engine_version()
+
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_size = 0
+        self._disk: 'OrderedDict[str, int]' = OrderedDict()
+        self._disk_size = 0
+        # Bytes this process has added since it last measured the directory
+        self._written = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+
+        self._load_disk_index()
+
+    @classmethod
+    def from_env(cls) -> 'ModelCache':
+        """Build the cache from MODEL_CACHE_* environment variables"""
+        default_dir = os.path.join(tempfile.gettempdir(), 'cadagent-models')
+        return cls(
+            memory_bytes=int(os.environ.get('MODEL_CACHE_MEMORY_MB', 32)) * 1024 * 1024,
+            disk_dir=os.environ.get('MODEL_CACHE_DIR') or default_dir,
+            disk_bytes=int(os.environ.get('MODEL_CACHE_DISK_MB', 256)) * 1024 * 1024,
+        )
+
+    def make_key(self, python_code: str, quality: str) -> str:
+        """Compute the content address for a script tessellated at a quality tier"""
+        digest = hashlib.sha256()
+        for part in (self.version, quality):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(normalize_code(python_code).encode('utf-8'))
+        return digest.hexdigest()
+
+    def make_plan_key(self, json_plan: Dict[str, Any], quality: str) -> str:
+        """Compute the content address for a jsonPlan compiled at a quality tier"""
+        geometry = {'objects': json_plan.get('objects'), 'operations': json_plan.get('operations') or []}
+        digest = hashlib.sha256()
+        for part in ('plan', self.version, quality):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(json.dumps(geometry, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def content_key(glb: bytes) -> str:
+        """Content address for model bytes that were not produced from a script"""
+        return hashlib.sha256(glb).hexdigest()
+
+    def path(self, key: str) -> str:
+        """Location of a model on disk (whether or not it exists yet)"""
+        return os.path.join(self.disk_dir, f"{key}.glb")
+
+    def lookup(self, key: str) -> bool:
+        """Check for a model, counting the outcome as a cache hit or miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return True
+            if self._on_disk(key) and self._touch(key):
+                self._stats['disk_hits'] += 1
+                return True
+            self._stats['misses'] += 1
+            return False
+
+    def contains(self, key: str) -> bool:
+        """Check for a model without affecting statistics"""
+        with self._lock:
+            return self._on_disk(key)
+
+    def size(self, key: str) -> Optional[int]:
+        """Size in bytes of a stored model"""
+        with self._lock:
+            return self._disk.get(key) if self._on_disk(key) else None
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Return model bytes, promoting disk reads into memory"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if not self._on_disk(key):
+                return None
+            try:
+                with open(self.path(key), 'rb') as f:
+                    glb = f.read()
+            except OSError:
+                # File vanished underneath us, forget it
+                self._disk_size -= self._disk.pop(key)
+                return None
+            self._touch(key)
+            self._remember(key, glb)
+            return glb
+
+    def open_stream(self, key: str) -> Optional[BinaryIO]:
+        """
+        Binary file object over a model, for streaming it without reading it whole. An open
+        disk file stays readable even if the entry is evicted while it is being streamed.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return io.BytesIO(self._memory[key])
+            if not self._on_disk(key):
+                return None
+            try:
+                f = open(self.path(key), 'rb')
+            except OSError:
+                # File vanished underneath us, forget it
+                self._disk_size -= self._disk.pop(key)
+                return None
+            self._touch(key)
+            return f
+
+    def put(self, key: str, glb: bytes) -> None:
+        """Write model bytes to disk and memory"""
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(key, glb)
+            if self._on_disk(key):
+                return
+            tmp_path = None
+            try:
+                # Write to a temp file first so a crash never leaves a truncated entry
+                fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(glb)
+                os.replace(tmp_path, self.path(key))
+            except OSError as e:
+                logger.warning("Model cache: failed to persist model", extra={'model_hash': key[:12], 'error': str(e)})
+                if tmp_path is not None:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                return
+            self._index(key, len(glb))
+
+    def adopt(self, key: str) -> int:
+        """Register a model a worker process wrote directly to path(key); returns its size"""
+        size = os.path.getsize(self.path(key))
+        with self._lock:
+            self._stats['stores'] += 1
+            if key not in self._disk:
+                self._index(key, size)
+        return size
+
+    def reload(self) -> None:
+        """Re-read the disk index, for a process forked long after the cache was created"""
+        with self._lock:
+            self._load_disk_index()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current tier sizes"""
+        with self._lock:
+            lookups = self._stats['memory_hits'] + self._stats['disk_hits'] + self._stats['misses']
+            hits = self._stats['memory_hits'] + self._stats['disk_hits']
+            return dict(
+                self._stats,
+                hit_ratio=(hits / lookups) if lookups else 0.0,
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_size,
+                memory_limit_bytes=self.memory_bytes,
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_size,
+                disk_limit_bytes=self.disk_bytes,
+                engine_version=self.version,
+            )
+
+    def _remember(self, key: str, glb: bytes) -> None:
+        size = len(glb)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = glb
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self._stats['memory_evictions'] += 1
+
+    def _index(self, key: str, size: int) -> None:
+        self._disk[key] = size
+        self._disk_size += size
+        self._written += size
+        # Other processes add to the directory too, so it is re-measured every so often; a
+        # scan on every store would hold the lock for O(entries)
+        if self._written >= self.disk_bytes // TRIM_FRACTION:
+            self._scan_disk()
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        # Never evict the newest entry, it is about to be served
+        while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+            evicted_key, evicted_size = self._disk.popitem(last=False)
+            self._disk_size -= evicted_size
+            self._stats['disk_evictions'] += 1
+            if evicted_key in self._memory:
+                self._memory_size -= len(self._memory.pop(evicted_key))
+            try:
+                os.remove(self.path(evicted_key))
+            except OSError:
+                pass
+
+    def _load_disk_index(self) -> None:
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        except OSError as e:
+            fallback_dir = tempfile.mkdtemp(prefix='cadagent-models-')
+            logger.warning("Model cache: cannot use cache directory, using a temporary one",
+                           extra={'disk_dir': self.disk_dir, 'fallback_dir': fallback_dir, 'error': str(e)})
+            self.disk_dir = fallback_dir
+        self._scan_disk()
+        self._trim_disk()
+
+    def _scan_disk(self) -> None:
+        # Caller holds self._lock; rebuilds the index from the directory
+        entries = []
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        try:
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith('.tmp'):
+                    self._remove_stale(entry, stale_before)
+                elif entry.name.endswith('.glb'):
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime, entry.name[:-len('.glb')], stat.st_size))
+                    except FileNotFoundError:
+                        # Evicted by another process while scanning
+                        continue
+        except OSError as e:
+            logger.warning("Model cache: cannot scan cache directory", extra={'disk_dir': self.disk_dir, 'error': str(e)})
+            return
+
+        # Oldest access first so the OrderedDict matches LRU order; models served from memory
+        # never touch their file, but are the most recently used this process knows of
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(entries))
+        for key in self._memory:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        self._disk_size = sum(self._disk.values())
+        self._written = 0
+
+    @staticmethod
+    def _remove_stale(entry: os.DirEntry, stale_before: float) -> None:
+        # Left by a write that failed or a worker killed mid-write; a live write is far newer
+        try:
+            if entry.stat().st_mtime < stale_before:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _on_disk(self, key: str) -> bool:
+        # Caller holds self._lock; a model this index has not seen may have been written by
+        # another server worker or before this worker was forked
+        if key in self._disk:
+            return True
+        try:
+            size = os.path.getsize(self.path(key))
+        except OSError:
+            return False
+        self._disk[key] = size
+        self._disk_size += size
+        return True
+
+    def _touch(self, key: str) -> bool:
+        # Caller holds self._lock; keeps mtime in LRU order across restarts
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            self._disk_size -= self._disk.pop(key)
+            return False
+        self._disk.move_to_end(key)
+        return True
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a user prompt so trivially different phrasings share a cache entry"""
+    normalized = re.sub(r'\s+', ' ', prompt.strip().lower())
+    return normalized.rstrip('.!?')
+
+
+class PipelineCache:
+    """
+    TTL and size bounded cache of pipeline results keyed by prompt, model and system prompt.
+    Entries hold the jsonPlan and the pythonCode; the model itself is resolved through the
+    content-addressed ModelCache, so the mesh is only ever stored once.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._size = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'expirations': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'bypasses': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> 'PipelineCache':
+        """Build the cache from PIPELINE_CACHE_* environment variables"""
+        return cls(
+            ttl_seconds=float(os.environ.get('PIPELINE_CACHE_TTL_SECONDS', 6 * 3600)),
+            max_entries=int(os.environ.get('PIPELINE_CACHE_MAX_ENTRIES', 512)),
+            max_bytes=int(os.environ.get('PIPELINE_CACHE_MEMORY_MB', 8)) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def make_key(prompt: str, model: str, system_prompt: str) -> str:
+        """Compute the cache key for a prompt under a given model and system prompt"""
+        system_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+        digest = hashlib.sha256()
+        for part in (normalize_prompt(prompt), model, system_hash):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry['expires_at'] <= time.monotonic():
+                self._drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry['value']
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a pipeline result, evicting the least recently used entries past the limits"""
+        size = len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                'value': value,
+                'size': size,
+                'expires_at': time.monotonic() + self.ttl_seconds,
+            }
+            self._size += size
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._drop(oldest_key)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key: str) -> bool:
+        """Remove a single entry, returning whether it existed"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._drop(key)
+            self._stats['invalidations'] += 1
+            return True
+
+    def record_bypass(self) -> None:
+        """Count a request that explicitly skipped the cache"""
+        with self._lock:
+            self._stats['bypasses'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                hit_ratio=(self._stats['hits'] / lookups) if lookups else 0.0,
+                entries=len(self._entries),
+                bytes=self._size,
+                limit_entries=self.max_entries,
+                limit_bytes=self.max_bytes,
+                ttl_seconds=self.ttl_seconds,
+            )
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry['size']
+
+
+class PlanSessionStore:
+    """
+    Per-session memo for incremental plan edits. A session remembers the last plan it built
+    and the serialized shapes of its dependency-graph nodes, bounded per session by bytes
+    (least recently used nodes go first) and overall by session count and idle time.
+    """
+
+    def __init__(self, max_sessions: int, memo_bytes: int, ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.memo_bytes = memo_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._sessions: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._stats = {
+            'created': 0,
+            'expired': 0,
+            'evicted': 0,
+            'rebuilds': 0,
+            'nodes_built': 0,
+            'nodes_reused': 0,
+            'memo_evictions': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> 'PlanSessionStore':
+        """Build the store from PLAN_SESSION_* environment variables"""
+        return cls(
+            max_sessions=int(os.environ.get('PLAN_SESSION_MAX', 64)),
+            memo_bytes=int(os.environ.get('PLAN_SESSION_MEMO_MB', 16)) * 1024 * 1024,
+            ttl_seconds=float(os.environ.get('PLAN_SESSION_TTL_SECONDS', 3600)),
+        )
+
+    def open(self, session_id: Optional[str]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Return the session id and its previous plan, starting a new session for unknown ids"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session_id = uuid.uuid4().hex
+                session = {'plan': None, 'memo': OrderedDict(), 'bytes': 0}
+                self._sessions[session_id] = session
+                self._stats['created'] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats['evicted'] += 1
+            self._sessions.move_to_end(session_id)
+            session['touched'] = time.monotonic()
+            return session_id, session['plan']
+
+    def memo(self, session_id: str, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Serialized shapes of the given graph nodes that the session already holds"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {}
+            entries = {}
+            for key in keys:
+                if key in session['memo']:
+                    session['memo'].move_to_end(key)
+                    entries[key] = session['memo'][key]
+            return entries
+
+    def record(self, session_id: str, json_plan: Dict[str, Any], entries: Dict[str, bytes],
+               nodes: Optional[Dict[str, int]] = None) -> None:
+        """Make json_plan the session's current plan and add newly built node shapes to its memo"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            session['plan'] = json_plan
+            session['touched'] = time.monotonic()
+            for key, data in entries.items():
+                if key in session['memo']:
+                    session['bytes'] -= len(session['memo'].pop(key))
+                session['memo'][key] = data
+                session['bytes'] += len(data)
+            while session['bytes'] > self.memo_bytes and session['memo']:
+                _, data = session['memo'].popitem(last=False)
+                session['bytes'] -= len(data)
+                self._stats['memo_evictions'] += 1
+            self._stats['rebuilds'] += 1
+            if nodes:
+                self._stats['nodes_built'] += nodes.get('built', 0)
+                self._stats['nodes_reused'] += nodes.get('reused', 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return session counters and memo occupancy"""
+        with self._lock:
+            evaluated = self._stats['nodes_built'] + self._stats['nodes_reused']
+            return dict(
+                self._stats,
+                reuse_ratio=(self._stats['nodes_reused'] / evaluated) if evaluated else 0.0,
+                sessions=len(self._sessions),
+                memo_bytes=sum(session['bytes'] for session in self._sessions.values()),
+                limit_sessions=self.max_sessions,
+                limit_memo_bytes=self.memo_bytes,
+            )
+
+    def _expire(self) -> None:
+        # Caller holds self._lock; sessions are ordered least recently used first
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session['touched'] > deadline:
+                break
+            del self._sessions[session_id]
+            self._stats['expired'] += 1
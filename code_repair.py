@@ -0,0 +1,192 @@
+"""
+Code repair for CADAgent PRO
+Pre-flight checks generated CadQuery scripts with the AST, without running them, so scripts that
+cannot work fail in microseconds instead of on a worker. A failing script is then repaired by
+asking the model for a small SEARCH/REPLACE patch against it rather than a whole new completion.
+"""
+
+import ast
+import builtins
+import importlib.util
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+# Names the worker puts in every script's globals (see worker_pool.run_script); exec adds __builtins__
+SCRIPT_GLOBALS = frozenset({'cq', 'math', 'os', 'tempfile', 'show_object', '__name__', '__file__', '__builtins__'})
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+# Imported by the worker itself, which falls back to a placeholder model when they are missing
+WORKER_MODULES = frozenset({'cadquery', 'OCP'})
+
+# Method names that can hand a model to the server: Assembly.save/export are captured by the
+# worker, and otherwise it serves a .gltf/.glb file the script wrote; STL and STEP files are not used
+EXPORT_METHODS = frozenset({'save', 'export', 'exportGltf'})
+
+# Global names the worker picks up when the script exports nothing itself
+RESULT_NAMES = frozenset({'result', 'assembly'})
+
+# Characters of the error kept for the repair request; the end of a message carries the detail
+REPAIR_ERROR_CHARS = 800
+
+REPAIR_SYSTEM_PROMPT = """
+You fix CadQuery scripts that failed to run. Reply ONLY with edits in this exact form:
+
+<<<<<<< SEARCH
+lines copied exactly from the script
+=======
+replacement lines
+>>>>>>> REPLACE
+
+Use as many edits as needed and change nothing else. The script runs with cq and math already
+imported; the final shape must be assigned to result, or added to an assembly that is saved with
+assembly.save("output.gltf"). Never use fillet() or show_object().
+""".strip()
+
+EDIT_PATTERN = re.compile(r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE', re.DOTALL)
+CODE_FENCE_PATTERN = re.compile(r'```(?:python)?\s*\n(.*?)```', re.DOTALL)
+
+
+class PreflightError(ValueError):
+    """Raised for a script that cannot produce a model, found without running it"""
+
+
+class RepairError(ValueError):
+    """Raised when a repair reply holds no edit that applies to the script"""
+
+
+@lru_cache(maxsize=256)
+def module_available(name: str) -> bool:
+    """Whether a top-level module can be imported, found without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _bound_name(node: ast.AST) -> Optional[str]:
+    """The name a node binds, if any; scopes are not told apart, so unknown names are never over-reported"""
+    if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+        return node.id
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name
+    if isinstance(node, ast.arg):
+        return node.arg
+    if isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)):
+        return node.name
+    return None
+
+
+def _describe(node: ast.AST, python_code: str) -> str:
+    """'line N: source' for a node, the way a trimmed traceback points at the script"""
+    lines = python_code.splitlines()
+    line = getattr(node, 'lineno', None)
+    if not line or line > len(lines):
+        return ''
+    return f" (line {line}: {lines[line - 1].strip()})"
+
+
+def preflight_check(python_code: str) -> None:
+    """
+    Reject, without executing it, a script that is certain to fail: one that does not parse,
+    imports a module that is not installed, reads a name nothing defines, or never hands a model
+    over (no save/export call and no assignment to result or assembly anywhere). Raises
+    PreflightError with a message shaped like the exception the worker would have reported.
+    """
+    try:
+        tree = ast.parse(python_code, filename='<string>')
+    except SyntaxError as e:
+        source = (e.text or '').strip()
+        raise PreflightError(f"SyntaxError: {e.msg} (line {e.lineno}: {source})" if source
+                             else f"SyntaxError: {e.msg} (line {e.lineno})")
+
+    # One walk gathers everything; a star import can bind anything, so it disables the name check
+    bound, loaded, star_import, exports, results = set(SCRIPT_GLOBALS), [], False, False, False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            loaded.append(node)
+        elif isinstance(node, ast.Call):
+            exports = exports or isinstance(node.func, ast.Attribute) and node.func.attr in EXPORT_METHODS
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+            star_import = star_import or any(alias.name == '*' for alias in node.names)
+            # Relative imports cannot resolve in a script; the worker reports those itself
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module] if not node.level else []
+            for module in modules:
+                top_level = module.split('.')[0]
+                if top_level not in WORKER_MODULES and not module_available(top_level):
+                    raise PreflightError(f"ModuleNotFoundError: No module named '{module}'{_describe(node, python_code)}")
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+            results = results or isinstance(node, ast.Global) and not RESULT_NAMES.isdisjoint(node.names)
+        else:
+            name = _bound_name(node)
+            if name:
+                bound.add(name)
+            # Assigned anywhere (try/except fallbacks, if branches, tuple unpacking, loops), the
+            # worker still finds it in the script's globals after exec
+            results = results or isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store) and node.id in RESULT_NAMES
+
+    if not star_import:
+        for node in loaded:
+            if node.id not in bound and node.id not in BUILTIN_NAMES:
+                raise PreflightError(f"NameError: name '{node.id}' is not defined{_describe(node, python_code)}")
+
+    if not exports and not results:
+        raise PreflightError("Script produces no model: assign the final shape to result "
+                             "or call assembly.save('output.gltf')")
+
+
+def trim_error(error: str, limit: int = REPAIR_ERROR_CHARS) -> str:
+    """The end of an error message, where the failing line and exception are, within limit characters"""
+    error = error.strip()
+    return error if len(error) <= limit else '...' + error[-(limit - 3):]
+
+
+def repair_request(python_code: str, error: str) -> str:
+    """User message asking for a patch: only the failing script and its trimmed error"""
+    return f"This CadQuery script failed.\n\nSCRIPT:\n```python\n{python_code}\n```\n\nERROR:\n{trim_error(error)}"
+
+
+def _find_lines(lines: List[str], wanted: List[str], normalize) -> Optional[int]:
+    """Index of the first run of lines equal to wanted after normalize, or None"""
+    wanted = [normalize(line) for line in wanted]
+    if not any(wanted):
+        return None
+    for start in range(len(lines) - len(wanted) + 1):
+        if [normalize(line) for line in lines[start:start + len(wanted)]] == wanted:
+            return start
+    return None
+
+
+def apply_edits(python_code: str, reply: str) -> str:
+    """
+    Apply the SEARCH/REPLACE edits of a repair reply to the script. A reply that ignored the
+    format and sent a whole fenced script is taken as the replacement. Raises RepairError when
+    nothing in the reply applies.
+    """
+    edits = EDIT_PATTERN.findall(reply)
+    if not edits:
+        fenced = CODE_FENCE_PATTERN.search(reply)
+        if fenced and fenced.group(1).strip():
+            return fenced.group(1).strip() + '\n'
+        raise RepairError("Repair reply contains no edits")
+
+    lines = python_code.splitlines()
+    for search, replace in edits:
+        wanted, replacement = search.splitlines(), replace.splitlines()
+        start = _find_lines(lines, wanted, lambda line: line)
+        if start is None:
+            # Models often re-indent or trim the copied lines; match them ignoring that and
+            # indent the replacement like the lines it replaces
+            start = _find_lines(lines, wanted, str.strip)
+            if start is None:
+                raise RepairError(f"Repair edit does not match the script: {search.strip()[:80]!r}")
+            indent = lines[start][:len(lines[start]) - len(lines[start].lstrip())]
+            base = min((len(line) - len(line.lstrip()) for line in replacement if line.strip()), default=0)
+            replacement = [indent + line[base:] if line.strip() else '' for line in replacement]
+        lines[start:start + len(wanted)] = replacement
+    if lines == python_code.splitlines():
+        raise RepairError("Repair edits leave the script unchanged")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,252 @@
+"""
+Local stand-in for the Anthropic Messages API
+Replays a canned pipeline response, streamed as Server-Sent Events when the request
+asks for stream=true, so the generation pipeline can be exercised offline. With a corpus,
+each prompt gets its own recorded response.
+
+Usage:
+    python fake_anthropic_server.py --port 8089 --chunk-delay 0.02
+    python fake_anthropic_server.py --corpus benchmarks/corpus.jsonl
+    python fake_anthropic_server.py --fail-count 2 --fail-status 529 --retry-after 1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 ANTHROPIC_API_KEY=test python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = '''JSON_PLAN:
+{
+  "objects": [
+    {
+      "name": "main_block",
+      "type": "Box",
+      "params": {"width": 50, "height": 50, "depth": 50},
+      "transform": [[1,0,0,0],[0,1,0,0],[0,0,1,0],[0,0,0,1]]
+    }
+  ],
+  "operations": []
+}
+
+PYTHON_CODE:
+```python
+import cadquery as cq
+
+result = cq.Workplane("XY").box(50, 50, 50)
+
+# Export as GLTF using Assembly
+assembly = cq.Assembly()
+assembly.add(result, name="part")
+assembly.save("output.gltf")
+```
+
+This model is a simple 50mm cube centered on the origin. The dimensions follow the
+default primary feature size and the part can be exported for manufacturing as-is.
+'''
+
+
+def load_corpus(path):
+    """
+    Read a JSONL prompt corpus. Each line has a prompt ("prompt", or "body" for lines in the
+    requests.jsonl format with request_id/title/body) and optionally the recorded "response".
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            prompt = entry.get('prompt') or entry.get('body')
+            if not prompt:
+                raise ValueError(f"{path}:{number}: entry has no prompt or body")
+            entries.append({
+                'id': entry.get('id') or entry.get('request_id') or f'entry-{number}',
+                'prompt': prompt.strip(),
+                'response': entry.get('response'),
+            })
+    return entries
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Serves POST /v1/messages with the configured response text"""
+
+    # Chunked transfer encoding, like the real API, lets clients read events as they arrive
+    protocol_version = 'HTTP/1.1'
+    response_text = DEFAULT_RESPONSE
+    chunk_size = 16
+    chunk_delay = 0.02
+    first_token_delay = 0.5
+    fail_remaining = 0
+    fail_status = 529
+    retry_after = None
+    fail_lock = threading.Lock()
+    # Prefix hashes seen at cache_control breakpoints, to report cache writes and reads
+    cached_prefixes = set()
+    # Recorded responses by prompt; requests mentioning none of them get response_text
+    recorded_responses = {}
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/messages':
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        with self.fail_lock:
+            failing = FakeAnthropicHandler.fail_remaining > 0
+            if failing:
+                FakeAnthropicHandler.fail_remaining -= 1
+        if failing:
+            self._fail()
+            return
+
+        self.response_text = self._recorded_response(payload)
+        usage = self._usage(payload)
+        # Cached prefix tokens are not re-processed, so they barely add to the first-token delay
+        total = sum(usage.values()) or 1
+        time.sleep(self.first_token_delay * (0.2 + 0.8 * (total - usage['cache_read_input_tokens']) / total))
+        if payload.get('stream'):
+            self._stream(payload, usage)
+        else:
+            self._respond(payload, usage)
+
+    def _recorded_response(self, payload):
+        """The recorded response for the longest corpus prompt quoted in the user message"""
+        if not self.recorded_responses:
+            return self.response_text
+        text = ''
+        for message in payload.get('messages', []):
+            content = message.get('content') or []
+            text += content if isinstance(content, str) else ''.join(block.get('text', '') for block in content)
+        matches = [prompt for prompt in self.recorded_responses if prompt in text]
+        return self.recorded_responses[max(matches, key=len)] if matches else self.response_text
+
+    def _usage(self, payload):
+        """Approximate input usage, splitting off cache_control prefixes written or read before"""
+        system = payload.get('system') or []
+        blocks = [{'text': system}] if isinstance(system, str) else list(system)
+        for message in payload.get('messages', []):
+            content = message.get('content') or []
+            blocks.extend([{'text': content}] if isinstance(content, str) else content)
+
+        prefix = hashlib.sha256()
+        tokens = read = written = 0
+        for block in blocks:
+            prefix.update(json.dumps(block.get('text', ''), ensure_ascii=False).encode('utf-8'))
+            tokens += len(block.get('text', '')) // 4
+            if block.get('cache_control'):
+                with self.fail_lock:
+                    hit = prefix.hexdigest() in FakeAnthropicHandler.cached_prefixes
+                    FakeAnthropicHandler.cached_prefixes.add(prefix.hexdigest())
+                if hit:
+                    read, written = tokens, 0
+                else:
+                    written = tokens - read
+        return {
+            'input_tokens': tokens - read - written,
+            'cache_creation_input_tokens': written,
+            'cache_read_input_tokens': read,
+        }
+
+    def _fail(self):
+        error_type = 'rate_limit_error' if self.fail_status == 429 else 'overloaded_error'
+        body = json.dumps({'type': 'error', 'error': {'type': error_type, 'message': 'Simulated failure'}}).encode('utf-8')
+        self.send_response(self.fail_status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.retry_after is not None:
+            self.send_header('retry-after', str(self.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, payload, usage):
+        body = json.dumps({
+            'id': f'msg_{uuid.uuid4().hex}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': payload.get('model'),
+            'content': [{'type': 'text', 'text': self.response_text}],
+            'stop_reason': 'end_turn',
+            'usage': dict(usage, output_tokens=len(self.response_text) // 4)
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, payload, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        self._event('message_start', {'type': 'message_start', 'message': {
+            'id': f'msg_{uuid.uuid4().hex}', 'type': 'message', 'role': 'assistant',
+            'model': payload.get('model'), 'content': [],
+            'usage': dict(usage, output_tokens=1)
+        }})
+        self._event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                            'content_block': {'type': 'text', 'text': ''}})
+        for start in range(0, len(self.response_text), self.chunk_size):
+            self._event('content_block_delta', {'type': 'content_block_delta', 'index': 0, 'delta': {
+                'type': 'text_delta', 'text': self.response_text[start:start + self.chunk_size]
+            }})
+            time.sleep(self.chunk_delay)
+        self._event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        self._event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'},
+                                      'usage': {'output_tokens': len(self.response_text) // 4}})
+        self._event('message_stop', {'type': 'message_stop'})
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _event(self, name, data):
+        chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        print(f"fake-anthropic: {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Anthropic Messages API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--response', help='File containing the response text to replay')
+    parser.add_argument('--corpus', help='JSONL corpus of prompts with recorded responses')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Characters per streamed delta')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Seconds between streamed deltas')
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help='Seconds before the first byte')
+    parser.add_argument('--fail-count', type=int, default=0, help='Number of initial requests to reject')
+    parser.add_argument('--fail-status', type=int, default=529, help='HTTP status for rejected requests')
+    parser.add_argument('--retry-after', type=float, help='retry-after seconds sent with rejections')
+    args = parser.parse_args()
+
+    if args.response:
+        with open(args.response, 'r', encoding='utf-8') as f:
+            FakeAnthropicHandler.response_text = f.read()
+    if args.corpus:
+        FakeAnthropicHandler.recorded_responses = {
+            entry['prompt']: entry['response'] for entry in load_corpus(args.corpus) if entry['response']
+        }
+    FakeAnthropicHandler.chunk_size = args.chunk_size
+    FakeAnthropicHandler.chunk_delay = args.chunk_delay
+    FakeAnthropicHandler.first_token_delay = args.first_token_delay
+    FakeAnthropicHandler.fail_remaining = args.fail_count
+    FakeAnthropicHandler.fail_status = args.fail_status
+    FakeAnthropicHandler.retry_after = args.retry_after
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeAnthropicHandler)
+    print(f"Fake Anthropic API listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
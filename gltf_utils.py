@@ -0,0 +1,170 @@
+"""
+GLTF/GLB helpers for CADAgent PRO
+Packs CadQuery's .gltf + .bin output into a single binary GLB and converts
+GLB back to a self-contained GLTF JSON string for legacy clients
+"""
+
+import base64
+import io
+import json
+import os
+import struct
+from typing import BinaryIO, Dict, Any, Iterator, List, Tuple
+
+GLB_MAGIC = 0x46546C67  # 'glTF'
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A  # 'JSON'
+CHUNK_BIN = 0x004E4942  # 'BIN\0'
+
+# BIN bytes base64-encoded per piece of an embedded GLTF; a multiple of 3 so the pieces
+# concatenate into one valid base64 string
+EMBED_CHUNK_BYTES = 48 * 1024
+# Stands in for the data URI while the rest of the document is serialized
+_EMBEDDED_URI_PLACEHOLDER = '\0embedded-buffer\0'
+
+
+def _pad(data: bytes, fill: bytes) -> bytes:
+    """Pad data to the 4-byte alignment GLB chunks require"""
+    remainder = len(data) % 4
+    return data + fill * (4 - remainder) if remainder else data
+
+
+def pack_glb(gltf_json: Dict[str, Any], buffers: List[bytes]) -> bytes:
+    """
+    Build a GLB from a GLTF document and the contents of its buffers.
+    All buffers are merged into the single BIN chunk and bufferViews are re-pointed at it.
+    """
+    gltf_json = dict(gltf_json)
+    bin_chunk = b''
+    offsets = []
+    for data in buffers:
+        bin_chunk = _pad(bin_chunk, b'\0')
+        offsets.append(len(bin_chunk))
+        bin_chunk += data
+
+    if buffers:
+        gltf_json['bufferViews'] = [
+            dict(view, buffer=0, byteOffset=view.get('byteOffset', 0) + offsets[view.get('buffer', 0)])
+            for view in gltf_json.get('bufferViews', [])
+        ]
+        gltf_json['buffers'] = [{'byteLength': len(bin_chunk)}]
+    else:
+        gltf_json.pop('buffers', None)
+
+    json_chunk = _pad(json.dumps(gltf_json, separators=(',', ':'), ensure_ascii=False).encode('utf-8'), b' ')
+    bin_chunk = _pad(bin_chunk, b'\0')
+
+    total_length = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if buffers else 0)
+    parts = [
+        struct.pack('<III', GLB_MAGIC, GLB_VERSION, total_length),
+        struct.pack('<II', len(json_chunk), CHUNK_JSON),
+        json_chunk,
+    ]
+    if buffers:
+        parts += [struct.pack('<II', len(bin_chunk), CHUNK_BIN), bin_chunk]
+    return b''.join(parts)
+
+
+def unpack_glb(glb: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """Split a GLB into its GLTF document and BIN chunk"""
+    magic, version, total_length = struct.unpack_from('<III', glb, 0)
+    if magic != GLB_MAGIC or version != GLB_VERSION:
+        raise ValueError("Not a glTF 2.0 binary file")
+
+    gltf_json = None
+    bin_chunk = b''
+    offset = 12
+    while offset < min(total_length, len(glb)):
+        chunk_length, chunk_type = struct.unpack_from('<II', glb, offset)
+        chunk = glb[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == CHUNK_JSON:
+            gltf_json = json.loads(chunk.decode('utf-8'))
+        elif chunk_type == CHUNK_BIN:
+            bin_chunk = chunk
+        offset += 8 + chunk_length
+
+    if gltf_json is None:
+        raise ValueError("GLB has no JSON chunk")
+    return gltf_json, bin_chunk
+
+
+def gltf_file_to_glb(gltf_path: str) -> bytes:
+    """Read a .gltf (or .glb) written by CadQuery, resolving external and data-URI buffers"""
+    with open(gltf_path, 'rb') as f:
+        content = f.read()
+    if content[:4] == b'glTF':
+        return content
+
+    gltf_json = json.loads(content.decode('utf-8'))
+    base_dir = os.path.dirname(gltf_path) or '.'
+    buffers = []
+    for buffer in gltf_json.get('buffers', []):
+        uri = buffer.get('uri', '')
+        if uri.startswith('data:'):
+            buffers.append(base64.b64decode(uri.split(',', 1)[1]))
+        else:
+            with open(os.path.join(base_dir, uri), 'rb') as f:
+                buffers.append(f.read())
+    return pack_glb(gltf_json, buffers)
+
+
+def read_glb_layout(f: BinaryIO) -> Tuple[Dict[str, Any], int, int]:
+    """
+    Read the GLTF document of a GLB file object and locate its BIN chunk without reading it.
+    Returns (document, BIN offset, BIN length); the length is 0 when there is no BIN chunk.
+    """
+    magic, version, total_length = struct.unpack('<III', f.read(12))
+    if magic != GLB_MAGIC or version != GLB_VERSION:
+        raise ValueError("Not a glTF 2.0 binary file")
+
+    gltf_json = None
+    bin_offset = bin_length = 0
+    offset = 12
+    while offset + 8 <= total_length:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        chunk_length, chunk_type = struct.unpack('<II', header)
+        if chunk_type == CHUNK_JSON:
+            gltf_json = json.loads(f.read(chunk_length).decode('utf-8'))
+        elif chunk_type == CHUNK_BIN:
+            bin_offset, bin_length = offset + 8, chunk_length
+        offset += 8 + chunk_length
+
+    if gltf_json is None:
+        raise ValueError("GLB has no JSON chunk")
+    return gltf_json, bin_offset, bin_length
+
+
+def iter_embedded_gltf(f: BinaryIO, chunk_bytes: int = EMBED_CHUNK_BYTES) -> Iterator[str]:
+    """
+    Produce the text of glb_to_embedded_gltf piece by piece from a GLB file object. The BIN
+    chunk is read and base64-encoded chunk_bytes at a time, so neither it nor the data URI
+    is ever held whole.
+    """
+    gltf_json, bin_offset, bin_length = read_glb_layout(f)
+    if not gltf_json.get('buffers'):
+        yield json.dumps(gltf_json, separators=(',', ':'), ensure_ascii=False)
+        return
+
+    gltf_json['buffers'][0]['uri'] = _EMBEDDED_URI_PLACEHOLDER
+    text = json.dumps(gltf_json, separators=(',', ':'), ensure_ascii=False)
+    head, tail = text.split(json.dumps(_EMBEDDED_URI_PLACEHOLDER)[1:-1], 1)
+    yield head + 'data:application/octet-stream;base64,'
+
+    chunk_bytes -= chunk_bytes % 3
+    f.seek(bin_offset)
+    remaining = bin_length
+    while remaining > 0:
+        data = f.read(min(chunk_bytes, remaining))
+        if not data:
+            raise ValueError("GLB BIN chunk is truncated")
+        remaining -= len(data)
+        yield base64.b64encode(data).decode('ascii')
+    yield tail
+
+
+def glb_to_embedded_gltf(glb: bytes) -> str:
+    """Convert a GLB into a GLTF JSON string with its buffer embedded as a data URI"""
+    return ''.join(iter_embedded_gltf(io.BytesIO(glb)))
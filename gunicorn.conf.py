@@ -0,0 +1,113 @@
+"""
+Gunicorn configuration for CADAgent PRO
+Production serving mode: one threaded worker that binds and serves before cadquery/OCP is
+loaded. Its forkserver imports cadquery in the background and forks the CadQuery workers from
+it, so the heavy pages are shared copy-on-write across the pool.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+"""
+
+import gc
+import os
+
+from anthropic_client import ANTHROPIC_TIMEOUT_SECONDS
+from worker_pool import private_memory_bytes
+
+# Memory the deployment may use (the [[vm]] memory_mb in fly.toml), what the shared imports
+# cost once, and what the gunicorn worker may add on top: its own threads and caches
+# (WORKER_SERVING_MB) plus its CadQuery pool (the rest)
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 512))
+SHARED_IMPORTS_MB = int(os.environ.get('GUNICORN_SHARED_IMPORTS_MB', 250))
+WORKER_BUDGET_MB = int(os.environ.get('GUNICORN_WORKER_BUDGET_MB', MEMORY_BUDGET_MB - SHARED_IMPORTS_MB))
+WORKER_SERVING_MB = int(os.environ.get('GUNICORN_WORKER_MAX_RSS_MB', 80))
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (honours affinity masks and cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cpus = available_cpus()
+
+wsgi_app = 'app:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+preload_app = True
+
+# Background jobs and their event streams, plan sessions and the worker pool live in the
+# worker process, and gunicorn cannot send a client back to the worker that holds them, so
+# there is exactly one; its CadQuery pool and threads use the CPUs
+workers = 1
+
+# Requests mostly wait on the LLM or the CadQuery pool, so threads rather than processes
+# give the concurrency; SSE job streams also hold a thread each
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# One CadQuery process per CPU, sharing what the worker's memory budget leaves them
+os.environ.setdefault('CADQUERY_WORKERS', str(cpus))
+os.environ.setdefault('CADQUERY_WORKER_MAX_RSS_MB',
+                      str(max(32, (WORKER_BUDGET_MB - WORKER_SERVING_MB) // int(os.environ['CADQUERY_WORKERS']))))
+
+# A request can spend a full LLM timeout waiting for the API, so in-flight requests get longer
+# than that to finish on shutdown or recycling before being killed
+graceful_timeout = max(int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', ANTHROPIC_TIMEOUT_SECONDS * 2)),
+                       int(ANTHROPIC_TIMEOUT_SECONDS) + 5)
+timeout = graceful_timeout
+keepalive = 5
+
+# Recycle workers after a number of requests (jittered so they do not all restart together)
+# or once their private memory passes a limit
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+worker_max_private_bytes = WORKER_SERVING_MB * 1024 * 1024
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Record when the master has bound the port (workers inherit the phase)"""
+    import app as cadagent
+
+    cadagent.startup_timer.mark('listening')
+
+
+def pre_fork(server, worker):
+    """
+    Move everything the master has allocated out of the collector's reach, so collections
+    in the children do not write to (and so un-share) the inherited pages
+    """
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Warm the worker's CadQuery pool in the background so the worker starts serving at once;
+    the pool's first process starts the forkserver that imports cadquery. The model index is
+    re-read, as a recycled worker's predecessor may have added models since the master indexed
+    the directory.
+    """
+    import app as cadagent
+
+    cadagent.model_cache.reload()
+    cadagent.warm_up_cadquery()
+
+
+def post_request(worker, req, environ, resp):
+    """Retire the worker gracefully once its private memory passes the limit"""
+    private = private_memory_bytes()
+    if worker.alive and private > worker_max_private_bytes:
+        worker.log.info("Worker %s retiring: private memory %d MB over limit",
+                        worker.pid, private // (1024 * 1024))
+        worker.alive = False
+
+
+def worker_exit(server, worker):
+    """Stop the worker's CadQuery pool with it"""
+    import app as cadagent
+
+    cadagent.cadquery_pool.shutdown()
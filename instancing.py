@@ -0,0 +1,222 @@
+"""
+Repeated-part instancing for CADAgent PRO
+Finds solids of an assembly that are rigid copies of one another (patterned bolts, unfused gear
+teeth, repeated plan objects) and rebuilds the assembly so every copy places one shared
+prototype through its node location. OCC then triangulates the prototype once and the GLTF
+writer stores its mesh once for all of the nodes that use it.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Largest point deviation of a copy from the moved prototype, relative to the prototype's size
+MATCH_TOLERANCE = 1e-6
+
+# Copies built separately must also agree on volume to this relative tolerance
+VOLUME_TOLERANCE = 1e-6
+
+# Point distances from the centroid are compared at this resolution (mm) to group candidates
+DISTANCE_DECIMALS = 3
+
+
+def part_solids(cq, obj) -> Optional[List[Any]]:
+    """The solids making up a part, or None when it also holds loose faces, wires or vertices"""
+    from OCP.TopAbs import TopAbs_COMPOUND, TopAbs_SOLID
+    from OCP.TopoDS import TopoDS_Iterator
+
+    if isinstance(obj, cq.Workplane):
+        shapes = [value for value in obj.vals() if isinstance(value, cq.Shape)]
+    elif isinstance(obj, cq.Shape):
+        shapes = [obj]
+    else:
+        return None
+
+    solids = []
+
+    def collect(shape) -> bool:
+        if shape.ShapeType() == TopAbs_SOLID:
+            solids.append(cq.Solid(shape))
+            return True
+        if shape.ShapeType() != TopAbs_COMPOUND:
+            return False
+        # The iterator composes the compound's location into its children
+        iterator = TopoDS_Iterator(shape)
+        while iterator.More():
+            if not collect(iterator.Value()):
+                return False
+            iterator.Next()
+        return True
+
+    if not shapes or not all(collect(shape.wrapped) for shape in shapes):
+        return None
+    return solids
+
+
+def rigid_transform(source: np.ndarray, target: np.ndarray, tolerance: float) -> Optional[np.ndarray]:
+    """
+    4x4 rotation and translation taking each source point onto the target point at the same
+    index (Kabsch), or None when none does within tolerance or the points are too few or
+    collinear to fix the rotation
+    """
+    if len(source) != len(target) or len(source) < 3:
+        return None
+    source_center, target_center = source.mean(axis=0), target.mean(axis=0)
+    a, b = source - source_center, target - target_center
+    if np.linalg.svd(a, compute_uv=False)[1] <= tolerance:
+        return None
+    u, _, vt = np.linalg.svd(a.T @ b)
+    # Only proper rotations: a mirrored copy would need its triangles' winding flipped
+    d = np.sign(np.linalg.det(vt.T @ u.T)) or 1.0
+    rotation = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    if np.abs(a @ rotation.T - b).max() > tolerance:
+        return None
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = target_center - rotation @ source_center
+    return matrix
+
+
+def _volume(solid) -> float:
+    from OCP.BRepGProp import BRepGProp
+    from OCP.GProp import GProp_GProps
+
+    properties = GProp_GProps()
+    BRepGProp.VolumeProperties_s(solid.wrapped, properties)
+    return properties.Mass()
+
+
+class _Prototype:
+    """A solid that copies are matched against, with what the match needs computed once"""
+
+    def __init__(self, solid, points: np.ndarray):
+        self.solid = solid
+        self.points = points
+        self.tolerance = MATCH_TOLERANCE * max(1.0, float(np.ptp(points, axis=0).max()))
+        self._volume = None
+        self.copies = 0
+
+    def match(self, solid, points: np.ndarray) -> Optional[np.ndarray]:
+        """Transform placing this prototype onto solid, if solid is a rigid copy of it"""
+        transform = rigid_transform(self.points, points, self.tolerance)
+        if transform is None or solid.wrapped.IsPartner(self.solid.wrapped):
+            return transform
+        # A few points per edge do not pin down whole curved faces
+        if self._volume is None:
+            self._volume = _volume(self.solid)
+        if abs(self._volume - _volume(solid)) > VOLUME_TOLERANCE * max(abs(self._volume), 1.0):
+            return None
+        return transform
+
+
+def _topology(solid) -> Tuple[np.ndarray, Tuple]:
+    """
+    Points pinning down a solid, in exploration order, which rigid copies share: its vertices
+    and the middle of each edge, which also fixes the rotation of a cylinder or sphere about
+    its axis. Returned with a rigid-motion invariant key; only solids with equal keys are
+    compared point by point.
+    """
+    from OCP.BRep import BRep_Tool
+    from OCP.BRepAdaptor import BRepAdaptor_Curve, BRepAdaptor_Surface
+    from OCP.TopAbs import TopAbs_EDGE, TopAbs_FACE, TopAbs_VERTEX
+    from OCP.TopExp import TopExp
+    from OCP.TopoDS import TopoDS
+    from OCP.TopTools import TopTools_IndexedMapOfShape
+
+    maps = {}
+    for kind in (TopAbs_VERTEX, TopAbs_EDGE, TopAbs_FACE):
+        maps[kind] = TopTools_IndexedMapOfShape()
+        TopExp.MapShapes_s(solid.wrapped, kind, maps[kind])
+    points = [BRep_Tool.Pnt_s(TopoDS.Vertex_s(maps[TopAbs_VERTEX].FindKey(index)))
+              for index in range(1, maps[TopAbs_VERTEX].Extent() + 1)]
+    for index in range(1, maps[TopAbs_EDGE].Extent() + 1):
+        edge = TopoDS.Edge_s(maps[TopAbs_EDGE].FindKey(index))
+        # Degenerate edges (a sphere's poles) have no curve
+        if not BRep_Tool.Degenerated_s(edge):
+            curve = BRepAdaptor_Curve(edge)
+            points.append(curve.Value((curve.FirstParameter() + curve.LastParameter()) / 2))
+    points = np.array([(point.X(), point.Y(), point.Z()) for point in points]).reshape(-1, 3)
+    surfaces = tuple(int(BRepAdaptor_Surface(TopoDS.Face_s(maps[TopAbs_FACE].FindKey(index))).GetType())
+                     for index in range(1, maps[TopAbs_FACE].Extent() + 1))
+    distances = np.sort(np.linalg.norm(points - points.mean(axis=0), axis=1)) if len(points) else points
+    return points, (surfaces, maps[TopAbs_EDGE].Extent(), tuple(np.round(distances, DISTANCE_DECIMALS).tolist()))
+
+
+def _location(cq, matrix: np.ndarray):
+    from OCP.gp import gp_Trsf
+    from OCP.TopLoc import TopLoc_Location
+
+    trsf = gp_Trsf()
+    trsf.SetValues(*matrix[:3].reshape(-1).tolist())
+    return cq.Location(TopLoc_Location(trsf))
+
+
+def instance_repeats(assembly) -> Dict[str, Any]:
+    """
+    Rebuild assembly in place so solids that are rigid copies of another become placements of
+    it: a part holding one copy gets the prototype and a location, a part holding several
+    solids gets one child per solid. Returns counts of the solids seen, the prototypes shared
+    and the copies now placing one.
+    """
+    import cadquery as cq
+
+    nodes = [node for _, node in assembly.traverse()]
+    parts = [(node, solids) for node in nodes for solids in [part_solids(cq, node.obj)] if solids]
+    stats = {'solids': sum(len(solids) for _, solids in parts), 'prototypes': 0, 'instances': 0}
+    if stats['solids'] < 2:
+        return stats
+
+    candidates: Dict[Tuple, List[Tuple[int, int, Any, np.ndarray]]] = {}
+    for part_index, (_, solids) in enumerate(parts):
+        for solid_index, solid in enumerate(solids):
+            points, key = _topology(solid)
+            if len(points) >= 3:
+                candidates.setdefault(key, []).append((part_index, solid_index, solid, points))
+
+    # (part, solid) -> (prototype, transform placing it; None for the prototype itself)
+    placements: Dict[Tuple[int, int], Tuple[_Prototype, Optional[np.ndarray]]] = {}
+    for members in candidates.values():
+        if len(members) < 2:
+            continue
+        prototypes: List[_Prototype] = []
+        for part_index, solid_index, solid, points in members:
+            for prototype in prototypes:
+                transform = prototype.match(solid, points)
+                if transform is not None:
+                    prototype.copies += 1
+                    placements[(part_index, solid_index)] = (prototype, transform)
+                    break
+            else:
+                prototype = _Prototype(solid, points)
+                prototypes.append(prototype)
+                placements[(part_index, solid_index)] = (prototype, None)
+
+    shared = {id(prototype): prototype for prototype, _ in placements.values() if prototype.copies}
+    if not shared:
+        return stats
+    stats['prototypes'] = len(shared)
+    stats['instances'] = sum(prototype.copies for prototype in shared.values())
+
+    names = {node.name for node in nodes}
+    for part_index, (node, solids) in enumerate(parts):
+        placed = [placements.get((part_index, solid_index)) for solid_index in range(len(solids))]
+        placed = [placement if placement and id(placement[0]) in shared else None for placement in placed]
+        if not any(placed):
+            continue
+        if len(solids) == 1:
+            prototype, transform = placed[0]
+            node.obj = prototype.solid
+            if transform is not None:
+                node.loc = node.loc * _location(cq, transform)
+            continue
+
+        node.obj = None
+        for solid_index, (solid, placement) in enumerate(zip(solids, placed)):
+            prototype, transform = placement or (None, None)
+            name = f"{node.name}_{solid_index + 1}"
+            while name in names:
+                name += '_'
+            names.add(name)
+            node.add(prototype.solid if prototype else solid, name=name,
+                     loc=_location(cq, transform) if transform is not None else cq.Location(), color=node.color)
+    return stats
@@ -0,0 +1,177 @@
+"""
+Background generation jobs for CADAgent PRO
+Runs pipeline work on a bounded executor and records stage-by-stage progress
+that clients can poll or stream as Server-Sent Events
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Iterator, List
+
+from logs import in_request_context
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+
+class JobQueueFullError(Exception):
+    """Raised when the executor already holds the maximum number of unfinished jobs"""
+
+
+class Job:
+    """A single background job and its ordered list of progress events"""
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self.changed = threading.Condition()
+
+    def add_event(self, stage: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """Append a stage transition and wake any streaming subscribers"""
+        with self.changed:
+            self.stage = stage
+            self.events.append({'stage': stage, 'time': time.time(), 'data': data or {}})
+            self.changed.notify_all()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """Public representation used by the status endpoint"""
+        with self.changed:
+            job = {
+                'jobId': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'stage': self.stage,
+                'createdAt': self.created_at,
+                'finishedAt': self.finished_at,
+                'stages': [event['stage'] for event in self.events],
+            }
+            if self.error:
+                job['error'] = self.error
+            if include_result and self.result is not None:
+                job['result'] = self.result
+            return job
+
+
+class JobManager:
+    """
+    Bounded background executor for pipeline jobs.
+    At most max_workers jobs run at once and at most max_pending wait behind them;
+    finished jobs are kept for retention_seconds so clients can fetch their results.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, retention_seconds: float):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(0, max_pending)
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline-job')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._unfinished = 0
+
+    @classmethod
+    def from_env(cls) -> 'JobManager':
+        """Build the manager from JOB_* environment variables"""
+        return cls(
+            max_workers=int(os.environ.get('JOB_WORKERS', 4)),
+            max_pending=int(os.environ.get('JOB_MAX_PENDING', 32)),
+            retention_seconds=float(os.environ.get('JOB_RETENTION_SECONDS', 900)),
+        )
+
+    def submit(self, kind: str, params: Dict[str, Any],
+               work: Callable[[Callable[[str, Optional[Dict[str, Any]]], None]], Dict[str, Any]]) -> Job:
+        """Queue work(on_stage) in the background and return its job immediately"""
+        self._purge_expired()
+        job = Job(kind, params)
+        with self._lock:
+            if self._unfinished >= self.max_workers + self.max_pending:
+                raise JobQueueFullError("Too many generation jobs in progress, try again shortly")
+            self._unfinished += 1
+            self._jobs[job.id] = job
+
+        job.add_event('queued')
+        self._executor.submit(in_request_context(self._run), job, work)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return executor occupancy"""
+        with self._lock:
+            return {
+                'unfinished': self._unfinished,
+                'tracked': len(self._jobs),
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+            }
+
+    def stream_events(self, job: Job, start_index: int = 0, heartbeat_seconds: float = 15.0) -> Iterator[str]:
+        """Yield Server-Sent Events for a job from start_index until it finishes"""
+        index = start_index
+        while True:
+            with job.changed:
+                if index >= len(job.events) and job.status not in TERMINAL_STATUSES:
+                    job.changed.wait(timeout=heartbeat_seconds)
+                pending = job.events[index:]
+                finished = job.status in TERMINAL_STATUSES
+
+            if not pending and not finished:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+
+            for event in pending:
+                payload = json.dumps(dict(event['data'], stage=event['stage'], time=event['time']),
+                                     separators=(',', ':'), ensure_ascii=False)
+                yield f"id: {index}\nevent: {event['stage']}\ndata: {payload}\n\n"
+                index += 1
+
+            if finished and index >= len(job.events):
+                return
+
+    def _run(self, job: Job, work: Callable) -> None:
+        with job.changed:
+            job.status = 'running'
+        try:
+            result = work(job.add_event)
+            self._finish(job, result=result, error=result.get('error'),
+                         succeeded=bool(result.get('success')))
+        except Exception as e:
+            logger.exception("Job failed", extra={'job_id': job.id})
+            self._finish(job, result=None, error=str(e), succeeded=False)
+        finally:
+            with self._lock:
+                self._unfinished -= 1
+
+    def _finish(self, job: Job, result: Optional[Dict[str, Any]], error: Optional[str], succeeded: bool) -> None:
+        # Status and the terminal event are published together so streams never miss it
+        with job.changed:
+            job.result = result
+            job.error = error
+            job.status = 'succeeded' if succeeded else 'failed'
+            job.finished_at = time.time()
+            job.add_event('completed' if succeeded else 'failed', {'error': error} if error else None)
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
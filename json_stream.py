@@ -0,0 +1,59 @@
+"""
+Streaming JSON writer for CADAgent PRO
+Encodes a response object as a sequence of byte chunks for chunked transfer. Small fields
+are written directly; a StreamedString field (the embedded GLTF) is escaped and written
+piece by piece as it is produced, so the body is never held in memory as a whole.
+"""
+
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+# Encoded bytes gathered before a chunk is handed to the server
+RESPONSE_CHUNK_BYTES = 64 * 1024
+
+
+class StreamedString:
+    """A JSON string value produced in pieces of raw (unescaped) text"""
+
+    def __init__(self, pieces: Iterable[str]):
+        self.pieces = pieces
+
+
+def iter_json_object(fields: Dict[str, Any], chunk_bytes: int = RESPONSE_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Encode fields as a compact JSON object, the same text json.dumps(separators=(',', ':'),
+    ensure_ascii=False) gives, in chunks of about chunk_bytes
+    """
+    buffer = []
+    buffered = 0
+
+    def write(text: str):
+        nonlocal buffered
+        data = text.encode('utf-8')
+        buffer.append(data)
+        buffered += len(data)
+
+    def flush() -> bytes:
+        nonlocal buffered
+        chunk = b''.join(buffer)
+        buffer.clear()
+        buffered = 0
+        return chunk
+
+    write('{')
+    for index, (name, value) in enumerate(fields.items()):
+        write((',' if index else '') + json.dumps(str(name), ensure_ascii=False) + ':')
+        if isinstance(value, StreamedString):
+            write('"')
+            for piece in value.pieces:
+                # Escaping is per character, so escaped pieces concatenate to the escaped whole
+                write(json.dumps(piece, ensure_ascii=False)[1:-1])
+                if buffered >= chunk_bytes:
+                    yield flush()
+            write('"')
+        else:
+            write(json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+        if buffered >= chunk_bytes:
+            yield flush()
+    write('}')
+    yield flush()
@@ -0,0 +1,185 @@
+"""
+Structured logging for CADAgent PRO
+Leveled JSON (or text) log lines tagged with the current request id. Records are handed to
+a background thread through a queue, so logging never blocks a request on stdout, and
+payload-sized dumps are only built at DEBUG, for a sampled fraction of calls.
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+# Fraction of debug_payload calls that are actually logged, and how much of each payload
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.1))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', 4000))
+
+# Id of the request being handled; copied into threads and worker jobs that act for it
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id() -> str:
+    """Short random id for a request that did not bring one"""
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """Fields passed through extra={...}"""
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES}
+
+
+class RequestIdFilter(logging.Filter):
+    """Tag each record with the request id of the context that logged it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if record.request_id:
+            entry['request_id'] = record.request_id
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = (f"{self.formatTime(record)} {record.levelname} [{record.request_id or '-'}] "
+                f"{record.name}: {record.getMessage()}")
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler whose listener thread does all formatting and writing. The listener is
+    started lazily in each process that logs and stopped around fork(), so a child never
+    inherits a half-written stream or a dead thread.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        os.register_at_fork(before=self.stop, after_in_parent=self._restart, after_in_child=self._forget)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record stays in this process, so message and traceback formatting can wait for the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._listener_pid != os.getpid():
+            self._start()
+        super().enqueue(record)
+
+    def close(self) -> None:
+        # logging.shutdown() closes handlers at exit; flush what is still queued first
+        self.stop()
+        super().close()
+
+    def stop(self) -> None:
+        """Drain the queue and stop the listener (it restarts on the next record)"""
+        with self._listener_lock:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+
+    def _start(self) -> None:
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def _restart(self) -> None:
+        # Records logged while forking are still queued; a listener picks them up
+        if not self.queue.empty():
+            self._start()
+
+    def _forget(self) -> None:
+        self._listener_lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+
+
+_configured = False
+
+
+def configure_logging() -> None:
+    """Route all logging through one background queue handler (idempotent per process)"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+    handler = BackgroundQueueHandler(target)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+
+
+def debug_payload(logger: logging.Logger, message: str, **payloads: Any) -> None:
+    """
+    Log large values (plans, code, responses) at DEBUG for a sampled fraction of calls.
+    Callables are only invoked when the line is actually logged, and each value is truncated,
+    so at INFO no payload is ever formatted.
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    fields = {}
+    for name, value in payloads.items():
+        value = value() if callable(value) else value
+        text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+        fields[name] = text if len(text) <= LOG_PAYLOAD_MAX_CHARS else text[:LOG_PAYLOAD_MAX_CHARS] + '...'
+    logger.debug(message, extra=fields)
+
+
+def in_request_context(fn: Callable) -> Callable:
+    """Wrap fn to run with the caller's request id, for handing work to another thread"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
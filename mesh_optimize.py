@@ -0,0 +1,307 @@
+"""
+Mesh post-processing for CADAgent PRO
+Welds duplicate vertices, merges per-face primitives, reorders triangles and vertices
+for cache locality, shares one mesh between nodes placing the same geometry and optionally
+quantizes attributes (KHR_mesh_quantization)
+"""
+
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from gltf_utils import pack_glb, unpack_glb
+
+COMPONENT_DTYPES = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4}
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+TRIANGLES = 4
+
+# Weld tolerances: positions relative to the mesh diagonal, unit normals and other attributes absolute
+POSITION_WELD_EPSILON = 1e-6
+NORMAL_WELD_STEPS = 1e3
+ATTRIBUTE_WELD_STEPS = 1e5
+
+
+class BufferWriter:
+    """Accumulates the new BIN chunk together with its bufferViews and accessors"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.length = 0
+        self.buffer_views: List[Dict[str, Any]] = []
+        self.accessors: List[Dict[str, Any]] = []
+
+    def add(self, data: np.ndarray, component_type: int, accessor_type: str, count: int,
+            target: int, byte_stride: int = None, normalized: bool = False, bounds: bool = False) -> int:
+        raw = np.ascontiguousarray(data).tobytes()
+        padding = (-self.length) % 4
+        if padding:
+            self.chunks.append(b'\0' * padding)
+            self.length += padding
+
+        view = {'buffer': 0, 'byteOffset': self.length, 'byteLength': len(raw), 'target': target}
+        if byte_stride:
+            view['byteStride'] = byte_stride
+        self.buffer_views.append(view)
+        self.chunks.append(raw)
+        self.length += len(raw)
+
+        accessor = {
+            'bufferView': len(self.buffer_views) - 1,
+            'componentType': component_type,
+            'count': count,
+            'type': accessor_type,
+        }
+        if normalized:
+            accessor['normalized'] = True
+        if bounds:
+            components = TYPE_SIZES[accessor_type]
+            values = data.reshape(count, -1)[:, :components]
+            accessor['min'] = values.min(axis=0).tolist()
+            accessor['max'] = values.max(axis=0).tolist()
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def data(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+def _read_accessor(gltf_json: Dict[str, Any], bin_chunk: bytes, index: int) -> np.ndarray:
+    accessor = gltf_json['accessors'][index]
+    view = gltf_json['bufferViews'][accessor['bufferView']]
+    dtype = np.dtype(COMPONENT_DTYPES[accessor['componentType']]).newbyteorder('<')
+    components = TYPE_SIZES[accessor['type']]
+    stride = view.get('byteStride') or dtype.itemsize * components
+    offset = view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+    array = np.ndarray(
+        shape=(accessor['count'], components),
+        dtype=dtype,
+        buffer=bin_chunk,
+        offset=offset,
+        strides=(stride, dtype.itemsize),
+    )
+    return np.array(array)
+
+
+def _is_supported(gltf_json: Dict[str, Any]) -> bool:
+    """Only plain triangle meshes with float attributes are rewritten"""
+    if any(gltf_json.get(key) for key in ('images', 'textures', 'skins', 'animations')):
+        return False
+    if not gltf_json.get('meshes'):
+        return False
+    for mesh in gltf_json['meshes']:
+        for primitive in mesh['primitives']:
+            if primitive.get('mode', TRIANGLES) != TRIANGLES or primitive.get('targets'):
+                return False
+            if 'POSITION' not in primitive.get('attributes', {}):
+                return False
+            for accessor_index in primitive['attributes'].values():
+                accessor = gltf_json['accessors'][accessor_index]
+                if accessor['componentType'] != 5126 or accessor.get('sparse') or 'bufferView' not in accessor:
+                    return False
+    return True
+
+
+def _morton_order(centroids: np.ndarray) -> np.ndarray:
+    """Triangle order along a 3D Z-order curve of their centroids"""
+    low = centroids.min(axis=0)
+    extent = np.maximum(centroids.max(axis=0) - low, 1e-12)
+    cells = ((centroids - low) / extent * 1023).astype(np.uint64)
+
+    def spread(bits: np.ndarray) -> np.ndarray:
+        bits = (bits | (bits << np.uint64(16))) & np.uint64(0x030000FF)
+        bits = (bits | (bits << np.uint64(8))) & np.uint64(0x0300F00F)
+        bits = (bits | (bits << np.uint64(4))) & np.uint64(0x030C30C3)
+        bits = (bits | (bits << np.uint64(2))) & np.uint64(0x09249249)
+        return bits
+
+    codes = spread(cells[:, 0]) | (spread(cells[:, 1]) << np.uint64(1)) | (spread(cells[:, 2]) << np.uint64(2))
+    return np.argsort(codes, kind='stable')
+
+
+def _optimize_group(attributes: Dict[str, np.ndarray], indices: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Weld, drop degenerate triangles and reorder one merged primitive"""
+    positions = attributes['POSITION']
+    diagonal = float(np.linalg.norm(positions.max(axis=0) - positions.min(axis=0))) or 1.0
+
+    keys = [np.round(positions / (diagonal * POSITION_WELD_EPSILON))]
+    for name, values in attributes.items():
+        if name == 'NORMAL':
+            keys.append(np.round(values * NORMAL_WELD_STEPS))
+        elif name != 'POSITION':
+            keys.append(np.round(values * ATTRIBUTE_WELD_STEPS))
+    _, first, inverse = np.unique(np.hstack(keys).astype(np.int64), axis=0, return_index=True, return_inverse=True)
+    attributes = {name: values[first] for name, values in attributes.items()}
+    triangles = inverse.reshape(-1)[indices].reshape(-1, 3)
+
+    # Welding can collapse slivers into degenerate triangles
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    triangles = triangles[(a != b) & (b != c) & (a != c)]
+    if not len(triangles):
+        return attributes, triangles.reshape(-1)
+
+    # Spatially coherent triangle order, then vertices in order of first use
+    triangles = triangles[_morton_order(attributes['POSITION'][triangles].mean(axis=1))]
+    used, first_use = np.unique(triangles.reshape(-1), return_index=True)
+    vertex_order = used[np.argsort(first_use, kind='stable')]
+    remap = np.empty(len(attributes['POSITION']), dtype=np.int64)
+    remap[vertex_order] = np.arange(len(vertex_order))
+    attributes = {name: values[vertex_order] for name, values in attributes.items()}
+    return attributes, remap[triangles].reshape(-1)
+
+
+def _write_group(writer: BufferWriter, attributes: Dict[str, np.ndarray], indices: np.ndarray,
+                 quantization: Tuple[np.ndarray, float] = None) -> Dict[str, int]:
+    count = len(attributes['POSITION'])
+    accessors = {}
+    for name, values in attributes.items():
+        if quantization and name == 'POSITION':
+            center, scale = quantization
+            quantized = np.zeros((count, 4), dtype='<i2')
+            quantized[:, :3] = np.round((values - center) / scale)
+            # SHORT VEC3 is padded to a 4-byte aligned stride
+            accessors[name] = writer.add(quantized, 5122, 'VEC3', count, ARRAY_BUFFER, byte_stride=8, bounds=True)
+        elif quantization and name == 'NORMAL':
+            quantized = np.zeros((count, 4), dtype='i1')
+            quantized[:, :3] = np.round(np.clip(values, -1.0, 1.0) * 127)
+            accessors[name] = writer.add(quantized, 5120, 'VEC3', count, ARRAY_BUFFER, byte_stride=4, normalized=True)
+        else:
+            accessor_type = {1: 'SCALAR', 2: 'VEC2', 3: 'VEC3', 4: 'VEC4'}[values.shape[1]]
+            accessors[name] = writer.add(values.astype('<f4'), 5126, accessor_type, count, ARRAY_BUFFER,
+                                         bounds=(name == 'POSITION'))
+
+    if count <= 0xFFFF:
+        index_data, index_type = indices.astype('<u2'), 5123
+    else:
+        index_data, index_type = indices.astype('<u4'), 5125
+    accessors['__indices__'] = writer.add(index_data, index_type, 'SCALAR', len(indices), ELEMENT_ARRAY_BUFFER)
+    return accessors
+
+
+def optimize_glb(glb: bytes, quantize: bool = False) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Post-process a GLB: merge compatible primitives, weld duplicate vertices, reorder for
+    vertex-cache and fetch locality and optionally quantize positions/normals to int16/int8.
+    Meshes built from the same accessors (instances of one part) are processed and written once.
+    Returns the new GLB (or the original if nothing was gained) and before/after statistics.
+    """
+    gltf_json, bin_chunk = unpack_glb(glb)
+    stats = {'bytes_before': len(glb), 'bytes_after': len(glb), 'optimized': False, 'quantized': False}
+    if not _is_supported(gltf_json):
+        return glb, stats
+
+    writer = BufferWriter()
+    vertices_before = vertices_after = primitives_before = primitives_after = 0
+    dequantize = {}
+    meshes = []
+    # The GLTF writer gives every instance of a part its own mesh over the same accessors;
+    # old mesh index -> new one, so those collapse into a single mesh
+    mesh_indices = {}
+    shared_meshes: Dict[Tuple, int] = {}
+
+    for old_index, mesh in enumerate(gltf_json['meshes']):
+        mesh_key = tuple((primitive.get('material'), tuple(sorted(primitive['attributes'].items())), primitive.get('indices'))
+                         for primitive in mesh['primitives'])
+        if mesh_key in shared_meshes:
+            mesh_indices[old_index] = shared_meshes[mesh_key]
+            continue
+        mesh_index = shared_meshes[mesh_key] = mesh_indices[old_index] = len(meshes)
+
+        # CadQuery writes one primitive per B-rep face; merge those sharing material and layout
+        groups: 'OrderedDict[Tuple, List[Dict[str, Any]]]' = OrderedDict()
+        for primitive in mesh['primitives']:
+            key = (primitive.get('material'), tuple(sorted(primitive['attributes'])))
+            groups.setdefault(key, []).append(primitive)
+            primitives_before += 1
+
+        merged = []
+        for (material, names), primitives in groups.items():
+            attributes = {name: [] for name in names}
+            indices = []
+            offset = 0
+            for primitive in primitives:
+                count = gltf_json['accessors'][primitive['attributes']['POSITION']]['count']
+                for name in names:
+                    attributes[name].append(_read_accessor(gltf_json, bin_chunk, primitive['attributes'][name]))
+                if 'indices' in primitive:
+                    indices.append(_read_accessor(gltf_json, bin_chunk, primitive['indices']).reshape(-1).astype(np.int64) + offset)
+                else:
+                    indices.append(np.arange(count, dtype=np.int64) + offset)
+                offset += count
+            vertices_before += offset
+            attributes = {name: np.concatenate(values).astype(np.float64) for name, values in attributes.items()}
+            attributes, indices = _optimize_group(attributes, np.concatenate(indices))
+            if len(indices):
+                merged.append((material, attributes, indices))
+
+        quantization = None
+        if quantize and merged:
+            # One uniform grid per mesh keeps normals valid under the dequantization transform
+            all_positions = np.concatenate([attributes['POSITION'] for _, attributes, _ in merged])
+            low, high = all_positions.min(axis=0), all_positions.max(axis=0)
+            center = (low + high) / 2
+            scale = float(np.max(high - low) / 2 / 32767) or 1.0
+            quantization = (center, scale)
+            dequantize[mesh_index] = quantization
+
+        new_primitives = []
+        for material, attributes, indices in merged:
+            accessors = _write_group(writer, attributes, indices, quantization)
+            primitive = {
+                'attributes': {name: accessors[name] for name in attributes},
+                'indices': accessors['__indices__'],
+                'mode': TRIANGLES,
+            }
+            if material is not None:
+                primitive['material'] = material
+            new_primitives.append(primitive)
+            vertices_after += len(attributes['POSITION'])
+        primitives_after += len(new_primitives)
+        meshes.append(dict(mesh, primitives=new_primitives))
+
+    gltf_json['meshes'] = meshes
+    gltf_json['accessors'] = writer.accessors
+    gltf_json['bufferViews'] = writer.buffer_views
+    for node in gltf_json.get('nodes', []):
+        if 'mesh' in node:
+            node['mesh'] = mesh_indices[node['mesh']]
+
+    if dequantize:
+        # Quantized meshes hang under a child node carrying the dequantization transform
+        nodes = gltf_json.setdefault('nodes', [])
+        for node in list(nodes):
+            mesh_index = node.get('mesh')
+            if mesh_index not in dequantize:
+                continue
+            center, scale = dequantize[mesh_index]
+            nodes.append({'mesh': node.pop('mesh'), 'translation': center.tolist(), 'scale': [scale] * 3})
+            node.setdefault('children', []).append(len(nodes) - 1)
+        for key in ('extensionsUsed', 'extensionsRequired'):
+            extensions = gltf_json.setdefault(key, [])
+            if 'KHR_mesh_quantization' not in extensions:
+                extensions.append('KHR_mesh_quantization')
+
+    optimized = pack_glb(gltf_json, [writer.data()])
+    stats.update(
+        vertices_before=vertices_before,
+        vertices_after=vertices_after,
+        primitives_before=primitives_before,
+        primitives_after=primitives_after,
+        meshes_before=len(mesh_indices),
+        meshes_after=len(meshes),
+    )
+    if len(optimized) >= len(glb):
+        return glb, stats
+
+    stats.update(bytes_after=len(optimized), optimized=True, quantized=bool(dequantize))
+    return optimized, stats
@@ -0,0 +1,400 @@
+"""
+jsonPlan compiler for CADAgent PRO
+Builds geometry straight from the structured jsonPlan through fixed dispatch tables
+of object builders and operations, so supported plans never exec generated code
+"""
+
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, MutableMapping, Optional, Tuple
+
+IDENTITY_TRANSFORM = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+
+EDGE_SELECTORS = {
+    'all': None,
+    'vertical': '|Z',
+    'horizontal': '#Z',
+    'top': '>Z',
+    'bottom': '<Z',
+}
+
+
+class PlanError(ValueError):
+    """Raised for a jsonPlan the builder cannot compile"""
+
+
+def number_param(params: Dict[str, Any], name: str, default: float = None) -> float:
+    value = params.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise PlanError(f"Parameter '{name}' must be a number, got {value!r}")
+    return float(value)
+
+
+def positive_param(params: Dict[str, Any], name: str) -> float:
+    value = number_param(params, name)
+    if value <= 0:
+        raise PlanError(f"Parameter '{name}' must be positive, got {value}")
+    return value
+
+
+def vector_param(value: Any, name: str) -> Tuple[float, float, float]:
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise PlanError(f"'{name}' must be a list of three numbers, got {value!r}")
+    return tuple(number_param({name: component}, name) for component in value)
+
+
+# Object builders: (cq, params) -> cq.Shape. Solids follow the placement of the prompt's
+# safe CadQuery patterns: box/cylinder/sphere centered, tapered shapes standing on z=0.
+
+def _build_box(cq, params: Dict[str, Any]):
+    return cq.Workplane('XY').box(positive_param(params, 'width'), positive_param(params, 'depth'), positive_param(params, 'height')).val()
+
+
+def _build_cylinder(cq, params: Dict[str, Any]):
+    return cq.Workplane('XY').cylinder(positive_param(params, 'height'), positive_param(params, 'radius')).val()
+
+
+def _build_sphere(cq, params: Dict[str, Any]):
+    return cq.Workplane('XY').sphere(positive_param(params, 'radius')).val()
+
+
+def _build_cone(cq, params: Dict[str, Any]):
+    bottom_radius = number_param(params, 'bottomRadius')
+    top_radius = number_param(params, 'topRadius', 0)
+    if bottom_radius < 0 or top_radius < 0 or bottom_radius == top_radius == 0:
+        raise PlanError("Cone radii must be non-negative and not both zero")
+    return cq.Solid.makeCone(bottom_radius, top_radius, positive_param(params, 'height'))
+
+
+def _build_pyramid(cq, params: Dict[str, Any]):
+    from OCP.BRepBuilderAPI import BRepBuilderAPI_MakeVertex
+    from OCP.BRepOffsetAPI import BRepOffsetAPI_ThruSections
+    from OCP.gp import gp_Pnt
+
+    width, depth, height = positive_param(params, 'width'), positive_param(params, 'depth'), positive_param(params, 'height')
+    base = cq.Wire.makePolygon([
+        cq.Vector(-width / 2, -depth / 2, 0), cq.Vector(width / 2, -depth / 2, 0),
+        cq.Vector(width / 2, depth / 2, 0), cq.Vector(-width / 2, depth / 2, 0),
+    ], close=True)
+    # Lofting the base to a vertex gives a true apex rather than a near-degenerate taper
+    builder = BRepOffsetAPI_ThruSections(True, True)
+    builder.AddWire(base.wrapped)
+    builder.AddVertex(BRepBuilderAPI_MakeVertex(gp_Pnt(0, 0, height)).Vertex())
+    builder.Build()
+    return cq.Solid(builder.Shape())
+
+
+def _profile_points(profile: Dict[str, Any]) -> List[Tuple[float, float]]:
+    """Outline of a rectangular or polygonal section in its own plane"""
+    if 'points' in profile:
+        points = profile['points']
+        if not isinstance(points, list) or len(points) < 3:
+            raise PlanError("Profile 'points' must list at least three [x, y] points")
+        return [(number_param({'x': p[0]}, 'x'), number_param({'y': p[1]}, 'y')) for p in points]
+    if 'sides' in profile:
+        sides = int(positive_param(profile, 'sides'))
+        radius = positive_param(profile, 'radius')
+        return [(radius * math.cos(2 * math.pi * i / sides), radius * math.sin(2 * math.pi * i / sides))
+                for i in range(sides)]
+    width = positive_param(profile, 'width')
+    depth = positive_param(profile, 'depth') if 'depth' in profile else positive_param(profile, 'height')
+    return [(-width / 2, -depth / 2), (width / 2, -depth / 2), (width / 2, depth / 2), (-width / 2, depth / 2)]
+
+
+def _profile_wire(cq, profile: Dict[str, Any]):
+    if not isinstance(profile, dict):
+        raise PlanError(f"Loft profile must be an object, got {profile!r}")
+    position = profile.get('position', profile.get('z', profile.get('offset', 0)))
+    if isinstance(position, (list, tuple)):
+        origin = vector_param(position, 'position')
+    else:
+        origin = (0.0, 0.0, number_param({'position': position}, 'position'))
+
+    if 'radius' in profile and 'sides' not in profile and 'points' not in profile:
+        return cq.Wire.makeCircle(positive_param(profile, 'radius'), cq.Vector(*origin), cq.Vector(0, 0, 1))
+
+    # Rotating successive sections about Z is how twisted prisms are described
+    angle = math.radians(number_param(profile, 'rotation', 0))
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    return cq.Wire.makePolygon([
+        cq.Vector(origin[0] + x * cos_a - y * sin_a, origin[1] + x * sin_a + y * cos_a, origin[2])
+        for x, y in _profile_points(profile)
+    ], close=True)
+
+
+def _build_loft(cq, params: Dict[str, Any]):
+    profiles = params.get('profiles')
+    if not isinstance(profiles, list) or len(profiles) < 2:
+        raise PlanError("Loft needs at least two profiles")
+    return cq.Solid.makeLoft([_profile_wire(cq, profile) for profile in profiles], bool(params.get('ruled', False)))
+
+
+def _build_extrude(cq, params: Dict[str, Any]):
+    height = positive_param(params, 'height')
+    profile = params.get('profile', params)
+    if not isinstance(profile, dict):
+        raise PlanError(f"Extrude profile must be an object, got {profile!r}")
+
+    workplane = cq.Workplane('XY')
+    if 'radius' in profile and 'sides' not in profile and 'points' not in profile:
+        sketch = workplane.circle(positive_param(profile, 'radius'))
+    else:
+        sketch = workplane.polyline(_profile_points(profile)).close()
+
+    twist = number_param(params, 'twist', 0)
+    if twist:
+        return sketch.twistExtrude(height, twist).val()
+    return sketch.extrude(height, taper=number_param(params, 'taper', 0)).val()
+
+
+# type -> (builder, numeric parameters that must be present)
+OBJECT_BUILDERS = {
+    'Box': (_build_box, ('width', 'height', 'depth')),
+    'Cylinder': (_build_cylinder, ('radius', 'height')),
+    'Sphere': (_build_sphere, ('radius',)),
+    'Cone': (_build_cone, ('bottomRadius', 'height')),
+    'Pyramid': (_build_pyramid, ('width', 'depth', 'height')),
+    'Loft': (_build_loft, ()),
+    'Extrude': (_build_extrude, ('height',)),
+}
+
+
+def transform_rows(transform: Any) -> List[List[float]]:
+    """Validate a 4x4 matrix, accepting translation in either the last column or the last row"""
+    if (not isinstance(transform, list) or len(transform) != 4
+            or any(not isinstance(row, list) or len(row) != 4 for row in transform)):
+        raise PlanError(f"Transform must be a 4x4 matrix, got {transform!r}")
+    rows = [[number_param({'transform': value}, 'transform') for value in row] for row in transform]
+    if any(rows[3][:3]) and not any(rows[i][3] for i in range(3)):
+        rows = [list(column) for column in zip(*rows)]
+    return rows
+
+
+def _apply_transform(cq, shape, transform: Any):
+    if transform is None or transform == IDENTITY_TRANSFORM:
+        return shape
+    rows = transform_rows(transform)
+    if rows == IDENTITY_TRANSFORM:
+        return shape
+    rotation = [row[:3] for row in rows[:3]]
+    rigid = all(
+        abs(sum(rotation[i][k] * rotation[j][k] for k in range(3)) - (1.0 if i == j else 0.0)) < 1e-6
+        for i in range(3) for j in range(3)
+    )
+    if not rigid:
+        # Scaling or shear needs the general (geometry-converting) transform
+        return shape.transformGeometry(cq.Matrix(rows[:3]))
+
+    from OCP.gp import gp_Trsf
+    trsf = gp_Trsf()
+    trsf.SetValues(*[value for row in rows[:3] for value in row])
+    return shape.transformShape(cq.Matrix(trsf))
+
+
+def build_object(cq, obj: Dict[str, Any]):
+    """Build one plan object, placed by its transform"""
+    builder, _ = OBJECT_BUILDERS[obj['type']]
+    shape = builder(cq, obj.get('params') or {})
+    if not shape.isValid():
+        raise PlanError(f"Object '{obj.get('name', obj['type'])}' produced invalid geometry")
+    return _apply_transform(cq, shape, obj.get('transform'))
+
+
+def _operands(operation: Dict[str, Any], active: List[str]) -> Tuple[str, List[str]]:
+    """Resolve an operation's target and tool objects against the objects still in play"""
+    objects = operation.get('objects') if isinstance(operation.get('objects'), list) else []
+    target = operation.get('target') or (objects[0] if objects else None)
+    if target not in active:
+        raise PlanError(f"Operation '{operation.get('action')}' targets unknown object {target!r}")
+
+    tools = operation.get('tools') or operation.get('tool') or operation.get('with') or objects
+    if isinstance(tools, str):
+        tools = [tools]
+    tools = [tool for tool in tools if tool != target]
+    for tool in tools:
+        if tool not in active:
+            raise PlanError(f"Operation '{operation.get('action')}' uses unknown object {tool!r}")
+    return target, tools
+
+
+# Operations: (cq, target shape, tool shapes, operation) -> new target shape
+
+def _translate(cq, target, tools, operation):
+    return target.translate(cq.Vector(*vector_param(operation.get('vector'), 'vector')))
+
+
+def _rotate(cq, target, tools, operation):
+    center = cq.Vector(*vector_param(operation.get('center', [0, 0, 0]), 'center'))
+    axis = cq.Vector(*vector_param(operation.get('axis', [0, 0, 1]), 'axis'))
+    if axis.Length == 0:
+        raise PlanError("Rotation axis must be non-zero")
+    return target.rotate(center, center + axis, number_param(operation, 'angle'))
+
+
+def _union(cq, target, tools, operation):
+    return target.fuse(*tools).clean() if tools else target
+
+
+def _subtract(cq, target, tools, operation):
+    if not tools:
+        raise PlanError("Subtract names no tool object")
+    return target.cut(*tools).clean()
+
+
+def _fillet_edges(cq, target, tools, operation):
+    edges = operation.get('edges', 'all')
+    if edges not in EDGE_SELECTORS:
+        raise PlanError(f"Unknown edge selection {edges!r}, expected one of: {', '.join(EDGE_SELECTORS)}")
+    selected = cq.Workplane('XY').add(target).edges(EDGE_SELECTORS[edges]).vals()
+    return target.fillet(positive_param(operation, 'radius'), selected) if selected else target
+
+
+OPERATIONS = {
+    'translate': _translate,
+    'rotate': _rotate,
+    'union': _union,
+    'subtract': _subtract,
+    'fillet_edges': _fillet_edges,
+}
+
+# Boolean operations absorb their tool objects into the target
+CONSUMING_ACTIONS = ('union', 'subtract')
+OPERAND_FIELDS = ('target', 'tool', 'tools', 'with', 'objects')
+
+
+def _resolved_operations(json_plan: Dict[str, Any], names: List[str]) -> Iterator[Tuple[Dict[str, Any], str, List[str]]]:
+    """Yield each operation with its resolved target and tools, tracking which objects booleans consume"""
+    operations = json_plan.get('operations') or []
+    if not isinstance(operations, list):
+        raise PlanError("Plan operations must be a list")
+    active = list(names)
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('action') not in OPERATIONS:
+            raise PlanError(f"Unsupported operation {operation!r}")
+        target, tools = _operands(operation, active)
+        # A union naming no tools merges everything else still in the plan into the target
+        if operation['action'] == 'union' and not tools:
+            tools = [name for name in active if name != target]
+        yield operation, target, tools
+        if operation['action'] in CONSUMING_ACTIONS:
+            active = [name for name in active if name not in tools]
+
+
+def validate_plan(json_plan: Any) -> None:
+    """
+    Check, without CadQuery, that every object type and operation in a plan is one the
+    builder supports and that all references resolve. Raises PlanError otherwise.
+    """
+    if not isinstance(json_plan, dict) or not isinstance(json_plan.get('objects'), list) or not json_plan['objects']:
+        raise PlanError("Plan has no objects")
+
+    names = []
+    for obj in json_plan['objects']:
+        if not isinstance(obj, dict):
+            raise PlanError(f"Plan object must be an object, got {obj!r}")
+        name, object_type = obj.get('name'), obj.get('type')
+        if not isinstance(name, str) or not name or name in names:
+            raise PlanError(f"Object names must be unique non-empty strings, got {name!r}")
+        if object_type not in OBJECT_BUILDERS:
+            raise PlanError(f"Unsupported object type {object_type!r}")
+        params = obj.get('params') or {}
+        if not isinstance(params, dict):
+            raise PlanError(f"Params of '{name}' must be an object")
+        for param in OBJECT_BUILDERS[object_type][1]:
+            number_param(params, param)
+        if obj.get('transform') is not None:
+            transform_rows(obj['transform'])
+        names.append(name)
+
+    for _ in _resolved_operations(json_plan, names):
+        pass
+
+
+def _node_key(kind: str, definition: Dict[str, Any], inputs: List[str]) -> str:
+    encoded = json.dumps([kind, definition, inputs], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:32]
+
+
+def plan_graph(json_plan: Dict[str, Any]) -> Tuple[Dict[str, Tuple[str, Dict[str, Any], List[str]]], Dict[str, str]]:
+    """
+    Dependency graph of a plan: node key -> (kind, definition, input keys), plus the node
+    holding each object left at the end. A node's key hashes its definition together with its
+    inputs' keys, so an edit changes exactly the keys of the edited node and everything downstream.
+    """
+    validate_plan(json_plan)
+    nodes = {}
+    versions: 'OrderedDict[str, str]' = OrderedDict()
+
+    for obj in json_plan['objects']:
+        # Names are labels only; renaming an object does not force a rebuild
+        definition = {'type': obj['type'], 'params': obj.get('params') or {}, 'transform': obj.get('transform')}
+        key = _node_key('object', definition, [])
+        nodes[key] = ('object', dict(definition, name=obj['name']), [])
+        versions[obj['name']] = key
+
+    for operation, target, tools in _resolved_operations(json_plan, list(versions)):
+        definition = {field: value for field, value in operation.items() if field not in OPERAND_FIELDS}
+        inputs = [versions[target]] + [versions[tool] for tool in tools]
+        key = _node_key('operation', definition, inputs)
+        nodes[key] = ('operation', definition, inputs)
+        versions[target] = key
+        if operation['action'] in CONSUMING_ACTIONS:
+            for tool in tools:
+                del versions[tool]
+
+    return nodes, dict(versions)
+
+
+def evaluate_plan(cq, json_plan: Dict[str, Any], memo: Optional[MutableMapping] = None,
+                  shape_cache=None) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Build the shapes of the objects left after all operations, walking the dependency graph
+    from the outputs and reusing any node already in memo. Nodes built here are added to memo.
+    Objects not in memo come from shape_cache (a shape_cache.ShapeCache) when one is given.
+    Returns the shapes by object name and counts of nodes built and reused.
+    """
+    memo = {} if memo is None else memo
+    nodes, outputs = plan_graph(json_plan)
+    counts = {'built': 0, 'reused': 0}
+
+    def evaluate(key: str):
+        if key in memo:
+            counts['reused'] += 1
+            return memo[key]
+        kind, definition, inputs = nodes[key]
+        if kind == 'object' and shape_cache is not None:
+            shape = shape_cache.get_or_build(definition, lambda: build_object(cq, definition))
+        elif kind == 'object':
+            shape = build_object(cq, definition)
+        else:
+            shapes = [evaluate(input_key) for input_key in inputs]
+            shape = OPERATIONS[definition['action']](cq, shapes[0], shapes[1:], definition)
+        memo[key] = shape
+        counts['built'] += 1
+        return shape
+
+    return {name: evaluate(key) for name, key in outputs.items()}, counts
+
+
+def diff_plans(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize which objects and operations changed between two versions of a plan"""
+    def by_name(plan):
+        return {obj.get('name'): obj for obj in (plan or {}).get('objects') or [] if isinstance(obj, dict)}
+
+    before, after = by_name(previous), by_name(current)
+    return {
+        'added': [name for name in after if name not in before],
+        'removed': [name for name in before if name not in after],
+        'modified': [name for name in after if name in before and after[name] != before[name]],
+        'operationsChanged': (previous or {}).get('operations') != current.get('operations'),
+    }
+
+
+def assemble(cq, shapes: Dict[str, Any]):
+    """Assembly of evaluated plan shapes, one part per remaining object"""
+    assembly = cq.Assembly()
+    for name, shape in shapes.items():
+        assembly.add(shape, name=name)
+    return assembly
@@ -0,0 +1,310 @@
+"""
+Primitive mesher for CADAgent PRO
+Tessellates Box, Cylinder, Sphere, Cone and Pyramid objects straight from their jsonPlan
+params with NumPy and packs them as GLB, laid out like the OCC export (Z-up geometry under
+a Y-up root node, one named node per object). Objects with the same type and params share
+one mesh placed by their node matrices. Plans made only of these primitives, placed by
+transforms, translate and rotate, never need CadQuery.
+"""
+
+import json
+import math
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from gltf_utils import pack_glb
+from mesh_optimize import ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER, TRIANGLES, BufferWriter, optimize_glb
+from plan_builder import IDENTITY_TRANSFORM, PlanError, number_param, plan_graph, positive_param, transform_rows, vector_param
+from tessellation import QUALITY_TIERS
+
+# Operations that only move an object, so a plan using nothing else stays a set of primitives
+RIGID_ACTIONS = ('translate', 'rotate')
+
+# Segments around a full circle, whatever the tolerances ask for
+MIN_SEGMENTS = 8
+MAX_SEGMENTS = 256
+
+# Largest cosine between the axes of a placement that still counts as rotation and scale only;
+# glTF node matrices must decompose into translation, rotation and scale, so sheared (or
+# projective) placements are left to CadQuery, which bakes them into the geometry
+SHEAR_TOLERANCE = 1e-6
+
+# glTF is Y-up; the plan (like CadQuery) is Z-up
+Y_UP_ROTATION = [-math.sqrt(0.5), 0.0, 0.0, math.sqrt(0.5)]
+
+Mesh = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def segment_count(radius: float, size: float, quality: str) -> int:
+    """Segments around a circle of the given radius, within the tier's angular and chord tolerances"""
+    tier = QUALITY_TIERS[quality]
+    segments = 2 * math.pi / tier['angular_tolerance']
+    chord = size * tier['relative_tolerance']
+    if radius > chord:
+        segments = max(segments, math.pi / math.acos(1 - chord / radius))
+    return int(min(MAX_SEGMENTS, max(MIN_SEGMENTS, math.ceil(segments))))
+
+
+def _quads(rows: int, columns: int) -> np.ndarray:
+    """Two counter-clockwise triangles per cell of a (rows + 1) x (columns + 1) vertex grid"""
+    row, column = np.meshgrid(np.arange(rows), np.arange(columns), indexing='ij')
+    a = (row * (columns + 1) + column).ravel()
+    b, c, d = a + 1, a + columns + 2, a + columns + 1
+    return np.stack([a, b, c, a, c, d], axis=1).reshape(-1, 3)
+
+
+def _disk(radius: float, z: float, segments: int, facing: float, offset: int) -> Mesh:
+    """Flat cap at height z, facing +Z (facing=1) or -Z (facing=-1)"""
+    angles = np.linspace(0, 2 * math.pi, segments, endpoint=False)
+    positions = np.zeros((segments + 1, 3))
+    positions[1:, 0] = radius * np.cos(angles)
+    positions[1:, 1] = radius * np.sin(angles)
+    positions[:, 2] = z
+    normals = np.zeros_like(positions)
+    normals[:, 2] = facing
+    ring = np.arange(1, segments + 1)
+    following = np.roll(ring, -1)
+    center = np.zeros(segments, dtype=np.int64)
+    triangles = np.stack([center, ring, following] if facing > 0 else [center, following, ring], axis=1)
+    return positions, normals, triangles + offset
+
+
+def _frustum(bottom_radius: float, top_radius: float, height: float, base: float, segments: int) -> Mesh:
+    """Cone or cylinder around Z from z=base to z=base+height, with caps on non-zero radii"""
+    angles = np.linspace(0, 2 * math.pi, segments + 1)
+    cos, sin = np.cos(angles), np.sin(angles)
+
+    # Side: a bottom and a top ring, seam duplicated so the normals stay smooth around it
+    radii = np.array([bottom_radius, top_radius])[:, None]
+    positions = np.stack([radii * cos, radii * sin, np.repeat([[base], [base + height]], segments + 1, axis=1)], axis=2)
+    slope = np.hypot(height, bottom_radius - top_radius)
+    normals = np.stack([np.broadcast_to(cos * height / slope, (2, segments + 1)),
+                        np.broadcast_to(sin * height / slope, (2, segments + 1)),
+                        np.full((2, segments + 1), (bottom_radius - top_radius) / slope)], axis=2)
+    triangles = _quads(1, segments)
+    # Drop the zero-area half of each quad at an apex
+    if top_radius == 0:
+        triangles = triangles[0::2]
+    elif bottom_radius == 0:
+        triangles = triangles[1::2]
+    parts = [(positions.reshape(-1, 3), normals.reshape(-1, 3), triangles)]
+
+    offset = 2 * (segments + 1)
+    if bottom_radius > 0:
+        parts.append(_disk(bottom_radius, base, segments, -1.0, offset))
+        offset += segments + 1
+    if top_radius > 0:
+        parts.append(_disk(top_radius, base + height, segments, 1.0, offset))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def _flat_faces(faces: np.ndarray) -> Mesh:
+    """Mesh of planar convex polygons (faces x corners x 3, counter-clockwise from outside)"""
+    count, corners, _ = faces.shape
+    normals = np.cross(faces[:, 1] - faces[:, 0], faces[:, 2] - faces[:, 0])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    fan = np.array([[0, i, i + 1] for i in range(1, corners - 1)])
+    triangles = (fan[None, :, :] + corners * np.arange(count)[:, None, None]).reshape(-1, 3)
+    return faces.reshape(-1, 3), np.repeat(normals, corners, axis=0), triangles
+
+
+def mesh_box(params: Dict[str, Any], quality: str) -> Mesh:
+    """Box centered on the origin: width along X, depth along Y, height along Z"""
+    half = np.array([positive_param(params, 'width'), positive_param(params, 'depth'), positive_param(params, 'height')]) / 2
+    corners = np.array([[x, y, z] for z in (-1, 1) for y in (-1, 1) for x in (-1, 1)], dtype=np.float64) * half
+    faces = np.array([
+        [0, 2, 3, 1], [4, 5, 7, 6],  # -Z, +Z
+        [0, 1, 5, 4], [2, 6, 7, 3],  # -Y, +Y
+        [0, 4, 6, 2], [1, 3, 7, 5],  # -X, +X
+    ])
+    return _flat_faces(corners[faces])
+
+
+def mesh_pyramid(params: Dict[str, Any], quality: str) -> Mesh:
+    """Rectangular pyramid with its base centered on the origin at z=0 and its apex above"""
+    width, depth, height = positive_param(params, 'width'), positive_param(params, 'depth'), positive_param(params, 'height')
+    base = np.array([[-width / 2, -depth / 2, 0], [width / 2, -depth / 2, 0],
+                     [width / 2, depth / 2, 0], [-width / 2, depth / 2, 0]])
+    apex = np.array([0, 0, height])
+    sides = np.stack([np.stack([base[i], base[(i + 1) % 4], apex]) for i in range(4)])
+    side_mesh = _flat_faces(sides)
+    base_mesh = _flat_faces(base[::-1][None])
+    return (np.concatenate([side_mesh[0], base_mesh[0]]), np.concatenate([side_mesh[1], base_mesh[1]]),
+            np.concatenate([side_mesh[2], base_mesh[2] + len(side_mesh[0])]))
+
+
+def mesh_cylinder(params: Dict[str, Any], quality: str) -> Mesh:
+    """Cylinder around Z centered on the origin"""
+    radius, height = positive_param(params, 'radius'), positive_param(params, 'height')
+    return _frustum(radius, radius, height, -height / 2, segment_count(radius, math.hypot(2 * radius, height), quality))
+
+
+def mesh_cone(params: Dict[str, Any], quality: str) -> Mesh:
+    """Cone or frustum around Z standing on z=0"""
+    bottom_radius = number_param(params, 'bottomRadius')
+    top_radius = number_param(params, 'topRadius', 0)
+    height = positive_param(params, 'height')
+    if bottom_radius < 0 or top_radius < 0 or bottom_radius == top_radius == 0:
+        raise PlanError("Cone radii must be non-negative and not both zero")
+    radius = max(bottom_radius, top_radius)
+    return _frustum(bottom_radius, top_radius, height, 0.0, segment_count(radius, math.hypot(2 * radius, height), quality))
+
+
+def mesh_sphere(params: Dict[str, Any], quality: str) -> Mesh:
+    """UV sphere centered on the origin"""
+    radius = positive_param(params, 'radius')
+    segments = segment_count(radius, 2 * math.sqrt(3) * radius, quality)
+    rings = max(4, segments // 2)
+    polar, azimuth = np.meshgrid(np.linspace(0, math.pi, rings + 1), np.linspace(0, 2 * math.pi, segments + 1), indexing='ij')
+    normals = np.stack([np.sin(polar) * np.cos(azimuth), np.sin(polar) * np.sin(azimuth), np.cos(polar)], axis=2).reshape(-1, 3)
+    # Rows run from the north pole down, so the grid's counter-clockwise cells face inwards
+    triangles = _quads(rings, segments)[:, ::-1]
+    # The first and last rows of cells meet a pole: one triangle of each quad has zero area
+    per_row = 2 * segments
+    keep = np.ones(len(triangles), dtype=bool)
+    keep[0:per_row:2] = False
+    keep[len(triangles) - per_row + 1::2] = False
+    return normals * radius, normals, triangles[keep]
+
+
+# type -> mesher(params, quality); the same placement as plan_builder's OBJECT_BUILDERS
+PRIMITIVE_MESHERS = {
+    'Box': mesh_box,
+    'Cylinder': mesh_cylinder,
+    'Sphere': mesh_sphere,
+    'Cone': mesh_cone,
+    'Pyramid': mesh_pyramid,
+}
+
+
+def _translation(vector) -> np.ndarray:
+    matrix = np.eye(4)
+    matrix[:3, 3] = vector
+    return matrix
+
+
+def _rotation(center, axis, degrees: float) -> np.ndarray:
+    """Rotation about an axis through center (Rodrigues), as a 4x4 matrix"""
+    axis = np.array(axis, dtype=np.float64)
+    length = np.linalg.norm(axis)
+    if length == 0:
+        raise PlanError("Rotation axis must be non-zero")
+    x, y, z = axis / length
+    cross = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    angle = math.radians(degrees)
+    rotation = np.eye(4)
+    rotation[:3, :3] = np.eye(3) + math.sin(angle) * cross + (1 - math.cos(angle)) * cross @ cross
+    return _translation(center) @ rotation @ _translation(-np.array(center, dtype=np.float64))
+
+
+def _operation_matrix(operation: Dict[str, Any]) -> np.ndarray:
+    if operation['action'] == 'translate':
+        return _translation(vector_param(operation.get('vector'), 'vector'))
+    return _rotation(vector_param(operation.get('center', [0, 0, 0]), 'center'),
+                     vector_param(operation.get('axis', [0, 0, 1]), 'axis'), number_param(operation, 'angle'))
+
+
+def primitive_placements(json_plan: Any) -> Optional[Dict[str, Tuple[Dict[str, Any], np.ndarray]]]:
+    """
+    Each remaining object's definition and placement matrix when the plan is made only of
+    primitives moved by transforms, translate and rotate; None for any other (or invalid) plan
+    """
+    try:
+        nodes, outputs = plan_graph(json_plan)
+    except PlanError:
+        return None
+    if any(kind == 'object' and definition['type'] not in PRIMITIVE_MESHERS
+           or kind == 'operation' and definition.get('action') not in RIGID_ACTIONS
+           for kind, definition, _ in nodes.values()):
+        return None
+
+    def placement(key: str) -> Tuple[Dict[str, Any], np.ndarray]:
+        kind, definition, inputs = nodes[key]
+        if kind == 'object':
+            transform = definition.get('transform')
+            matrix = np.eye(4) if transform is None or transform == IDENTITY_TRANSFORM else np.array(transform_rows(transform))
+            return definition, matrix
+        source, matrix = placement(inputs[0])
+        return source, _operation_matrix(definition) @ matrix
+
+    try:
+        return {name: placement(key) for name, key in outputs.items()}
+    except PlanError:
+        return None
+
+
+def is_primitive_plan(json_plan: Any) -> bool:
+    """True for a valid plan the primitive mesher can build entirely"""
+    return primitive_placements(json_plan) is not None
+
+
+def node_matrix(matrix: np.ndarray) -> Optional[list]:
+    """
+    A 4x4 placement as a GLTF node matrix (column-major), or None for the identity. Viewers
+    apply it to normals and flip the winding of mirrored nodes themselves. Raises PlanError
+    for a placement that is not a translation, rotation and (possibly non-uniform) scale.
+    """
+    linear = matrix[:3, :3]
+    if abs(np.linalg.det(linear)) < 1e-12:
+        raise PlanError("Object transform must be invertible")
+    lengths = np.linalg.norm(linear, axis=0)
+    cosines = (linear.T @ linear) / np.outer(lengths, lengths)
+    if np.abs(cosines - np.eye(3)).max() > SHEAR_TOLERANCE or not np.allclose(matrix[3], [0, 0, 0, 1]):
+        raise PlanError("Object transform is not a rotation, scale and translation")
+    if np.allclose(matrix, np.eye(4)):
+        return None
+    return matrix.T.reshape(-1).tolist()
+
+
+def mesh_plan(json_plan: Dict[str, Any], quality: str) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    GLB of a primitive-only plan (see is_primitive_plan), tessellated for the quality tier and
+    quantized like the OCC path on tiers that ask for it. Returns the GLB and export details.
+    Raises PlanError for any other plan.
+    """
+    placements = primitive_placements(json_plan)
+    if placements is None:
+        raise PlanError("Plan is not made only of primitives")
+
+    writer = BufferWriter()
+    meshes, children = [], []
+    # (type, params) -> (mesh index, triangles), so repeated objects are tessellated and stored once
+    shared: Dict[Tuple[str, str], Tuple[int, int]] = {}
+    triangle_count = 0
+    for name, (definition, matrix) in placements.items():
+        key = (definition['type'], json.dumps(definition['params'], sort_keys=True))
+        if key not in shared:
+            positions, normals, triangles = PRIMITIVE_MESHERS[definition['type']](definition['params'], quality)
+            count = len(positions)
+            position_accessor = writer.add(positions.astype('<f4'), 5126, 'VEC3', count, ARRAY_BUFFER, bounds=True)
+            normal_accessor = writer.add(normals.astype('<f4'), 5126, 'VEC3', count, ARRAY_BUFFER)
+            index_type, index_dtype = (5123, '<u2') if count <= 0xFFFF else (5125, '<u4')
+            index_accessor = writer.add(triangles.astype(index_dtype), index_type, 'SCALAR', triangles.size, ELEMENT_ARRAY_BUFFER)
+            meshes.append({'name': name, 'primitives': [{
+                'attributes': {'NORMAL': normal_accessor, 'POSITION': position_accessor},
+                'indices': index_accessor,
+                'mode': TRIANGLES,
+            }]})
+            shared[key] = (len(meshes) - 1, len(triangles))
+        mesh_index, triangles = shared[key]
+        child = {'mesh': mesh_index, 'name': name}
+        matrix = node_matrix(matrix)
+        if matrix is not None:
+            child['matrix'] = matrix
+        children.append(child)
+        triangle_count += triangles
+
+    gltf = {
+        'asset': {'generator': 'CADAgent PRO primitive mesher', 'version': '2.0'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'children': list(range(1, len(children) + 1)), 'rotation': Y_UP_ROTATION}] + children,
+        'meshes': meshes,
+        'accessors': writer.accessors,
+        'bufferViews': writer.buffer_views,
+    }
+    glb = pack_glb(gltf, [writer.data()])
+    if QUALITY_TIERS[quality]['quantize']:
+        glb, _ = optimize_glb(glb, quantize=True)
+    return glb, {'quality': quality, 'triangles': triangle_count, 'objects': len(children), 'meshes': len(meshes)}
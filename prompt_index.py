@@ -0,0 +1,314 @@
+"""
+Near-duplicate prompt index for CADAgent PRO
+Remembers the jsonPlan and pythonCode of past successful prompts under MinHash signatures of
+their words, with every number abstracted to a placeholder, so "a 40mm gear" and "a 60mm gear"
+look the same. A lookup compares one signature against all stored ones in a single NumPy pass.
+A prompt whose wording matches an earlier one gets that plan and code with its own dimensions
+substituted in; a merely similar one gets them as a few-shot example for the LLM.
+"""
+
+import copy
+import io
+import json
+import math
+import os
+import re
+import threading
+import tokenize
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Hash functions per signature; the estimate of Jaccard similarity is good to about 1/sqrt(64)
+SIGNATURE_SIZE = 64
+
+# Universal hashing (a * h + b) mod p with a Mersenne prime, so signatures fit in uint32
+MERSENNE_PRIME = (1 << 31) - 1
+_random = np.random.RandomState(20240917)
+HASH_A = _random.randint(1, MERSENNE_PRIME, SIGNATURE_SIZE).astype(np.uint64)
+HASH_B = _random.randint(0, MERSENNE_PRIME, SIGNATURE_SIZE).astype(np.uint64)
+
+# A number with its unit, if it has one; the unit stays in the abstracted wording. An x between
+# two numbers ("60x40mm", "2x4") separates them rather than making the first one part of a word.
+DIMENSION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(mm|cm|m|in|inch|inches|deg|degrees?|°)?(?!(?!x\s*\d)[a-z\d])')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+TOKEN_PATTERN = re.compile(r'#[a-z°]*|[a-z]+')
+STOPWORDS = frozenset({'a', 'an', 'the', 'of', 'with', 'and', 'in', 'to', 'for', 'that', 'is', 'please', 'make', 'create'})
+
+# Diameters in prompts often become radii in plans; a dimension is also recognised at half its value
+DERIVED_RATIOS = (1.0, 0.5)
+
+# Operation fields holding lengths or angles a prompt can state; object params are the others.
+# Transforms, rotation axes and centers also hold 0s, 1s and offsets that no prompt dimension sets.
+DIMENSION_FIELDS = {'translate': ('vector',), 'rotate': ('angle',), 'fillet_edges': ('radius',)}
+
+
+def abstract_prompt(prompt: str) -> Tuple[List[str], List[float]]:
+    """Prompt words with each number replaced by '#' plus its unit, and the numbers in order"""
+    dimensions = []
+
+    def placeholder(match: re.Match) -> str:
+        dimensions.append(float(match.group(1)))
+        return f" #{match.group(2) or ''} "
+
+    text = DIMENSION_PATTERN.sub(placeholder, prompt.lower())
+    tokens = [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+    return tokens, dimensions
+
+
+def dimensions_complete(prompt: str, dimensions: List[float]) -> bool:
+    """Whether every number in the prompt was abstracted, so a reuse cannot leave an old one behind"""
+    return len(NUMBER_PATTERN.findall(prompt)) == len(dimensions)
+
+
+def signature(tokens: List[str]) -> np.ndarray:
+    """MinHash signature of the prompt's word unigrams and bigrams"""
+    shingles = set(tokens) | {f'{first} {second}' for first, second in zip(tokens, tokens[1:])}
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles] or [0], dtype=np.uint64)
+    return ((HASH_A[:, None] * hashes[None, :] + HASH_B[:, None]) % MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+
+def format_number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(round(value, 6))
+
+
+def _dimension_mapping(old: List[float], new: List[float]) -> Optional[Dict[float, float]]:
+    """
+    Old value -> new value for every dimension (and derived value) of the prompt, or None when
+    the substitution would be ambiguous: a value claimed by two dimensions, or a changed value
+    of 0 or 1 (a 2mm dimension's radius included), which plans and scripts use for far more
+    than dimensions
+    """
+    mapping = {}
+    for old_value, new_value in zip(old, new):
+        for ratio in DERIVED_RATIOS:
+            key = old_value * ratio
+            if old_value != new_value and key in (0, 1):
+                return None
+            if mapping.get(key, new_value * ratio) != new_value * ratio:
+                return None
+            mapping[key] = new_value * ratio
+    return mapping
+
+
+def _dimension_values(json_plan: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """(container, field) of every object's params and every operation field in DIMENSION_FIELDS"""
+    for obj in json_plan.get('objects') or []:
+        if isinstance(obj, dict) and 'params' in obj:
+            yield obj, 'params'
+    for operation in json_plan.get('operations') or []:
+        if isinstance(operation, dict):
+            for field in DIMENSION_FIELDS.get(operation.get('action'), ()):
+                if field in operation:
+                    yield operation, field
+
+
+def _plan_numbers(value: Any) -> List[float]:
+    if isinstance(value, dict):
+        return [number for item in value.values() for number in _plan_numbers(item)]
+    if isinstance(value, list):
+        return [number for item in value for number in _plan_numbers(item)]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return [float(value)]
+    return []
+
+
+def _substitute_values(value: Any, mapping: Dict[float, float]) -> Any:
+    if isinstance(value, dict):
+        return {key: _substitute_values(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute_values(item, mapping) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and abs(value) in mapping:
+        # Offsets keep their direction: -20 becomes -30 when 20 becomes 30
+        substituted = math.copysign(mapping[abs(value)], value)
+        return int(substituted) if isinstance(value, int) and substituted == int(substituted) else substituted
+    return value
+
+
+def _substitute_plan(json_plan: Dict[str, Any], mapping: Dict[float, float]) -> Dict[str, Any]:
+    """A copy of the plan with the mapped values replaced in its dimension fields only"""
+    json_plan = copy.deepcopy(json_plan)
+    for container, field in _dimension_values(json_plan):
+        container[field] = _substitute_values(container[field], mapping)
+    return json_plan
+
+
+def _substitute_code(python_code: str, mapping: Dict[float, float]) -> Optional[str]:
+    """Replace numeric literals found in mapping, leaving every other character of the script alone"""
+    lines = python_code.splitlines(keepends=True)
+    replacements = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(python_code).readline):
+            if token.type == tokenize.NUMBER and token.start[0] == token.end[0]:
+                try:
+                    value = float(token.string)
+                except ValueError:
+                    continue
+                if value in mapping:
+                    text = format_number(mapping[value])
+                    # A float literal stays a float, so integer-only uses of ints are not disturbed
+                    if not token.string.isdigit() and '.' not in text:
+                        text += '.0'
+                    replacements.append((token.start, token.end, text))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    for (row, start), (_, end), text in reversed(replacements):
+        lines[row - 1] = lines[row - 1][:start] + text + lines[row - 1][end:]
+    return ''.join(lines)
+
+
+def substitute_dimensions(json_plan: Dict[str, Any], python_code: str, old: List[float],
+                          new: List[float]) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    The plan and code of a prompt with dimensions old, rewritten for dimensions new. None when
+    the values cannot be swapped unambiguously or a changed dimension is not among the plan's
+    params and operation dimensions (see DIMENSION_FIELDS).
+    """
+    if len(old) != len(new):
+        return None
+    mapping = _dimension_mapping(old, new)
+    if mapping is None:
+        return None
+    if old == new:
+        return copy.deepcopy(json_plan), python_code
+
+    plan_values = {abs(number) for container, field in _dimension_values(json_plan)
+                   for number in _plan_numbers(container[field])}
+    for old_value, new_value in zip(old, new):
+        if old_value != new_value and not any(old_value * ratio in plan_values for ratio in DERIVED_RATIOS):
+            return None
+    python_code = _substitute_code(python_code, mapping)
+    if python_code is None:
+        return None
+    return _substitute_plan(json_plan, mapping), python_code
+
+
+class PromptIndex:
+    """
+    Bounded LRU of past successful prompts with their plan and code, searched by MinHash
+    similarity of the abstracted wording. Signatures live in one preallocated array, so memory
+    is capped by max_entries and max_bytes and a lookup is a single vectorised comparison.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, reuse_similarity: float, hint_similarity: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.reuse_similarity = reuse_similarity
+        self.hint_similarity = hint_similarity
+
+        self._lock = threading.Lock()
+        self._signatures = np.zeros((max_entries, SIGNATURE_SIZE), dtype=np.uint32)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._free = list(range(max_entries))
+        self._size = 0
+        self._stats = {
+            'lookups': 0,
+            'reuses': 0,
+            'hints': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> 'PromptIndex':
+        """Build the index from PROMPT_INDEX_* environment variables"""
+        return cls(
+            max_entries=int(os.environ.get('PROMPT_INDEX_MAX_ENTRIES', 2048)),
+            max_bytes=int(os.environ.get('PROMPT_INDEX_MEMORY_MB', 8)) * 1024 * 1024,
+            reuse_similarity=float(os.environ.get('PROMPT_INDEX_REUSE_SIMILARITY', 0.95)),
+            hint_similarity=float(os.environ.get('PROMPT_INDEX_HINT_SIMILARITY', 0.5)),
+        )
+
+    def add(self, prompt: str, json_plan: Dict[str, Any], python_code: str) -> None:
+        """Remember a prompt that produced a model, replacing an earlier one with the same wording"""
+        tokens, dimensions = abstract_prompt(prompt)
+        if not tokens or self.max_entries <= 0:
+            return
+        size = len(json.dumps(json_plan, separators=(',', ':'))) + len(python_code) + len(prompt)
+        if size > self.max_bytes:
+            return
+        key = ' '.join(tokens)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while self._entries and (not self._free or self._size + size > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+            slot = self._free.pop()
+            self._signatures[slot] = signature(tokens)
+            self._used[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = {
+                'slot': slot,
+                'prompt': prompt,
+                'dimensions': dimensions,
+                'jsonPlan': json_plan,
+                'pythonCode': python_code,
+                'size': size,
+            }
+            self._size += size
+            self._stats['stores'] += 1
+
+    def lookup(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        The nearest earlier prompt at or above the hint similarity, or None. reuse is True when
+        the wording matches closely enough and the dimensions could be substituted; jsonPlan and
+        pythonCode then already carry this prompt's dimensions, otherwise they are the earlier ones.
+        """
+        tokens, dimensions = abstract_prompt(prompt)
+        query = signature(tokens)
+        with self._lock:
+            self._stats['lookups'] += 1
+            if not self._entries or not tokens:
+                self._stats['misses'] += 1
+                return None
+            similarities = np.where(self._used, (self._signatures == query).mean(axis=1), -1.0)
+            slot = int(similarities.argmax())
+            similarity = float(similarities[slot])
+            if similarity < self.hint_similarity:
+                self._stats['misses'] += 1
+                return None
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+
+        substituted = None
+        # A number kept in the wording ("2nd", "4x") matches whatever value the other prompt had
+        if (similarity >= self.reuse_similarity and dimensions_complete(prompt, dimensions)
+                and dimensions_complete(entry['prompt'], entry['dimensions'])):
+            substituted = substitute_dimensions(entry['jsonPlan'], entry['pythonCode'], entry['dimensions'], dimensions)
+        with self._lock:
+            self._stats['reuses' if substituted else 'hints'] += 1
+        json_plan, python_code = substituted or (entry['jsonPlan'], entry['pythonCode'])
+        return {
+            'prompt': entry['prompt'],
+            'similarity': round(similarity, 3),
+            'reuse': substituted is not None,
+            'jsonPlan': json_plan,
+            'pythonCode': python_code,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Return lookup outcomes and current occupancy"""
+        with self._lock:
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._size,
+                limit_entries=self.max_entries,
+                limit_bytes=self.max_bytes,
+                reuse_similarity=self.reuse_similarity,
+                hint_similarity=self.hint_similarity,
+            )
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._used[entry['slot']] = False
+        self._slot_keys[entry['slot']] = None
+        self._free.append(entry['slot'])
+        self._size -= entry['size']
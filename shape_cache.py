@@ -0,0 +1,206 @@
+"""
+Shape cache for CADAgent PRO
+Built jsonPlan objects kept across requests, keyed by their canonical type, params and
+transform, so a 50mm Box or a 25x50 Cylinder is built by OCC once rather than in every
+plan that uses it. Serialized BRep files live in a size-capped directory shared by all
+CadQuery worker processes and are read through mmap; each worker keeps an LRU of the live
+shapes it has used in front of them.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from cache import engine_version
+from plan_builder import IDENTITY_TRANSFORM, transform_rows
+
+logger = logging.getLogger(__name__)
+
+# Disk usage is re-measured after this fraction of the limit has been written by a process
+TRIM_FRACTION = 8
+
+
+def _canonical(value: Any) -> Any:
+    """Numbers as floats, so 50 and 50.0 give the same key; everything else unchanged"""
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+class ShapeCache:
+    """
+    Two-tier cache of built plan objects: a per-process LRU of live shapes over a disk
+    directory of BinTools files shared between processes and evicted least-recently-used first.
+    Counts lookups by tier and the serialized size of the shapes served instead of rebuilt.
+    """
+
+    def __init__(self, disk_dir: str, disk_bytes: int, memory_entries: int):
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.memory_entries = memory_entries
+        self.version = engine_version()
+
+        # key -> (shape, serialized size)
+        self._memory: 'OrderedDict[str, Tuple[Any, int]]' = OrderedDict()
+        self._written = 0
+        self._stats = self.empty_stats()
+
+    @classmethod
+    def from_env(cls) -> 'ShapeCache':
+        """Build the cache from SHAPE_CACHE_* environment variables"""
+        return cls(
+            disk_dir=os.environ.get('SHAPE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'cadagent-shapes'),
+            disk_bytes=int(os.environ.get('SHAPE_CACHE_DISK_MB', 64)) * 1024 * 1024,
+            memory_entries=int(os.environ.get('SHAPE_CACHE_MEMORY_ENTRIES', 256)),
+        )
+
+    @staticmethod
+    def empty_stats() -> Dict[str, int]:
+        """Zeroed lookup counters"""
+        return {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'bytes_saved': 0, 'disk_evictions': 0}
+
+    def make_key(self, definition: Dict[str, Any]) -> str:
+        """Content address of a plan object: engine version, type, params and placement"""
+        transform = definition.get('transform')
+        if transform is not None and transform != IDENTITY_TRANSFORM:
+            transform = transform_rows(transform)
+            if transform == IDENTITY_TRANSFORM:
+                transform = None
+        else:
+            transform = None
+        geometry = [definition['type'], _canonical(definition.get('params') or {}), _canonical(transform)]
+        digest = hashlib.sha256()
+        digest.update(self.version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(json.dumps(geometry, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.brep")
+
+    def get_or_build(self, definition: Dict[str, Any], build: Callable[[], Any]):
+        """The cached shape for a plan object, or build() it and cache the result"""
+        key = self.make_key(definition)
+        if key in self._memory:
+            from OCP.BRepTools import BRepTools
+
+            self._memory.move_to_end(key)
+            shape, size = self._memory[key]
+            # Drop the triangulation an earlier export left on it, which is reused at any quality
+            BRepTools.Clean_s(shape.wrapped)
+            self._stats['memory_hits'] += 1
+            self._stats['bytes_saved'] += size
+            return shape
+
+        loaded = self._read(key)
+        if loaded is not None:
+            shape, size = loaded
+            self._stats['disk_hits'] += 1
+            self._stats['bytes_saved'] += size
+            self._remember(key, shape, size)
+            return shape
+
+        self._stats['misses'] += 1
+        shape = build()
+        self._remember(key, shape, self._write(key, shape))
+        return shape
+
+    def take_stats(self) -> Dict[str, int]:
+        """Counters since the previous call, for the worker to report with each job"""
+        stats, self._stats = self._stats, self.empty_stats()
+        return stats
+
+    def _remember(self, key: str, shape, size: int) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (shape, size)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[Tuple[Any, int]]:
+        import cadquery as cq
+        from OCP.BinTools import BinTools
+        from OCP.TopoDS import TopoDS_Shape
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                wrapped = TopoDS_Shape()
+                BinTools.Read_s(wrapped, data)
+                size = len(data)
+            # Keeps the directory in LRU order for every process trimming it
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Truncated or written by another engine version's format; rebuild it
+            logger.warning("Shape cache: unreadable entry", extra={'shape_key': key, 'error': str(e)})
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return cq.Shape.cast(wrapped), size
+
+    def _write(self, key: str, shape) -> int:
+        """Persist a freshly built shape; returns its serialized size (0 if it was not stored)"""
+        from OCP.BinTools import BinTools
+
+        stream = io.BytesIO()
+        tmp_path = None
+        try:
+            BinTools.Write_s(shape.wrapped, stream)
+            data = stream.getvalue()
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Write to a temp file first so other processes never map a truncated entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except Exception as e:
+            logger.warning("Shape cache: failed to persist shape", extra={'shape_key': key, 'error': str(e)})
+            # Trimming only looks at finished entries, so a partial write would stay forever
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return 0
+        self._stats['stores'] += 1
+        self._written += len(data)
+        if self._written >= self.disk_bytes // TRIM_FRACTION:
+            self._trim_disk()
+        return len(data)
+
+    def _trim_disk(self) -> None:
+        """Evict the least recently used files until the shared directory fits its limit"""
+        self._written = 0
+        entries = []
+        try:
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith('.brep') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self._stats['disk_evictions'] += 1
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,55 @@
+"""
+Startup timing for CADAgent PRO
+Records how long after the process was launched each startup phase was reached (imports done,
+port bound, first request served, CadQuery warm), so time-to-first-request can be measured
+from the logs, /ready and /metrics. A forked server worker inherits the phases its master
+reached, so its report still counts from the master's launch.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def process_started() -> float:
+    """time.monotonic() value at which this process was launched, read from /proc where available"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name; starttime is field 22 of the whole line
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.monotonic() - (uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+class StartupTimer:
+    """Seconds from process launch to the first time each named phase was reached"""
+
+    def __init__(self):
+        self.started = process_started()
+        self._lock = threading.Lock()
+        self._phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> bool:
+        """Record a phase once, logging how long it took to reach; False if it was already recorded"""
+        with self._lock:
+            if phase in self._phases:
+                return False
+            seconds = round(time.monotonic() - self.started, 3)
+            self._phases[phase] = seconds
+        logger.info("Startup phase reached", extra={'phase': phase, 'seconds': seconds, 'worker_pid': os.getpid()})
+        return True
+
+    def reached(self, phase: str) -> bool:
+        return phase in self._phases
+
+    def phases(self) -> Dict[str, float]:
+        """Phase -> seconds since launch, in the order they were reached"""
+        with self._lock:
+            return dict(self._phases)
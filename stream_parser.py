@@ -0,0 +1,117 @@
+"""
+Incremental parser for streamed pipeline responses
+Emits the JSON_PLAN as soon as its braces balance and the PYTHON_CODE as soon as
+its closing fence arrives, without waiting for the rest of the completion
+"""
+
+import json
+import logging
+import re
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PLAN_MARKER = re.compile(r'JSON_PLAN:', re.IGNORECASE)
+CODE_MARKER = re.compile(r'PYTHON_CODE:\s*```python[^\n]*\n', re.IGNORECASE)
+CLOSING_FENCE = '```'
+
+# Markers can straddle chunk boundaries, so each search re-reads this many trailing characters
+MARKER_OVERLAP = 64
+
+
+class StreamingPipelineParser:
+    """Consume response text chunk by chunk and report ('plan', dict) / ('code', str) events"""
+
+    def __init__(self):
+        self.text = ''
+        self.json_plan: Optional[dict] = None
+        self.python_code: Optional[str] = None
+
+        self._plan_search_from = 0
+        self._plan_start: Optional[int] = None
+        self._plan_scan_pos = 0
+        self._plan_depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._plan_failed = False
+
+        self._code_search_from = 0
+        self._code_start: Optional[int] = None
+        self._fence_search_from = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Append a chunk and return any sections that became complete"""
+        self.text += chunk
+        events = []
+
+        if self.json_plan is None and not self._plan_failed:
+            plan = self._scan_plan()
+            if plan is not None:
+                self.json_plan = plan
+                events.append(('plan', plan))
+
+        if self.python_code is None:
+            code = self._scan_code()
+            if code is not None:
+                self.python_code = code
+                events.append(('code', code))
+
+        return events
+
+    def _scan_plan(self) -> Optional[dict]:
+        text = self.text
+        if self._plan_start is None:
+            marker = PLAN_MARKER.search(text, self._plan_search_from)
+            if not marker:
+                self._plan_search_from = max(0, len(text) - MARKER_OVERLAP)
+                return None
+            brace = text.find('{', marker.end())
+            if brace == -1:
+                self._plan_search_from = marker.start()
+                return None
+            self._plan_start = brace
+            self._plan_scan_pos = brace
+
+        # Track brace depth outside of JSON strings, resuming where the last chunk stopped
+        for pos in range(self._plan_scan_pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._plan_depth += 1
+            elif char == '}':
+                self._plan_depth -= 1
+                if self._plan_depth == 0:
+                    try:
+                        return json.loads(text[self._plan_start:pos + 1])
+                    except json.JSONDecodeError as e:
+                        # Leave it to the full-text parser once the stream ends
+                        logger.info("Failed to parse streamed JSON plan", extra={'error': str(e)})
+                        self._plan_failed = True
+                        return None
+
+        self._plan_scan_pos = len(text)
+        return None
+
+    def _scan_code(self) -> Optional[str]:
+        text = self.text
+        if self._code_start is None:
+            marker = CODE_MARKER.search(text, self._code_search_from)
+            if not marker:
+                self._code_search_from = max(0, len(text) - MARKER_OVERLAP)
+                return None
+            self._code_start = marker.end()
+            self._fence_search_from = marker.end()
+
+        fence = text.find(CLOSING_FENCE, self._fence_search_from)
+        if fence == -1:
+            self._fence_search_from = max(self._code_start, len(text) - len(CLOSING_FENCE))
+            return None
+        return text[self._code_start:fence].strip()
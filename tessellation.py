@@ -0,0 +1,109 @@
+"""
+Server-controlled tessellation for CADAgent PRO
+Chooses mesh tolerances from the exported shape's size and a per-quality-tier
+triangle budget instead of trusting whatever the generated script asked for
+"""
+
+import os
+from typing import Dict, Any
+
+from gltf_utils import unpack_glb
+from instancing import instance_repeats
+
+DEFAULT_QUALITY = 'standard'
+
+# Linear tolerance is relative to the bounding box diagonal; the budget caps triangles per model.
+# Quantized tiers ship int16 positions and int8 normals (KHR_mesh_quantization).
+QUALITY_TIERS = {
+    'draft': {
+        'triangle_budget': int(os.environ.get('TESSELLATION_BUDGET_DRAFT', 20000)),
+        'relative_tolerance': 0.004,
+        'angular_tolerance': 0.5,
+        'quantize': True,
+    },
+    'standard': {
+        'triangle_budget': int(os.environ.get('TESSELLATION_BUDGET_STANDARD', 100000)),
+        'relative_tolerance': 0.001,
+        'angular_tolerance': 0.25,
+        'quantize': False,
+    },
+    'fine': {
+        'triangle_budget': int(os.environ.get('TESSELLATION_BUDGET_FINE', 400000)),
+        'relative_tolerance': 0.0003,
+        'angular_tolerance': 0.1,
+        'quantize': False,
+    },
+}
+
+MIN_LINEAR_TOLERANCE = 0.001  # mm
+MAX_ANGULAR_TOLERANCE = 1.0  # rad
+MAX_MESH_ATTEMPTS = 4
+
+
+def resolve_quality(quality) -> str:
+    """Validate a client-supplied quality tier, defaulting when none is given"""
+    if quality is None or quality == '':
+        return DEFAULT_QUALITY
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality '{quality}', expected one of: {', '.join(QUALITY_TIERS)}")
+    return quality
+
+
+def count_triangles(glb: bytes) -> int:
+    """Number of triangles across all indexed triangle primitives in a GLB"""
+    gltf_json, _ = unpack_glb(glb)
+    accessors = gltf_json.get('accessors', [])
+    triangles = 0
+    for mesh in gltf_json.get('meshes', []):
+        for primitive in mesh.get('primitives', []):
+            if primitive.get('mode', 4) != 4:
+                continue
+            if 'indices' in primitive:
+                triangles += accessors[primitive['indices']]['count'] // 3
+            elif 'POSITION' in primitive.get('attributes', {}):
+                triangles += accessors[primitive['attributes']['POSITION']]['count'] // 3
+    return triangles
+
+
+def export_assembly(assembly, glb_path: str, quality: str) -> Dict[str, Any]:
+    """
+    Tessellate and export an assembly as GLB within the quality tier's triangle budget.
+    Tolerances start relative to the bounding box and are coarsened until the budget holds.
+    Rigid copies of a solid are first turned into placements of one prototype, so each set
+    is triangulated and stored once.
+    """
+    from OCP.BRepTools import BRepTools
+
+    instancing = instance_repeats(assembly)
+    tier = QUALITY_TIERS[quality]
+    compound = assembly.toCompound()
+    diagonal = compound.BoundingBox().DiagonalLength
+    linear_tolerance = max(MIN_LINEAR_TOLERANCE, diagonal * tier['relative_tolerance'])
+    angular_tolerance = tier['angular_tolerance']
+    budget = tier['triangle_budget']
+
+    for attempt in range(1, MAX_MESH_ATTEMPTS + 1):
+        assembly.export(glb_path, 'GLTF', tolerance=linear_tolerance, angularTolerance=angular_tolerance)
+        with open(glb_path, 'rb') as f:
+            glb = f.read()
+        triangles = count_triangles(glb)
+
+        if triangles <= budget or attempt == MAX_MESH_ATTEMPTS:
+            break
+
+        # Triangle count scales roughly inversely with the chord deviation
+        linear_tolerance *= max(2.0, 1.25 * triangles / budget)
+        angular_tolerance = min(MAX_ANGULAR_TOLERANCE, angular_tolerance * 1.5)
+        # Existing finer triangulation would otherwise be reused as-is
+        BRepTools.Clean_s(compound.wrapped)
+
+    return {
+        'quality': quality,
+        'triangles': triangles,
+        'triangle_budget': budget,
+        'linear_tolerance': linear_tolerance,
+        'angular_tolerance': angular_tolerance,
+        'bounding_diagonal': diagonal,
+        'attempts': attempt,
+        'instancing': instancing,
+    }
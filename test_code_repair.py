@@ -0,0 +1,49 @@
+"""
+Tests for the pre-flight check of generated CadQuery scripts
+"""
+
+import pytest
+
+from code_repair import PreflightError, preflight_check
+
+
+@pytest.mark.parametrize('python_code', [
+    "result = cq.Workplane('XY').box(10, 10, 10)\n",
+    # Fillet fallback: the usual way generated scripts guard a fragile operation
+    "body = cq.Workplane('XY').box(10, 10, 10)\n"
+    "try:\n"
+    "    result = body.edges('|Z').fillet(2)\n"
+    "except Exception:\n"
+    "    result = body\n",
+    "if True:\n"
+    "    result = cq.Workplane('XY').sphere(5)\n",
+    "result, other = cq.Workplane('XY').box(1, 2, 3), None\n",
+    "def build():\n"
+    "    global result\n"
+    "    result = cq.Workplane('XY').box(1, 2, 3)\n"
+    "build()\n",
+    "for size in (1, 2, 3):\n"
+    "    assembly = cq.Assembly()\n",
+    "cq.Assembly().add(cq.Workplane('XY').box(1, 1, 1)).save('output.gltf')\n",
+])
+def test_preflight_accepts_scripts_that_produce_a_model(python_code):
+    preflight_check(python_code)
+
+
+def test_preflight_knows_the_names_exec_provides():
+    preflight_check("print(__builtins__, __name__, math.pi)\nresult = cq.Workplane('XY').box(1, 1, 1)\n")
+
+
+@pytest.mark.parametrize('python_code, error', [
+    ("result = cq.Workplane('XY').box(1, 1\n", 'SyntaxError'),
+    ("import not_a_real_module_xyz\nresult = None\n", "ModuleNotFoundError: No module named 'not_a_real_module_xyz'"),
+    ("result = cq.Workplane('XY').box(width, 1, 1)\n", "NameError: name 'width' is not defined (line 1"),
+    ("shape = cq.Workplane('XY').box(1, 1, 1)\n", 'Script produces no model'),
+    # The worker serves only a captured assembly or a GLTF file, so STL and STEP files are no model
+    ("cq.Workplane('XY').box(1, 1, 1).val().exportStl('output.stl')\n", 'Script produces no model'),
+    ("cq.Workplane('XY').box(1, 1, 1).val().exportStep('output.step')\n", 'Script produces no model'),
+    ("shape = cq.Workplane('XY').box(1, 1, 1)\nprint(result)\n", "NameError: name 'result' is not defined"),
+])
+def test_preflight_rejects_scripts_certain_to_fail(python_code, error):
+    with pytest.raises(PreflightError, match=error.replace('(', r'\(')):
+        preflight_check(python_code)
@@ -0,0 +1,107 @@
+"""
+Tests for the near-duplicate prompt index: abstraction of prompt dimensions and their
+substitution into a stored plan and script
+"""
+
+from prompt_index import PromptIndex, abstract_prompt, substitute_dimensions
+
+PLATE_PLAN = {'objects': [{'name': 'plate', 'type': 'Box', 'params': {'width': 60, 'depth': 40, 'height': 5}}]}
+PLATE_CODE = "import cadquery as cq\nresult = cq.Workplane('XY').box(60, 40, 5)\n"
+
+
+def test_abstract_prompt_replaces_numbers_with_unit_placeholders():
+    tokens, dimensions = abstract_prompt('A 40mm gear with 20 teeth and a 5.5 mm bore')
+    assert tokens == ['#mm', 'gear', '#', 'teeth', '#mm', 'bore']
+    assert dimensions == [40.0, 20.0, 5.5]
+
+
+def test_abstract_prompt_splits_dimensions_joined_by_x():
+    for prompt, expected in [
+        ('a 60x40mm plate, 5mm thick', [60.0, 40.0, 5.0]),
+        ('a 2x4 board', [2.0, 4.0]),
+        ('60 x 40 x 3mm', [60.0, 40.0, 3.0]),
+        ('60mmx40mm', [60.0, 40.0]),
+        ('a 3 × 4 grid', [3.0, 4.0]),
+        ('a 10*20*30 box', [10.0, 20.0, 30.0]),
+    ]:
+        assert abstract_prompt(prompt)[1] == expected, prompt
+
+
+def test_abstract_prompt_gives_same_wording_for_different_dimensions():
+    assert abstract_prompt('a 60x40mm plate')[0] == abstract_prompt('a 100x80mm plate')[0]
+
+
+def test_abstract_prompt_leaves_numbers_inside_words():
+    assert abstract_prompt('the 2nd bracket')[1] == []
+
+
+def test_substitute_dimensions_rewrites_plan_and_code():
+    json_plan, python_code = substitute_dimensions(PLATE_PLAN, PLATE_CODE, [60.0, 40.0, 5.0], [100.0, 80.0, 5.0])
+    assert json_plan['objects'][0]['params'] == {'width': 100, 'depth': 80, 'height': 5}
+    assert 'box(100, 80, 5)' in python_code
+    # The stored plan is left as it was
+    assert PLATE_PLAN['objects'][0]['params']['width'] == 60
+
+
+def test_substitute_dimensions_keeps_sign_type_and_derived_radius():
+    json_plan = {'objects': [{'name': 'rod', 'type': 'Cylinder', 'params': {'radius': 10, 'height': 30.0}}],
+                 'operations': [{'action': 'translate', 'target': 'rod', 'vector': [-30, 0, 0]}]}
+    python_code = "result = cq.Workplane().cylinder(30.0, 10).translate((-30, 0, 0))\n"
+    # A 20mm diameter becomes a 10mm radius in the plan
+    json_plan, python_code = substitute_dimensions(json_plan, python_code, [20.0, 30.0], [40.0, 50.0])
+    assert json_plan['objects'][0]['params'] == {'radius': 20, 'height': 50.0}
+    assert json_plan['operations'][0]['vector'] == [-50, 0, 0]
+    assert python_code == "result = cq.Workplane().cylinder(50.0, 20).translate((-50, 0, 0))\n"
+
+
+def test_substitute_dimensions_refuses_ambiguous_or_missing_values():
+    # Two dimensions of 60 cannot become two different values
+    assert substitute_dimensions(PLATE_PLAN, PLATE_CODE, [60.0, 60.0], [70.0, 80.0]) is None
+    # A changed 1 is more likely a count or a unit vector than a dimension
+    assert substitute_dimensions(PLATE_PLAN, PLATE_CODE, [1.0, 60.0], [2.0, 60.0]) is None
+    # A changed dimension that the plan does not contain
+    assert substitute_dimensions(PLATE_PLAN, PLATE_CODE, [75.0], [90.0]) is None
+    assert substitute_dimensions(PLATE_PLAN, PLATE_CODE, [60.0], [70.0, 80.0]) is None
+
+
+def test_lookup_substitutes_every_dimension_of_an_x_separated_size():
+    index = PromptIndex(max_entries=8, max_bytes=1 << 20, reuse_similarity=0.95, hint_similarity=0.5)
+    index.add('a 60x40mm plate, 5mm thick', PLATE_PLAN, PLATE_CODE)
+    match = index.lookup('a 100x80mm plate, 5mm thick')
+    assert match['reuse']
+    assert match['jsonPlan']['objects'][0]['params'] == {'width': 100, 'depth': 80, 'height': 5}
+    assert 'box(100, 80, 5)' in match['pythonCode']
+
+
+def test_lookup_does_not_reuse_when_a_number_was_not_abstracted():
+    index = PromptIndex(max_entries=8, max_bytes=1 << 20, reuse_similarity=0.95, hint_similarity=0.5)
+    # "4x" is a count the pattern leaves in the wording, so the two prompts abstract alike
+    index.add('4x m8 bolts on a 60mm plate', PLATE_PLAN, PLATE_CODE)
+    match = index.lookup('6x m8 bolts on a 60mm plate')
+    assert match is not None and not match['reuse']
+
+
+def test_lookup_does_not_map_a_derived_one_into_transforms_and_axes():
+    # 2mm becoming 4mm would also turn its half, 1, into 2: identity entries and unit axes
+    json_plan = {'objects': [{'name': 'plate', 'type': 'Box', 'params': {'width': 60, 'depth': 60, 'height': 2},
+                              'transform': [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]}],
+                 'operations': [{'action': 'rotate', 'target': 'plate', 'axis': [0, 0, 1], 'angle': 45}]}
+    python_code = "result = cq.Workplane('XY').box(60, 60, 2).rotate((0, 0, 0), (0, 0, 1), 45)\n"
+    index = PromptIndex(max_entries=8, max_bytes=1 << 20, reuse_similarity=0.95, hint_similarity=0.5)
+    index.add('a 60mm square plate 2mm thick', json_plan, python_code)
+    match = index.lookup('a 60mm square plate 4mm thick')
+    assert match is not None and not match['reuse']
+    assert match['jsonPlan'] == json_plan
+
+
+def test_substitute_dimensions_leaves_transforms_and_axes_alone():
+    json_plan = {'objects': [{'name': 'disc', 'type': 'Cylinder', 'params': {'radius': 10, 'height': 5},
+                              'transform': [[1, 0, 0, 10], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]}],
+                 'operations': [{'action': 'rotate', 'target': 'disc', 'center': [10, 0, 0], 'axis': [0, 0, 1], 'angle': 45},
+                                {'action': 'translate', 'target': 'disc', 'vector': [0, 0, 5]}]}
+    json_plan, _ = substitute_dimensions(json_plan, '', [20.0, 5.0], [30.0, 8.0])
+    assert json_plan['objects'][0]['params'] == {'radius': 15, 'height': 8}
+    assert json_plan['objects'][0]['transform'][0] == [1, 0, 0, 10]
+    assert json_plan['operations'][0]['center'] == [10, 0, 0]
+    assert json_plan['operations'][0]['angle'] == 45
+    assert json_plan['operations'][1]['vector'] == [0, 0, 8]
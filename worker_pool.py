@@ -0,0 +1,822 @@
+"""
+CadQuery worker pool for CADAgent PRO
+Long-lived worker processes that import cadquery/OCP once and execute scripts
+(or compile jsonPlans) sent to them over a queue, each job in its own working directory
+and under wall-clock, CPU and memory limits
+"""
+
+import contextvars
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import resource
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from gltf_utils import gltf_file_to_glb
+from logs import configure_logging, current_request_id, debug_payload, request_id_var
+from mesh_optimize import optimize_glb
+from plan_builder import assemble, evaluate_plan
+from shape_cache import ShapeCache
+from tessellation import DEFAULT_QUALITY, QUALITY_TIERS, export_assembly
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds past a wall-clock or CPU limit before the parent kills a worker stuck in native
+# code, where the limit raised inside the worker cannot interrupt it
+JOB_LIMIT_GRACE_SECONDS = float(os.environ.get('CADQUERY_JOB_LIMIT_GRACE_SECONDS', 2))
+# How often the parent checks running jobs against their limits
+LIMIT_CHECK_INTERVAL = 0.25
+
+# Imported once by the forkserver, so every worker it forks starts with them loaded; one that
+# fails to import is skipped there and reported by the workers instead
+FORKSERVER_PRELOAD = ['worker_pool', 'cadquery']
+
+# Plan objects built by any worker, reused across requests; each worker process has its own
+# live-shape LRU over the shared directory
+shape_cache = ShapeCache.from_env()
+
+
+class WorkerCrashedError(Exception):
+    """Raised for a job whose worker process died before reporting a result"""
+
+
+class JobLimitExceededError(Exception):
+    """Raised for a job stopped for passing its wall-clock, CPU or memory limit"""
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+class JobLimitSignal(BaseException):
+    """Raised inside a worker when its job passes a limit; not an Exception, so scripts cannot swallow it"""
+
+    def __init__(self, limit: str):
+        super().__init__(limit)
+        self.limit = limit
+
+
+class JobLimits:
+    """
+    Resource limits for a CadQuery job: wall-clock seconds, CPU seconds and the memory
+    (address space and RSS) it may add to its worker. None means unlimited.
+    """
+
+    def __init__(self, name: str, wall_seconds: Optional[float], cpu_seconds: Optional[float],
+                 memory_bytes: Optional[int]):
+        self.name = name
+        self.wall_seconds = wall_seconds
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+
+    @classmethod
+    def from_env(cls, name: str = 'default') -> 'JobLimits':
+        """
+        Build limits from CADQUERY_JOB_* environment variables, overridden by CADQUERY_<NAME>_*
+        ones for a named set (e.g. CADQUERY_EXECUTE_TIMEOUT_SECONDS); 0 disables a limit
+        """
+        def setting(suffix: str, default: float) -> Optional[float]:
+            value = os.environ.get(f'CADQUERY_JOB_{suffix}', default)
+            if name != 'default':
+                value = os.environ.get(f'CADQUERY_{name.upper()}_{suffix}', value)
+            return float(value) or None
+
+        memory_mb = setting('MEMORY_MB', 256)
+        return cls(
+            name=name,
+            wall_seconds=setting('TIMEOUT_SECONDS', 30),
+            cpu_seconds=setting('CPU_SECONDS', 20),
+            memory_bytes=int(memory_mb * 1024 * 1024) if memory_mb else None,
+        )
+
+    def describe(self, limit: str) -> str:
+        """Error message for a job stopped at the given limit"""
+        if limit == 'wall_clock':
+            return f"CadQuery job exceeded its {self.wall_seconds:g}s time limit and was stopped"
+        if limit == 'cpu':
+            return f"CadQuery job exceeded its {self.cpu_seconds:g}s CPU time limit and was stopped"
+        return f"CadQuery job exceeded its {self.memory_bytes // (1024 * 1024)} MB memory limit and was stopped"
+
+
+# Limits for the CadQuery jobs the current request submits; None uses the pool's defaults
+job_limits_var: contextvars.ContextVar[Optional[JobLimits]] = contextvars.ContextVar('job_limits', default=None)
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of the current process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak RSS is the best portable approximation (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process (all threads), or 0 if it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # The command name may contain spaces; utime and stime are fields 14 and 15
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def process_rss_bytes(pid: int) -> int:
+    """Resident set size of a process, or 0 if it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def address_space_bytes() -> int:
+    """Virtual memory size of the current process, or 0 if it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def private_memory_bytes() -> int:
+    """
+    Memory this process does not share with any other, i.e. what recycling it would free.
+    Pages inherited copy-on-write from a warm parent count only once they are written to.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return (int(fields['Private_Clean'].split()[0]) + int(fields['Private_Dirty'].split()[0])) * 1024
+    except (OSError, KeyError, ValueError, IndexError):
+        return current_rss_bytes()
+
+
+def find_export_target(cq, captured, exec_globals):
+    """Pick the assembly the script meant to export, wrapping a bare result if needed"""
+    if captured:
+        return captured[-1]
+    assembly = exec_globals.get('assembly')
+    if isinstance(assembly, cq.Assembly):
+        return assembly
+    result = exec_globals.get('result')
+    if isinstance(result, (cq.Workplane, cq.Shape)):
+        assembly = cq.Assembly()
+        assembly.add(result, name='part')
+        return assembly
+    return None
+
+
+def script_error(e: Exception, python_code: str) -> str:
+    """
+    Exception type and message with the script line it was raised from: the traceback trimmed
+    to the script's own frames, which is what a repair needs, rather than CadQuery's internals
+    """
+    line = e.lineno if isinstance(e, SyntaxError) else None
+    for frame in traceback.extract_tb(e.__traceback__):
+        # exec() runs the script under the filename '<string>'
+        if frame.filename == '<string>':
+            line = frame.lineno
+    lines = python_code.splitlines()
+    location = f" (line {line}: {lines[line - 1].strip()})" if line and 0 < line <= len(lines) else ''
+    return f"{type(e).__name__}: {e}{location}"
+
+
+def run_script(cq, python_code: str, output_path: str, quality: str) -> Dict[str, Any]:
+    """
+    Execute CadQuery code in a fresh working directory and write the model to output_path as GLB.
+    Assembly.save/export calls made by the script are captured rather than performed, so the
+    server controls tessellation through the requested quality tier.
+    """
+    logger.info("CadQuery execution started", extra={'code_chars': len(python_code)})
+    debug_payload(logger, "CadQuery script", python_code=python_code)
+
+    try:
+        # Each worker runs one job at a time, so changing directory cannot race another job
+        with tempfile.TemporaryDirectory() as temp_dir:
+            logger.debug("Created temp directory", extra={'temp_dir': temp_dir})
+
+            original_cwd = os.getcwd()
+            os.chdir(temp_dir)
+
+            try:
+                # Prepare safe execution environment
+                exec_globals = {
+                    'cq': cq,
+                    '__name__': '__main__',
+                    '__file__': 'model.py',
+                    'os': os,  # Limited os access
+                    'tempfile': tempfile,
+                    'show_object': lambda x: None,  # Dummy function for CQ-editor compatibility
+                    'math': __import__('math')  # Include math module
+                }
+
+                # Execute the Python code with the script's own export calls captured
+                captured = []
+                original_save, original_export = cq.Assembly.save, cq.Assembly.export
+
+                def capture_export(assembly, *args, **kwargs):
+                    captured.append(assembly)
+                    return assembly
+
+                cq.Assembly.save = cq.Assembly.export = capture_export
+                try:
+                    exec(python_code, exec_globals)
+                finally:
+                    cq.Assembly.save, cq.Assembly.export = original_save, original_export
+                logger.debug("Python code executed successfully")
+
+                target = find_export_target(cq, captured, exec_globals)
+                if target is not None:
+                    glb_path = os.path.join(temp_dir, 'server_export.glb')
+                    export_info = export_assembly(target, glb_path, quality)
+                    logger.info("Tessellated model", extra={
+                        'quality': quality, 'triangles': export_info['triangles'],
+                        'linear_tolerance_mm': round(export_info['linear_tolerance'], 4),
+                        'tessellation_attempts': export_info['attempts'],
+                        'instanced_solids': export_info['instancing']['instances'],
+                    })
+                else:
+                    # Script wrote its model some other way, use the file as-is
+                    model_files = [f for f in os.listdir('.') if f.endswith(('.gltf', '.glb'))]
+                    logger.info("Model files found", extra={'model_files': model_files})
+                    if not model_files:
+                        raise FileNotFoundError("No GLTF file was generated. Make sure your code includes assembly.save('output.gltf')")
+                    glb_path = os.path.join(temp_dir, model_files[0])
+                    export_info = {'quality': None}
+
+                glb = gltf_file_to_glb(glb_path)
+            finally:
+                os.chdir(original_cwd)
+
+        return write_model(glb, output_path, export_info, quality)
+
+    except (ImportError, MemoryError):
+        raise
+    except Exception as e:
+        logger.warning("CadQuery execution failed", exc_info=True,
+                       extra={'error': str(e), 'error_type': type(e).__name__})
+        raise Exception(f"CadQuery execution failed: {script_error(e, python_code)}")
+
+
+class SerializedShapeMemo:
+    """Shape memo over pickled (BinTools) shapes from the parent, recording the shapes added by a job"""
+
+    def __init__(self, entries: Dict[str, bytes]):
+        self._entries = entries
+        self._shapes: Dict[str, Any] = {}
+        self.added: List[str] = []
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._shapes or key in self._entries
+
+    def __getitem__(self, key: str):
+        if key not in self._shapes:
+            self._shapes[key] = pickle.loads(self._entries[key])
+        return self._shapes[key]
+
+    def __setitem__(self, key: str, shape) -> None:
+        self._shapes[key] = shape
+        self.added.append(key)
+
+    def serialized_additions(self) -> Dict[str, bytes]:
+        return {key: pickle.dumps(self._shapes[key]) for key in self.added}
+
+
+def run_plan(cq, source: Dict[str, Any], output_path: str, quality: str) -> Dict[str, Any]:
+    """
+    Compile a jsonPlan straight into CadQuery geometry and write it to output_path as GLB.
+    When the source carries a shape memo, memoized nodes are reused and the newly built
+    ones are returned serialized for the next edit. Objects come from the shape cache.
+    """
+    json_plan = source['jsonPlan']
+    memo = SerializedShapeMemo(source.get('memo') or {})
+    shapes, nodes = evaluate_plan(cq, json_plan, memo, shape_cache)
+    assembly = assemble(cq, shapes)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        glb_path = os.path.join(temp_dir, 'plan_export.glb')
+        export_info = export_assembly(assembly, glb_path, quality)
+        logger.info("Built plan", extra={'quality': quality, 'nodes_built': nodes['built'],
+                                         'nodes_reused': nodes['reused'], 'triangles': export_info['triangles'],
+                                         'instanced_solids': export_info['instancing']['instances']})
+        with open(glb_path, 'rb') as f:
+            glb = f.read()
+
+    model_info = write_model(glb, output_path, export_info, quality)
+    model_info['nodes'] = nodes
+    model_info['shape_cache'] = shape_cache.take_stats()
+    if source.get('memo') is not None:
+        # Serialized after export so the shapes carry their triangulation into the next build
+        model_info['memo'] = memo.serialized_additions()
+    return model_info
+
+
+def write_model(glb: bytes, output_path: str, export_info: Dict[str, Any], quality: str) -> Dict[str, Any]:
+    """Post-process a GLB and write it to output_path atomically"""
+    glb, mesh_info = optimize_glb(glb, quantize=QUALITY_TIERS[quality]['quantize'])
+    if mesh_info['optimized']:
+        logger.info("Optimized mesh", extra={key: mesh_info[key] for key in (
+            'vertices_before', 'vertices_after', 'meshes_before', 'meshes_after', 'bytes_before', 'bytes_after', 'quantized')})
+
+    # Atomic rename so the server never serves a partially written model
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(glb)
+        os.replace(tmp_path, output_path)
+    except OSError:
+        # A worker killed mid-write leaves it too; the model cache sweeps those up when it trims
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    logger.info("Wrote GLB model", extra={'output_path': output_path, 'bytes': len(glb)})
+    return dict(export_info, bytes=len(glb), mesh=mesh_info)
+
+
+JOB_RUNNERS = {
+    'code': run_script,
+    'plan': run_plan,
+}
+
+
+@contextmanager
+def job_limits(limits: JobLimits) -> Iterator[None]:
+    """
+    Arm a job's limits inside the worker: SIGALRM for wall-clock time, RLIMIT_CPU (SIGXCPU)
+    for CPU time and RLIMIT_AS for memory, each relative to what the worker has already used.
+    Passing a time limit raises JobLimitSignal at the next Python instruction; passing the
+    memory limit makes allocations fail with MemoryError.
+    """
+    cpu_limits = resource.getrlimit(resource.RLIMIT_CPU)
+    memory_limits = resource.getrlimit(resource.RLIMIT_AS)
+    try:
+        if limits.wall_seconds:
+            signal.setitimer(signal.ITIMER_REAL, limits.wall_seconds)
+        if limits.cpu_seconds:
+            used = sum(os.times()[:2])
+            resource.setrlimit(resource.RLIMIT_CPU, (capped(math.ceil(used + limits.cpu_seconds), cpu_limits[1]),
+                                                     cpu_limits[1]))
+        if limits.memory_bytes and address_space_bytes():
+            resource.setrlimit(resource.RLIMIT_AS, (capped(address_space_bytes() + limits.memory_bytes, memory_limits[1]),
+                                                    memory_limits[1]))
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        resource.setrlimit(resource.RLIMIT_CPU, cpu_limits)
+        resource.setrlimit(resource.RLIMIT_AS, memory_limits)
+
+
+def capped(value: int, hard_limit: int) -> int:
+    """A soft resource limit no higher than the hard one"""
+    return value if hard_limit == resource.RLIM_INFINITY else min(value, hard_limit)
+
+
+def raise_job_limit(limit: str):
+    """Signal handler raising JobLimitSignal for the given limit"""
+    def handler(signum, frame):
+        raise JobLimitSignal(limit)
+    return handler
+
+
+def _worker_main(task_queue, result_queue, current_job, job_usage, max_jobs: int, max_rss_bytes: int) -> None:
+    """Worker process loop: import CadQuery once, then serve jobs until recycled"""
+    configure_logging()
+    signal.signal(signal.SIGALRM, raise_job_limit('wall_clock'))
+    signal.signal(signal.SIGXCPU, raise_job_limit('cpu'))
+    try:
+        _serve_jobs(task_queue, result_queue, current_job, job_usage, max_jobs, max_rss_bytes)
+    finally:
+        # Worker processes exit without running atexit handlers; flush queued log records first
+        logging.shutdown()
+
+
+def _serve_jobs(task_queue, result_queue, current_job, job_usage, max_jobs: int, max_rss_bytes: int) -> None:
+    pid = os.getpid()
+    try:
+        import cadquery as cq
+        import_error = None
+    except Exception as e:
+        # Jobs then fail with ImportError, which the server answers with a placeholder model
+        cq = None
+        import_error = f"{type(e).__name__}: {e}"
+        result_queue.put(('unavailable', None, pid, import_error))
+    else:
+        result_queue.put(('ready', None, pid))
+
+    jobs_done = 0
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+
+        # Written to shared memory synchronously so the parent can attribute a hard crash and
+        # measure the job's usage against its limits: start time, CPU seconds and RSS so far
+        job_id, kind, source, output_path, quality, request_id, limits = task
+        job_usage[:] = [time.monotonic(), sum(os.times()[:2]), process_rss_bytes(pid)]
+        current_job.value = job_id
+        request_id_var.set(request_id)
+
+        limit = None
+        try:
+            if cq is None:
+                raise ImportError(import_error)
+            with job_limits(limits):
+                model_info = JOB_RUNNERS[kind](cq, source, output_path, quality)
+            result_queue.put(('done', job_id, model_info))
+        except JobLimitSignal as e:
+            limit = e.limit
+        except MemoryError as e:
+            if limits.memory_bytes:
+                limit = 'memory'
+            else:
+                result_queue.put(('error', job_id, type(e).__name__, str(e)))
+        except ImportError as e:
+            result_queue.put(('error', job_id, 'ImportError', str(e)))
+        except Exception as e:
+            result_queue.put(('error', job_id, type(e).__name__, str(e)))
+        if limit:
+            logger.warning("CadQuery job stopped at its limit", extra={'limit': limit, 'limits': limits.name})
+            result_queue.put(('limit', job_id, limit, limits.describe(limit)))
+        current_job.value = 0
+
+        jobs_done += 1
+        # Private memory, so pages shared with the warm parent do not count against the worker.
+        # A job interrupted by a limit may have left OCC in any state, so its worker is replaced.
+        private = private_memory_bytes()
+        if jobs_done >= max_jobs or private >= max_rss_bytes or limit:
+            logger.info("CadQuery worker retiring", extra={'worker_pid': pid, 'jobs_done': jobs_done,
+                                                           'private_mb': private // (1024 * 1024)})
+            result_queue.put(('retired', None, pid))
+            return
+
+
+class CadQueryWorkerPool:
+    """
+    Pool of pre-warmed CadQuery worker processes fed from a shared job queue.
+    Workers are recycled after max_jobs jobs or once their private memory passes max_rss_bytes,
+    and replaced if they die. Each job runs under the JobLimits of the request that submitted
+    it (job_limits_var) or the pool's defaults; a worker that cannot stop its own job in time
+    is killed.
+    """
+
+    def __init__(self, size: int, max_jobs: int, max_rss_bytes: int, default_limits: Optional[JobLimits] = None):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self.max_rss_bytes = max_rss_bytes
+        self.default_limits = default_limits or JobLimits('default', None, None, None)
+
+        # A forkserver preloaded with cadquery forks workers from a warm, single-threaded parent.
+        # It is a fresh interpreter, so it inherits neither the server's sockets nor its threads.
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+            multiprocessing.set_forkserver_preload(FORKSERVER_PRELOAD)
+        else:
+            self._context = multiprocessing.get_context('spawn')
+
+        self._lock = threading.Lock()
+        # Serializes start(), which must not hold self._lock while the first workers load OCP
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        # Set once a worker has imported cadquery; _warmed also once cadquery failed to load,
+        # with the reason in _startup_error
+        self._ready = threading.Event()
+        self._warmed = threading.Event()
+        self._startup_error: Optional[str] = None
+        self._task_queue = None
+        self._result_queue = None
+        self._workers: Dict[int, Any] = {}
+        self._current_jobs: Dict[int, Any] = {}
+        self._job_usage: Dict[int, Any] = {}
+        self._futures: Dict[int, Future] = {}
+        self._job_limits: Dict[int, JobLimits] = {}
+        # (limits name, limit) -> jobs stopped at that limit
+        self._limits_exceeded: Dict[Tuple[str, str], int] = {}
+        self._limits_checked = 0.0
+        self._settled: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        self._job_ids = itertools.count(1)
+        self._stats = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'recycled': 0, 'crashed': 0,
+            'mesh_bytes_before': 0, 'mesh_bytes_after': 0,
+        }
+        # Shape cache counters reported by the workers with each plan job
+        self._shape_cache_stats: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> 'CadQueryWorkerPool':
+        """Build the pool from CADQUERY_WORKER* environment variables"""
+        return cls(
+            size=int(os.environ.get('CADQUERY_WORKERS', os.cpu_count() or 1)),
+            max_jobs=int(os.environ.get('CADQUERY_WORKER_MAX_JOBS', 50)),
+            max_rss_bytes=int(os.environ.get('CADQUERY_WORKER_MAX_RSS_MB', 350)) * 1024 * 1024,
+            default_limits=JobLimits.from_env(),
+        )
+
+    def start(self) -> None:
+        """Start the worker processes and the result dispatcher (idempotent)"""
+        with self._start_lock:
+            with self._lock:
+                # A warm-up thread may only get here after the server has already shut the pool down
+                if self._started or self._closed:
+                    return
+                self._task_queue = self._context.Queue()
+                self._result_queue = self._context.Queue()
+            # The first worker starts the forkserver, which imports cadquery; stats() and so
+            # /metrics keep answering meanwhile
+            try:
+                workers = [self._start_worker() for _ in range(self.size)]
+            except Exception as e:
+                self._startup_failed(f"{type(e).__name__}: {e}")
+                raise
+            with self._lock:
+                for worker in workers:
+                    self._add_worker(*worker)
+                if self._closed:
+                    # Shut down while the workers were starting
+                    for _ in workers:
+                        self._task_queue.put(None)
+                    return
+                self._started = True
+
+        threading.Thread(target=self._dispatch_results, name='cadquery-pool-dispatch', daemon=True).start()
+        logger.info("CadQuery worker pool started", extra={'workers': self.size})
+
+    def is_ready(self) -> bool:
+        """Whether a worker has imported cadquery and can take a job without waiting for it"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until a worker has imported cadquery; False if it failed to or timeout passed first"""
+        self._warmed.wait(timeout)
+        return self._ready.is_set()
+
+    def startup_error(self) -> Optional[str]:
+        """Why the workers could not load cadquery, while none has"""
+        return None if self._ready.is_set() else self._startup_error
+
+    def submit(self, python_code: str, output_path: str, quality: str = DEFAULT_QUALITY) -> Future:
+        """Queue a script for execution; the future resolves to details of the GLB written to output_path"""
+        return self._submit('code', python_code, output_path, quality)
+
+    def submit_plan(self, json_plan: Dict[str, Any], output_path: str, quality: str = DEFAULT_QUALITY,
+                    memo: Optional[Dict[str, bytes]] = None) -> Future:
+        """
+        Queue a jsonPlan for compilation; the future resolves like submit(). Passing a memo of
+        serialized shapes (possibly empty) reuses its nodes and returns the new ones under 'memo'.
+        """
+        return self._submit('plan', {'jsonPlan': json_plan, 'memo': memo}, output_path, quality)
+
+    def _submit(self, kind: str, source: Any, output_path: str, quality: str) -> Future:
+        self.start()
+        future = Future()
+        limits = job_limits_var.get() or self.default_limits
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CadQuery worker pool is shut down")
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._job_limits[job_id] = limits
+            self._stats['submitted'] += 1
+        self._task_queue.put((job_id, kind, source, output_path, quality, current_request_id(), limits))
+        return future
+
+    def execute(self, python_code: str, output_path: str, quality: str = DEFAULT_QUALITY,
+                timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run a script on the pool and wait for its GLB"""
+        return self.submit(python_code, output_path, quality).result(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters and current occupancy"""
+        with self._lock:
+            busy = sum(1 for current_job in self._current_jobs.values() if current_job.value)
+            limits_exceeded: Dict[str, Dict[str, int]] = {}
+            for (name, limit), count in self._limits_exceeded.items():
+                limits_exceeded.setdefault(name, {})[limit] = count
+            return dict(
+                self._stats,
+                workers=len(self._workers),
+                ready=self._ready.is_set(),
+                startup_error=self.startup_error(),
+                busy=busy,
+                pending=max(0, len(self._futures) - busy),
+                limits_exceeded=limits_exceeded,
+            )
+
+    def shape_cache_stats(self) -> Dict[str, Any]:
+        """Shape cache lookups and bytes saved across all workers, with the settings they share"""
+        with self._lock:
+            stats = dict(ShapeCache.empty_stats(), **self._shape_cache_stats)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        return dict(
+            stats,
+            hit_ratio=(stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0,
+            disk_dir=shape_cache.disk_dir,
+            disk_limit_bytes=shape_cache.disk_bytes,
+            memory_limit_entries=shape_cache.memory_entries,
+        )
+
+    def limit_counts(self) -> Dict[Tuple[str, str], int]:
+        """Jobs stopped at a limit, by (limits name, limit)"""
+        with self._lock:
+            return dict(self._limits_exceeded)
+
+    def shutdown(self) -> None:
+        """Stop all workers, failing any jobs still outstanding"""
+        with self._lock:
+            if not self._started or self._closed:
+                self._closed = True
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+            for _ in workers:
+                self._task_queue.put(None)
+        for process in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            for future in self._futures.values():
+                self._settled.append((future, None, RuntimeError("CadQuery worker pool shut down")))
+            self._futures.clear()
+        self._settle()
+
+    def _spawn_worker(self) -> None:
+        # Caller holds self._lock; replacement workers fork from an already warm forkserver
+        self._add_worker(*self._start_worker())
+
+    def _start_worker(self) -> Tuple[Any, Any, Any]:
+        current_job = self._context.Value('q', 0, lock=False)
+        job_usage = self._context.Array('d', 3, lock=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._task_queue, self._result_queue, current_job, job_usage, self.max_jobs, self.max_rss_bytes),
+            name='cadquery-worker',
+            daemon=True,
+        )
+        process.start()
+        return process, current_job, job_usage
+
+    def _add_worker(self, process, current_job, job_usage) -> None:
+        # Caller holds self._lock
+        self._workers[process.pid] = process
+        self._current_jobs[process.pid] = current_job
+        self._job_usage[process.pid] = job_usage
+
+    def _dispatch_results(self) -> None:
+        while not self._closed:
+            if time.monotonic() - self._limits_checked >= LIMIT_CHECK_INTERVAL:
+                self._enforce_limits()
+            try:
+                message = self._result_queue.get(timeout=LIMIT_CHECK_INTERVAL)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                return
+            # Every iteration, so a steady stream of results cannot hide a dead worker's job
+            self._reap_dead_workers()
+            if message is None:
+                continue
+
+            kind, job_id = message[0], message[1]
+            with self._lock:
+                if kind == 'done':
+                    self._resolve(job_id, result=message[2])
+                elif kind == 'error':
+                    error_type, error_message = message[2], message[3]
+                    error_class = ImportError if error_type == 'ImportError' else Exception
+                    self._resolve(job_id, error=error_class(error_message))
+                elif kind == 'limit':
+                    self._record_limit(job_id, message[2])
+                    self._resolve(job_id, error=JobLimitExceededError(message[2], message[3]))
+                elif kind == 'ready':
+                    self._ready.set()
+                    self._warmed.set()
+                elif kind == 'unavailable':
+                    if self._startup_error is None and not self._ready.is_set():
+                        self._startup_failed(message[3])
+                elif kind == 'retired':
+                    process = self._workers.pop(message[2], None)
+                    self._current_jobs.pop(message[2], None)
+                    self._job_usage.pop(message[2], None)
+                    # None once _reap_dead_workers has already replaced it
+                    if process is not None:
+                        process.join(timeout=5)
+                        self._stats['recycled'] += 1
+                        if not self._closed:
+                            self._spawn_worker()
+            self._settle()
+
+    def _startup_failed(self, error: str) -> None:
+        logger.error("CadQuery workers cannot load cadquery; models will be placeholders", extra={'error': error})
+        self._startup_error = error
+        self._warmed.set()
+
+    def _resolve(self, job_id: int, result: Any = None, error: Optional[BaseException] = None) -> None:
+        # Caller holds self._lock; the future is completed by _settle() once the lock is released
+        future = self._futures.pop(job_id, None)
+        self._job_limits.pop(job_id, None)
+        if future is None:
+            return
+        self._settled.append((future, result, error))
+        if error is not None:
+            self._stats['failed'] += 1
+        else:
+            self._stats['completed'] += 1
+            mesh_info = result.get('mesh') if isinstance(result, dict) else None
+            if mesh_info:
+                self._stats['mesh_bytes_before'] += mesh_info['bytes_before']
+                self._stats['mesh_bytes_after'] += mesh_info['bytes_after']
+            shape_info = result.get('shape_cache') if isinstance(result, dict) else None
+            for name, count in (shape_info or {}).items():
+                self._shape_cache_stats[name] = self._shape_cache_stats.get(name, 0) + count
+
+    def _settle(self) -> None:
+        # Done callbacks may submit follow-up jobs, so they must run without self._lock held
+        with self._lock:
+            settled, self._settled = self._settled, []
+        for future, result, error in settled:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _record_limit(self, job_id: int, limit: str) -> None:
+        # Caller holds self._lock
+        limits = self._job_limits.get(job_id, self.default_limits)
+        key = (limits.name, limit)
+        self._limits_exceeded[key] = self._limits_exceeded.get(key, 0) + 1
+
+    def _enforce_limits(self) -> None:
+        """Kill workers whose job has overrun its limits without the worker stopping it"""
+        self._limits_checked = now = time.monotonic()
+        with self._lock:
+            for pid, process in list(self._workers.items()):
+                job_id = self._current_jobs[pid].value
+                limits = self._job_limits.get(job_id)
+                if not job_id or limits is None:
+                    continue
+                started, cpu_started, rss_started = self._job_usage[pid][:]
+
+                limit = None
+                if limits.wall_seconds and now - started > limits.wall_seconds + JOB_LIMIT_GRACE_SECONDS:
+                    limit = 'wall_clock'
+                elif limits.cpu_seconds and process_cpu_seconds(pid) - cpu_started > limits.cpu_seconds + JOB_LIMIT_GRACE_SECONDS:
+                    limit = 'cpu'
+                elif limits.memory_bytes and process_rss_bytes(pid) - rss_started > limits.memory_bytes:
+                    limit = 'memory'
+                if limit is None:
+                    continue
+
+                logger.warning("Killing CadQuery worker stuck past its job's limit",
+                               extra={'worker_pid': pid, 'limit': limit, 'limits': limits.name})
+                process.kill()
+                process.join(timeout=5)
+                del self._workers[pid]
+                del self._current_jobs[pid]
+                del self._job_usage[pid]
+                self._record_limit(job_id, limit)
+                self._resolve(job_id, error=JobLimitExceededError(limit, limits.describe(limit)))
+                if not self._closed:
+                    self._spawn_worker()
+        self._settle()
+
+    def _reap_dead_workers(self) -> None:
+        with self._lock:
+            for pid, process in list(self._workers.items()):
+                if process.is_alive():
+                    continue
+                del self._workers[pid]
+                self._job_usage.pop(pid, None)
+                job_id = self._current_jobs.pop(pid).value
+                if process.exitcode == 0 and not job_id:
+                    # Retired, and its 'retired' message is still queued behind other results
+                    self._stats['recycled'] += 1
+                else:
+                    self._stats['crashed'] += 1
+                    logger.error("CadQuery worker died, replacing it", extra={'worker_pid': pid, 'exitcode': process.exitcode})
+                    if job_id:
+                        self._resolve(job_id, error=WorkerCrashedError(
+                            f"CadQuery worker crashed (exit code {process.exitcode})"
+                        ))
+                if not self._closed:
+                    self._spawn_worker()
+        self._settle()